@@ -26,10 +26,15 @@ setup(
     author_email='rhh@crosscompute.com',
     url='https://github.com/invisibleroads/socketIO-client',
     install_requires=[
+        'futures; python_version < "3.2"',
         'requests>=2.7.0',
         'six',
         'websocket-client',
     ],
+    extras_require={
+        'msgpack': ['msgpack'],
+        'orjson': ['orjson'],
+    },
     tests_require=[
         'nose',
         'coverage',
@@ -1,16 +1,28 @@
 import atexit
-
-from .exceptions import ConnectionError, TimeoutError, PacketError
-from .heartbeats import HeartbeatThread
-from .logs import LoggingMixin
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from itertools import islice
+
+from .acks import AckRegistry
+from .codecs import JSONCodec
+from .compressions import CompressionStats
+from .dispatchers import PacketDispatcher
+from .exceptions import (
+    ConnectionError, NamespaceError, SendWindowFullError, TimeoutError,
+    PacketError)
+from .heartbeats import HEARTBEAT_SCHEDULER
+from .logs import LOG_BODY_SIZE, LoggingMixin
 from .namespaces import (
     EngineIONamespace, SocketIONamespace,
     LoggingSocketIONamespace, find_callback, make_logging_prefix)
+from .reconnects import ReconnectPolicy
+from .stats import get_stats, time_handler
+from .streams import StreamReader, StreamWriter
 from .parsers import (
     parse_host, parse_engineIO_session,
-    format_socketIO_packet_data, parse_socketIO_packet_data,
-    get_namespace_path)
-from .symmetries import get_character
+    deconstruct_binary_args, reconstruct_binary_args)
 from .transports import (
     WebsocketTransport, XHR_PollingTransport, prepare_http_session, TRANSPORTS)
 
@@ -26,6 +38,8 @@ def retry(f):
         self = args[0]
         try:
             return f(*args, **kw)
+        except SendWindowFullError:
+            raise
         except (TimeoutError, ConnectionError):
             self._opened = False
             return f(*args, **kw)
@@ -38,20 +52,51 @@ class EngineIO(LoggingMixin):
             self, host, port=None, Namespace=EngineIONamespace,
             wait_for_connection=True, transports=TRANSPORTS,
             resource='engine.io', hurry_interval_in_seconds=1, **kw):
+        self._configure(
+            host, port, wait_for_connection, transports, resource,
+            hurry_interval_in_seconds, kw)
+        atexit.register(self._close)
+
+        if Namespace:
+            self.define(Namespace)
+        self._transport
+
+    def _configure(
+            self, host, port, wait_for_connection, transports, resource,
+            hurry_interval_in_seconds, kw):
+        'Set options and state shared by the threaded and asyncio clients'
         self._is_secure, self._url = parse_host(host, port, resource)
         self._wait_for_connection = wait_for_connection
         self._client_transports = transports
         self._hurry_interval_in_seconds = hurry_interval_in_seconds
         self._http_session = prepare_http_session(kw)
+        self.compression_stats = kw.setdefault(
+            'compression_stats', CompressionStats())
+        self.stats = kw.get('stats')
+        self._stats = get_stats(kw)
+        self._transport_options = kw
+        self._dispatcher = PacketDispatcher(
+            kw['max_workers'], self._notify_waiters,
+        ) if kw.get('max_workers') else None
+        self._manager = kw.get('manager')
+        self._outbox = kw.get('outbox')
+        self._reconnect_policy = kw.get(
+            'reconnect_policy') or ReconnectPolicy()
+        self._reconnect_attempt_count = 0
+        self._heartbeat = None
+        self._is_waiting = False
+        self._ping_time = None
+        self.heartbeat_rtt_in_seconds = None
+        self._upgrade_thread = None
+        self.upgrade_duration_in_seconds = None
+        self.upgrade_error = None
+        self._packet_condition = threading.Condition()
+        self._receiver_thread = None
 
         self._log_name = self._url
+        self._log_body_size = kw.get('log_body_size', LOG_BODY_SIZE)
         self._opened = False
         self._wants_to_close = False
-        atexit.register(self._close)
-
-        if Namespace:
-            self.define(Namespace)
-        self._transport
 
     # Connect
 
@@ -59,18 +104,57 @@ class EngineIO(LoggingMixin):
     def _transport(self):
         if self._opened:
             return self._transport_instance
-        self._engineIO_session = self._get_engineIO_session()
-        self._negotiate_transport()
+        transport = self._open_direct_transport()
+        if transport:
+            self._transport_instance = transport
+            self.transport_name = 'websocket'
+            self._debug(
+                '[engine.io transport selected] %s', self.transport_name)
+        else:
+            self._engineIO_session = self._get_engineIO_session()
+            self._negotiate_transport()
         self._connect_namespaces()
         self._opened = True
-        self._reset_heartbeat()
+        if self._stats and self._reconnect_attempt_count:
+            self._stats.count_reconnect()
+        self._reconnect_attempt_count = 0
+        if self._outbox:
+            self._flush_outbox()
+        if self._manager:
+            self._manager._register(self)
+        else:
+            self._reset_heartbeat()
+            if self._dispatcher:
+                self._start_receiver_thread()
         return self._transport_instance
 
+    def _open_direct_transport(self):
+        'Open a websocket without the polling handshake if polling is off'
+        if 'xhr-polling' in self._client_transports:
+            return
+        try:
+            transport = WebsocketTransport(
+                self._http_session, self._is_secure, self._url,
+                **self._transport_options)
+            engineIO_packet_type, engineIO_packet_data = next(
+                transport.recv_packet())
+        except (TimeoutError, ConnectionError) as e:
+            self._debug('[engine.io direct websocket failed] %s', e)
+            return
+        if engineIO_packet_type != 0:  # engineIO_packet_type != open
+            self._warn('unexpected engine.io packet')
+            transport.close()
+            return
+        self._engineIO_session = parse_engineIO_session(engineIO_packet_data)
+        transport.set_engineIO_session(self._engineIO_session)
+        return transport
+
     def _get_engineIO_session(self):
         warning_screen = self._yield_warning_screen()
         for elapsed_time in warning_screen:
             transport = XHR_PollingTransport(
-                self._http_session, self._is_secure, self._url)
+                self._http_session, self._is_secure, self._url,
+                **self._transport_options)
             try:
                 engineIO_packet_type, engineIO_packet_data = next(
                     transport.recv_packet())
@@ -81,6 +165,7 @@ class EngineIO(LoggingMixin):
                 warning = Exception(
                     '[engine.io waiting for connection] %s' % e)
                 warning_screen.throw(warning)
+                self._wait_to_reconnect(e)
         assert engineIO_packet_type == 0  # engineIO_packet_type == open
         return parse_engineIO_session(engineIO_packet_data)
 
@@ -90,26 +175,65 @@ class EngineIO(LoggingMixin):
         is_ws_client = 'websocket' in self._client_transports
         is_ws_server = 'websocket' in self._engineIO_session.transport_upgrades
         if is_ws_client and is_ws_server:
+            if self._manager:
+                # The manager only watches websockets, so upgrade first
+                self._upgrade_transport(self._transport_instance)
+            else:
+                self._start_upgrade_thread()
+        self._debug('[engine.io transport selected] %s', self.transport_name)
+
+    def _start_upgrade_thread(self):
+        self._upgrade_thread = thread = threading.Thread(
+            target=self._upgrade_transport, args=(self._transport_instance,))
+        thread.daemon = True
+        thread.start()
+
+    def _wait_for_upgrade(self, seconds=None):
+        thread = self._upgrade_thread
+        if thread:
+            thread.join(seconds)
+
+    def _upgrade_transport(self, polling_transport):
+        'Probe a websocket while polling and switch to it between requests'
+        start_time = time.time()
+        transport = None
+        try:
+            transport = self._get_transport('websocket')
+            transport.send_packet(2, 'probe')
+            for packet_type, packet_data in transport.recv_packet():
+                if packet_type != 3 or packet_data != b'probe':
+                    raise PacketError('unexpected engine.io packet')
+            if not polling_transport.pause(
+                    self._engineIO_session.ping_timeout):
+                raise TimeoutError('polling requests did not finish')
             try:
-                transport = self._get_transport('websocket')
-                transport.send_packet(2, 'probe')
-                for packet_type, packet_data in transport.recv_packet():
-                    if packet_type == 3 and packet_data == b'probe':
-                        transport.send_packet(5, '')
-                        self._transport_instance = transport
-                        self.transport_name = 'websocket'
-                    else:
-                        self._warn('unexpected engine.io packet')
+                if self._wants_to_close or (
+                        polling_transport is not self._transport_instance):
+                    raise ConnectionError('connection closed during upgrade')
+                transport.send_packet(5, '')
             except Exception:
-                pass
-        self._debug('[engine.io transport selected] %s', self.transport_name)
+                polling_transport.resume()
+                raise
+            polling_transport.hand_over(transport)
+            self._transport_instance = transport
+            self.transport_name = 'websocket'
+        except Exception as e:
+            self.upgrade_error = str(e) or e.__class__.__name__
+            self._debug('[engine.io upgrade failed] %s', self.upgrade_error)
+            if transport:
+                transport.close()
+            return
+        self.upgrade_duration_in_seconds = time.time() - start_time
+        self.upgrade_error = None
+        self._debug(
+            '[engine.io transport upgraded] %s in %.3f seconds',
+            self.transport_name, self.upgrade_duration_in_seconds)
 
     def _reset_heartbeat(self):
-        try:
-            self._heartbeat_thread.halt()
-            hurried = self._heartbeat_thread.hurried
-        except AttributeError:
-            hurried = False
+        hurried = False
+        if self._heartbeat:
+            self._heartbeat.halt()
+            hurried = self._heartbeat.hurried
         ping_interval = self._engineIO_session.ping_interval
         if self.transport_name.endswith('-polling'):
             # Use ping/pong to unblock recv for polling transport
@@ -117,18 +241,59 @@ class EngineIO(LoggingMixin):
         else:
             # Use timeout to unblock recv for websocket transport
             hurry_interval_in_seconds = ping_interval
-        self._heartbeat_thread = HeartbeatThread(
+        self._heartbeat = HEARTBEAT_SCHEDULER.add(
             send_heartbeat=self._ping,
             relax_interval_in_seconds=ping_interval,
-            hurry_interval_in_seconds=hurry_interval_in_seconds)
-        self._heartbeat_thread.start()
+            hurry_interval_in_seconds=hurry_interval_in_seconds,
+            ping_timeout_in_seconds=self._engineIO_session.ping_timeout,
+            on_timeout=self._on_heartbeat_timeout)
         if hurried:
-            self._heartbeat_thread.hurry()
+            self._heartbeat.hurry()
         self._debug('[engine.io heartbeat reset]')
 
+    def _wait_to_reconnect(self, e):
+        time.sleep(self._get_reconnect_delay(e))
+
+    def _get_reconnect_delay(self, e):
+        'Count a failed attempt and return seconds to wait or give up'
+        policy = self._reconnect_policy
+        attempt_count = self._reconnect_attempt_count
+        if policy.should_give_up(attempt_count):
+            self._wants_to_close = True
+            policy.give_up(e)
+            raise ConnectionError('gave up after %s attempts (%s)' % (
+                attempt_count, e))
+        self._reconnect_attempt_count += 1
+        if self._stats:
+            self._stats.count_reconnect_attempt()
+        return policy.get_delay(attempt_count)
+
+    def _on_heartbeat_timeout(self):
+        'Drop a connection that stopped answering pings'
+        heartbeat = self._heartbeat
+        if not (self._dispatcher or self._is_waiting):
+            # Nobody read the pongs, so their absence means nothing
+            heartbeat.reset()
+            return
+        self._warn('[heartbeat timeout] no pong in %s seconds', (
+            self._engineIO_session.ping_interval +
+            self._engineIO_session.ping_timeout))
+        heartbeat.halt()
+        # Wake up the reader, which then reconnects
+        self._transport_instance.close()
+
     def _connect_namespaces(self):
         pass
 
+    def _start_receiver_thread(self):
+        with self._packet_condition:
+            if self._receiver_thread:
+                return
+            self._receiver_thread = thread = threading.Thread(
+                target=self._receive_packets)
+            thread.daemon = True
+            thread.start()
+
     def _get_transport(self, transport_name):
         SelectedTransport = {
             'xhr-polling': XHR_PollingTransport,
@@ -136,7 +301,7 @@ class EngineIO(LoggingMixin):
         }[transport_name]
         return SelectedTransport(
             self._http_session, self._is_secure, self._url,
-            self._engineIO_session)
+            self._engineIO_session, **self._transport_options)
 
     def __enter__(self):
         return self
@@ -191,22 +356,30 @@ class EngineIO(LoggingMixin):
 
     def _close(self):
         self._wants_to_close = True
-        try:
-            self._heartbeat_thread.halt()
-            self._heartbeat_thread.join()
-        except AttributeError:
-            pass
+        if getattr(self, '_manager', None):
+            self._manager._unregister(self)
+        heartbeat = getattr(self, '_heartbeat', None)
+        if heartbeat:
+            heartbeat.halt()
+            heartbeat.join()
+        dispatcher = getattr(self, '_dispatcher', None)
+        if dispatcher:
+            dispatcher.shutdown(wait=False)
         if not hasattr(self, '_opened') or not self._opened:
             return
         engineIO_packet_type = 1
         try:
             self._transport_instance.send_packet(engineIO_packet_type)
+            # Let a send window write what it queued before we go
+            self._transport_instance.drain(
+                self._engineIO_session.ping_timeout)
         except (TimeoutError, ConnectionError):
             pass
         self._opened = False
 
     def _ping(self, engineIO_packet_data=''):
         engineIO_packet_type = 2
+        self._ping_time = time.time()
         self._transport_instance.send_packet(
             engineIO_packet_type, engineIO_packet_data)
 
@@ -215,14 +388,118 @@ class EngineIO(LoggingMixin):
         self._transport_instance.send_packet(
             engineIO_packet_type, engineIO_packet_data)
 
+    def _messages(self, engineIO_packets_data, with_transport_instance=False):
+        'Send several message packets in one transport write'
+        engineIO_packet_type = 4
+        if with_transport_instance:
+            transport = self._transport_instance
+        else:
+            transport = self._transport
+        transport.send_packets([(
+            engineIO_packet_type, x) for x in engineIO_packets_data])
+        if self._stats:
+            for engineIO_packet_data in engineIO_packets_data:
+                self._stats.count_message('sent', len(engineIO_packet_data))
+        self._debug('[socket.io packets sent] %s', engineIO_packets_data)
+
+    def _message(
+            self, engineIO_packet_data, with_transport_instance=False,
+            attachments=()):
+        if self._stats:
+            self._stats.count_message('sent', len(engineIO_packet_data) + sum(
+                len(x) for x in attachments))
+        if self._outbox and not with_transport_instance:
+            return self._send_or_queue(
+                [engineIO_packet_data] + list(attachments))
+        return self._send_message(
+            engineIO_packet_data, with_transport_instance, attachments)
+
+    def _message_nowait(self, engineIO_packet_data, attachments=()):
+        'Queue a message or return False instead of waiting for room'
+        if not self._opened:
+            return False
+        engineIO_packet_type = 4
+        try:
+            is_queued = self._transport_instance.send_packets_nowait([
+                (engineIO_packet_type, engineIO_packet_data),
+            ] + [(engineIO_packet_type, x) for x in attachments])
+        except (TimeoutError, ConnectionError) as e:
+            self._warn('[connection error] %s', e)
+            self._opened = False
+            return False
+        if not is_queued:
+            self._debug('[socket.io send window full]')
+            return False
+        if self._stats:
+            self._stats.count_message('sent', len(engineIO_packet_data) + sum(
+                len(x) for x in attachments))
+        self._debug('[socket.io packet queued] %s', engineIO_packet_data)
+        return True
+
+    def _send_or_queue(self, engineIO_packets_data):
+        'Send now if connected and nothing is queued, otherwise queue'
+        engineIO_packet_type = 4
+        # Send without the outbox lock so that concurrent emits can share a
+        # transport write; nothing older is queued if we may send now
+        if self._outbox._can_send_now(self._opened):
+            try:
+                self._transport_instance.send_packets([(
+                    engineIO_packet_type, x,
+                ) for x in engineIO_packets_data])
+                self._debug(
+                    '[socket.io packet sent] %s', engineIO_packets_data[0])
+                return
+            except (TimeoutError, ConnectionError) as e:
+                self._warn('[connection error] %s', e)
+                self._opened = False
+        # Without a receiver thread, nobody would flush while we wait
+        if not self._outbox.put(
+                engineIO_packets_data, block=self._has_receiver):
+            if self._stats:
+                self._stats.count_message('dropped', sum(
+                    len(x) for x in engineIO_packets_data))
+            self._warn(
+                '[socket.io packet dropped] %s', engineIO_packets_data[0])
+            return
+        self._debug('[socket.io packet queued] %s', engineIO_packets_data[0])
+
+    def _flush_outbox(self):
+        'Send queued messages in order, one batch per transport write'
+        engineIO_packet_type = 4
+        transport = self._transport_instance
+        while True:
+            # Claim a batch under the outbox lock and send it after release
+            entries = self._outbox._start_batch()
+            if not entries:
+                return
+            try:
+                transport.send_packets([(
+                    engineIO_packet_type, x,
+                ) for entry in entries for x in (
+                    entry.engineIO_packets_data)])
+            except (TimeoutError, ConnectionError) as e:
+                self._outbox._cancel_batch()
+                self._warn('[socket.io packets not sent] %s', e)
+                self._opened = False
+                return
+            self._outbox._finish_batch(entries)
+            self._debug('[socket.io packets flushed] %s', len(entries))
+
     @retry
-    def _message(self, engineIO_packet_data, with_transport_instance=False):
+    def _send_message(
+            self, engineIO_packet_data, with_transport_instance=False,
+            attachments=()):
         engineIO_packet_type = 4
         if with_transport_instance:
             transport = self._transport_instance
         else:
             transport = self._transport
-        transport.send_packet(engineIO_packet_type, engineIO_packet_data)
+        if attachments:
+            transport.send_packets([
+                (engineIO_packet_type, engineIO_packet_data),
+            ] + [(engineIO_packet_type, x) for x in attachments])
+        else:
+            transport.send_packet(engineIO_packet_type, engineIO_packet_data)
         self._debug('[socket.io packet sent] %s', engineIO_packet_data)
 
     def _upgrade(self):
@@ -237,11 +514,22 @@ class EngineIO(LoggingMixin):
 
     def wait(self, seconds=None, **kw):
         'Wait in a loop and react to events as defined in the namespaces'
+        if self._has_receiver:
+            return self._wait_for_receiver(seconds, **kw)
         # Use ping/pong to unblock recv for polling transport
-        self._heartbeat_thread.hurry()
+        self._heartbeat.hurry()
         # Use timeout to unblock recv for websocket transport
         self._transport.set_timeout(seconds=1)
         # Listen
+        self._is_waiting = True
+        try:
+            self._listen(seconds, **kw)
+        finally:
+            self._is_waiting = False
+        self._heartbeat.relax()
+        self._transport.set_timeout()
+
+    def _listen(self, seconds=None, **kw):
         warning_screen = self._yield_warning_screen(seconds)
         for elapsed_time in warning_screen:
             if self._should_stop_waiting(**kw):
@@ -261,66 +549,155 @@ class EngineIO(LoggingMixin):
                     warning_screen.throw(warning)
                 except StopIteration:
                     self._warn(warning)
+                self._launch_disconnect_callbacks()
+                self._wait_to_reconnect(e)
+
+    @property
+    def _has_receiver(self):
+        'Return True if another thread reads packets for this client'
+        return bool(self._dispatcher or self._manager)
+
+    def _wait_for_receiver(self, seconds=None, **kw):
+        'Let the receiver thread react to events until we should stop'
+        if not self._wants_to_close:
+            self._transport
+        end_time = None if seconds is None else time.time() + seconds
+        with self._packet_condition:
+            while not (
+                    self._should_stop_waiting(**kw) and
+                    (not self._dispatcher or self._dispatcher.is_idle)):
+                if end_time is None:
+                    self._packet_condition.wait()
+                    continue
+                remaining_time = end_time - time.time()
+                if remaining_time <= 0:
+                    break
+                self._packet_condition.wait(remaining_time)
+
+    def _receive_packets(self):
+        'Read packets in the receiver thread until the client closes'
+        warning_screen = self._yield_warning_screen()
+        for elapsed_time in warning_screen:
+            with self._packet_condition:
+                if not self._opened:
+                    self._receiver_thread = None
+                    self._packet_condition.notify_all()
+                    return
+            transport = self._transport_instance
+            try:
                 try:
-                    namespace = self.get_namespace()
-                    namespace._find_packet_callback('disconnect')()
-                except PacketError:
+                    self._process_packets(transport)
+                except TimeoutError:
                     pass
-        self._heartbeat_thread.relax()
-        self._transport.set_timeout()
+            except ConnectionError as e:
+                if transport is not self._transport_instance:
+                    continue  # Another thread already reconnected
+                self._opened = False
+                self._launch_disconnect_callbacks()
+                self._notify_waiters()
+                if self._wants_to_close:
+                    continue
+                try:
+                    warning_screen.throw(Exception(
+                        '[connection error] %s' % e))
+                    self._wait_to_reconnect(e)
+                    self._transport
+                except ConnectionError as e:
+                    self._warn('[connection error] %s', e)
+
+    def _notify_waiters(self):
+        with self._packet_condition:
+            self._packet_condition.notify_all()
 
     def _should_stop_waiting(self):
         return self._wants_to_close
 
-    def _process_packets(self):
-        for engineIO_packet in self._transport.recv_packet():
+    def _process_packets(self, transport=None, engineIO_packets=None):
+        if engineIO_packets is None:
+            transport = transport or self._transport
+            engineIO_packets = transport.recv_packet()
+        for engineIO_packet in engineIO_packets:
             try:
                 self._process_packet(engineIO_packet)
             except PacketError as e:
                 self._warn('[packet error] %s', e)
+            if self._has_receiver:
+                self._notify_waiters()
 
     def _process_packet(self, packet):
         engineIO_packet_type, engineIO_packet_data = packet
         # Launch callbacks
         namespace = self.get_namespace()
         try:
-            delegate = {
-                0: self._on_open,
-                1: self._on_close,
-                2: self._on_ping,
-                3: self._on_pong,
-                4: self._on_message,
-                5: self._on_upgrade,
-                6: self._on_noop,
-            }[engineIO_packet_type]
+            delegate_name = self._engineIO_delegate_name_by_packet_type[
+                engineIO_packet_type]
         except KeyError:
             raise PacketError(
                 'unexpected engine.io packet type (%s)' % engineIO_packet_type)
-        delegate(engineIO_packet_data, namespace)
+        if self._stats and engineIO_packet_type == 4:
+            self._stats.count_message('received', len(engineIO_packet_data))
+        getattr(self, delegate_name)(engineIO_packet_data, namespace)
         if engineIO_packet_type == 4:
             return engineIO_packet_data
 
+    def _launch_disconnect_callbacks(self):
+        try:
+            namespace = self.get_namespace()
+        except PacketError:
+            return
+        self._launch_packet_callback(namespace, 'disconnect')
+
+    def _launch_packet_callback(self, namespace, event, *args):
+        callback = namespace._find_packet_callback(event)
+        if self._stats:
+            callback = time_handler(self._stats, event, callback)
+        self._launch_callback(namespace, callback, *args)
+
+    def _launch_callback(self, namespace, callback, *args):
+        'Call now or, with max_workers, queue behind namespace callbacks'
+        if self._dispatcher:
+            self._dispatcher.submit(namespace, callback, *args)
+        else:
+            callback(*args)
+
     def _on_open(self, data, namespace):
-        namespace._find_packet_callback('open')()
+        self._launch_packet_callback(namespace, 'open')
 
     def _on_close(self, data, namespace):
-        namespace._find_packet_callback('close')()
+        self._launch_packet_callback(namespace, 'close')
 
     def _on_ping(self, data, namespace):
         self._pong(data)
-        namespace._find_packet_callback('ping')(data)
+        self._launch_packet_callback(namespace, 'ping', data)
 
     def _on_pong(self, data, namespace):
-        namespace._find_packet_callback('pong')(data)
+        if self._ping_time:
+            self.heartbeat_rtt_in_seconds = time.time() - self._ping_time
+            if self._stats:
+                self._stats.set_heartbeat_rtt(self.heartbeat_rtt_in_seconds)
+        if self._heartbeat:
+            self._heartbeat.receive_pong()
+        self._launch_packet_callback(namespace, 'pong', data)
 
     def _on_message(self, data, namespace):
-        namespace._find_packet_callback('message')(data)
+        self._launch_packet_callback(namespace, 'message', data)
 
     def _on_upgrade(self, data, namespace):
-        namespace._find_packet_callback('upgrade')()
+        self._launch_packet_callback(namespace, 'upgrade')
 
     def _on_noop(self, data, namespace):
-        namespace._find_packet_callback('noop')()
+        self._launch_packet_callback(namespace, 'noop')
+
+    # Store names so that subclasses can override the delegates
+    _engineIO_delegate_name_by_packet_type = {
+        0: '_on_open',
+        1: '_on_close',
+        2: '_on_ping',
+        3: '_on_pong',
+        4: '_on_message',
+        5: '_on_upgrade',
+        6: '_on_noop',
+    }
 
 
 class SocketIO(EngineIO):
@@ -331,7 +708,44 @@ class SocketIO(EngineIO):
     - Prefix host with https:// to use SSL.
     - Set wait_for_connection=True to block until we have a connection.
     - Specify desired transports=['websocket', 'xhr-polling'].
+      Use transports=['websocket'] to skip the polling handshake; the
+      client falls back to polling if the direct websocket fails.
+    - Set compression=PerMessageDeflate() to compress large websocket
+      messages. Read compression_stats for the ratio and time spent.
+    - With both transports, the client exchanges messages over polling
+      while it upgrades to a websocket in the background. Read
+      upgrade_duration_in_seconds and upgrade_error to see how it went.
     - Pass query params, headers, cookies, proxies as keyword arguments.
+    - Limit coalesced polling uploads with max_batch_packets, max_batch_bytes.
+    - Size the HTTP connection pool with pool_connections, pool_maxsize,
+      pool_block or share one pool with http_adapter=PooledHTTPAdapter().
+    - Set max_workers=4 to read packets in a background thread and run
+      callbacks in a pool of four threads, in order for each namespace.
+    - Set manager=SocketIOManager() to read packets for many clients
+      in one thread.
+    - Set codec=FastJSONCodec() or codec=MsgPackCodec() to change how
+      socket.io packets are serialized.
+    - Set reconnect_policy=ReconnectPolicy(max_attempts=10) to change how
+      long to wait between connection attempts and when to give up.
+    - Set outbox=Outbox() to queue emits while disconnected and send them
+      in order after the client reconnects.
+    - Read heartbeat_rtt_in_seconds for the latest ping round trip. While a
+      thread reads packets, a connection that misses pongs for
+      ping_interval + ping_timeout is dropped and reconnected.
+    - Call define_many({'/chat': Namespace, '/news': Namespace}) to connect
+      several namespaces in one write.
+    - Call emit('aaa', future=True) to get a Future of the ack args.
+      Set ack_registry=AckRegistry(max_size=1000, timeout_in_seconds=30)
+      to bound acks in flight and give up on acks that never come.
+    - Set stats=MemoryStats() or stats=PrometheusStats() to count packets,
+      bytes, reconnects and time spent in transports and event handlers.
+    - Set log_body_size=200 to log at most 200 characters of each packet
+      or None to log them whole. Disabled log levels cost no formatting.
+    - Set send_window=SendWindow(high_water_mark=1048576, on_drain=resume)
+      to queue websocket writes in a writer thread and bound the queued
+      bytes. Call emit_nowait() to get False instead of waiting for room.
+    - Call emit_stream('upload', open(path, 'rb')) to send a large file in
+      acknowledged binary chunks and iter_stream('download') to read one.
 
     SocketIO(
         '127.0.0.1', 8000,
@@ -346,8 +760,12 @@ class SocketIO(EngineIO):
             wait_for_connection=True, transports=TRANSPORTS,
             resource='socket.io', hurry_interval_in_seconds=1, **kw):
         self._namespace_by_path = {}
-        self._callback_by_ack_id = {}
-        self._ack_id = 0
+        self._ack_registry = kw.get('ack_registry')
+        if self._ack_registry is None:
+            self._ack_registry = AckRegistry()
+        self._ack_registry.on_timeout = self._on_ack_timeout
+        self._codec = kw.get('codec') or JSONCodec()
+        self._binary_packet = None
         super(SocketIO, self).__init__(
             host, port, Namespace, wait_for_connection, transports,
             resource, hurry_interval_in_seconds, **kw)
@@ -359,10 +777,18 @@ class SocketIO(EngineIO):
         return self._opened
 
     def _connect_namespaces(self):
+        self._binary_packet = None
+        paths = []
         for path, namespace in self._namespace_by_path.items():
             namespace._transport = self._transport_instance
             if path:
-                self.connect(path, with_transport_instance=True)
+                paths.append(path)
+        if paths:
+            # Rejoin every namespace in one write instead of one per path
+            socketIO_packet_type = 0
+            self._messages([self._codec.encode_packet(
+                socketIO_packet_type, path) for path in paths],
+                with_transport_instance=True)
 
     def __exit__(self, *exception_pack):
         self.disconnect()
@@ -381,6 +807,43 @@ class SocketIO(EngineIO):
             self.wait(for_namespace=namespace)
         return namespace
 
+    def define_many(self, Namespace_by_path, seconds=None):
+        """Define namespaces and connect them in one transport write.
+
+        Wait up to seconds for every namespace to connect, then raise
+        NamespaceError with error_by_path if any of them did not."""
+        # Connect first so that a reconnect does not send duplicate packets
+        self._transport
+        namespace_by_path, namespaces = self._connect_many(Namespace_by_path)
+        self.wait(seconds, for_namespaces=namespaces)
+        self._check_namespaces(namespaces)
+        return namespace_by_path
+
+    def _connect_many(self, Namespace_by_path):
+        'Define namespaces and send their connect packets in one write'
+        namespace_by_path = {}
+        for path, Namespace in Namespace_by_path.items():
+            self._namespace_by_path[path] = namespace_by_path[path] = (
+                Namespace(self, path))
+        paths = [path for path in namespace_by_path if path]
+        if paths:
+            socketIO_packet_type = 0
+            self._messages([self._codec.encode_packet(
+                socketIO_packet_type, path) for path in paths],
+                with_transport_instance=True)
+        return namespace_by_path, [namespace_by_path[x] for x in paths]
+
+    def _check_namespaces(self, namespaces):
+        'Raise NamespaceError if any of the namespaces did not connect'
+        error_by_path = {}
+        for namespace in namespaces:
+            if getattr(namespace, '_invalid', False):
+                error_by_path[namespace.path] = 'invalid namespace'
+            elif not getattr(namespace, '_connected', False):
+                error_by_path[namespace.path] = 'timed out'
+        if error_by_path:
+            raise NamespaceError(error_by_path)
+
     def on(self, event, callback, path=''):
         try:
             namespace = self.get_namespace(path)
@@ -399,18 +862,17 @@ class SocketIO(EngineIO):
     def connect(self, path='', with_transport_instance=False):
         if path or not self.connected:
             socketIO_packet_type = 0
-            socketIO_packet_data = format_socketIO_packet_data(path)
             self._message(
-                str(socketIO_packet_type) + socketIO_packet_data,
+                self._codec.encode_packet(socketIO_packet_type, path),
                 with_transport_instance)
         self._wants_to_close = False
 
     def disconnect(self, path=''):
         if path and self._opened:
             socketIO_packet_type = 1
-            socketIO_packet_data = format_socketIO_packet_data(path)
             try:
-                self._message(str(socketIO_packet_type) + socketIO_packet_data)
+                self._message(
+                    self._codec.encode_packet(socketIO_packet_type, path))
             except (TimeoutError, ConnectionError):
                 pass
         elif not path:
@@ -424,13 +886,77 @@ class SocketIO(EngineIO):
             pass
 
     def emit(self, event, *args, **kw):
+        'Emit an event; pass future=True to get a Future of the ack args'
+        return self._emit(event, args, kw)
+
+    def emit_nowait(self, event, *args, **kw):
+        'Emit an event or return False if the send window or acks are full'
+        return self._emit(event, args, kw, nowait=True)
+
+    def _emit(self, event, args, kw, nowait=False):
         path = kw.get('path', '')
         callback, args = find_callback(args, kw)
-        ack_id = self._set_ack_callback(callback) if callback else None
-        args = [event] + list(args)
+        future = None
+        if kw.get('future'):
+            future = Future()
+            future.set_running_or_notify_cancel()
+        try:
+            ack_id = self._set_ack_callback(
+                callback, future, kw.get('ack_timeout_in_seconds'),
+                block=not nowait,
+            ) if callback or future else None
+        except TimeoutError:
+            if nowait:
+                return False
+            raise
+        # Copy args once into a tuple that starts with the event
+        args = (event,) + tuple(args)
         socketIO_packet_type = 2
-        socketIO_packet_data = format_socketIO_packet_data(path, ack_id, args)
-        self._message(str(socketIO_packet_type) + socketIO_packet_data)
+        try:
+            is_queued = self._send_socketIO_packet(
+                socketIO_packet_type, path, ack_id, args, nowait)
+        except Exception:
+            if ack_id is not None:
+                self._ack_registry.discard(ack_id)
+            raise
+        if not nowait:
+            return future
+        if not is_queued:
+            if ack_id is not None:
+                self._ack_registry.discard(ack_id)
+            return False
+        return future or True
+
+    def emit_stream(self, event, chunks, **kw):
+        """Emit chunks of bytes as numbered binary events and return the
+        number of bytes sent.
+
+        Wait for acks so that at most window_size chunks are in flight,
+        which keeps memory constant however long the stream. Pass a file
+        opened in binary mode to read chunk_size bytes at a time."""
+        writer = StreamWriter(self, event, chunks, **kw)
+        futures = deque()
+        try:
+            for chunk in writer.iter_chunks():
+                if len(futures) >= writer.window_size:
+                    self._wait_for_future(futures.popleft())
+                futures.append(writer.emit_chunk(chunk))
+            if len(futures) >= writer.window_size:
+                self._wait_for_future(futures.popleft())
+            futures.append(writer.emit_end())
+            while futures:
+                self._wait_for_future(futures.popleft())
+        except Exception as e:
+            writer.abort(e)
+            raise
+        return writer.byte_count
+
+    def iter_stream(self, event, path='', timeout_in_seconds=None):
+        'Return an iterator over the chunks of the next stream for event'
+        return self.get_namespace(path).iter_stream(event, timeout_in_seconds)
+
+    def _make_stream_reader(self, namespace, event, timeout_in_seconds):
+        return StreamReader(namespace, event, timeout_in_seconds)
 
     def send(self, data='', callback=None, **kw):
         path = kw.get('path', '')
@@ -441,15 +967,40 @@ class SocketIO(EngineIO):
 
     def _ack(self, path, ack_id, *args):
         socketIO_packet_type = 3
-        socketIO_packet_data = format_socketIO_packet_data(path, ack_id, args)
-        self._message(str(socketIO_packet_type) + socketIO_packet_data)
+        self._send_socketIO_packet(socketIO_packet_type, path, ack_id, args)
+
+    def _send_socketIO_packet(
+            self, socketIO_packet_type, path, ack_id, args, nowait=False):
+        'Send an event or ack, with bytes-like args as binary attachments'
+        attachments = ()
+        if not self._codec.supports_binary:
+            args, attachments = deconstruct_binary_args(args)
+            if attachments:
+                socketIO_packet_type += 3
+        engineIO_packet_data = self._codec.encode_packet(
+            socketIO_packet_type, path, ack_id, args, len(attachments))
+        if nowait:
+            return self._message_nowait(engineIO_packet_data, attachments)
+        return self._message(engineIO_packet_data, attachments=attachments)
 
     # React
 
     def wait_for_callbacks(self, seconds=None):
         self.wait(seconds, for_callbacks=True)
 
-    def _should_stop_waiting(self, for_namespace=False, for_callbacks=False):
+    def _wait_for_future(self, future, seconds=None):
+        'React to events until the future is done and return its result'
+        self.wait(seconds, for_future=future)
+        if not future.done():
+            raise TimeoutError('ack did not arrive')
+        return future.result()
+
+    def _should_stop_waiting(
+            self, for_namespace=False, for_namespaces=(),
+            for_callbacks=False, for_future=None):
+        if for_namespaces:
+            return all(getattr(x, '_connected', False) or getattr(
+                x, '_invalid', False) for x in for_namespaces)
         if for_namespace:
             namespace = for_namespace
             if getattr(namespace, '_invalid', False):
@@ -463,83 +1014,130 @@ class SocketIO(EngineIO):
             return True
         if for_callbacks and not self._has_ack_callback:
             return True
+        if for_future and for_future.done():
+            return True
         return super(SocketIO, self)._should_stop_waiting()
 
     def _process_packet(self, packet):
         engineIO_packet_data = super(SocketIO, self)._process_packet(packet)
         if engineIO_packet_data is None:
             return
-        self._debug('[socket.io packet received] %s', engineIO_packet_data)
-        socketIO_packet_type = int(get_character(engineIO_packet_data, 0))
-        socketIO_packet_data = engineIO_packet_data[1:]
+        if self._binary_packet:
+            socketIO_packet_type, data_parsed, attachments = (
+                self._binary_packet)
+            attachments.append(engineIO_packet_data)
+            if len(attachments) < data_parsed.attachment_count:
+                return
+            self._binary_packet = None
+            data_parsed = data_parsed._replace(args=reconstruct_binary_args(
+                data_parsed.args, attachments))
+        else:
+            self._debug(
+                '[socket.io packet received] %s', engineIO_packet_data)
+            socketIO_packet_type, data_parsed = self._codec.decode_packet(
+                engineIO_packet_data)
+            if data_parsed.attachment_count:
+                # Wait for binary attachments in the packets that follow
+                self._binary_packet = socketIO_packet_type, data_parsed, []
+                return
         # Launch callbacks
-        path = get_namespace_path(socketIO_packet_data)
-        namespace = self.get_namespace(path)
+        namespace = self.get_namespace(data_parsed.path)
         try:
-            delegate = {
-                0: self._on_connect,
-                1: self._on_disconnect,
-                2: self._on_event,
-                3: self._on_ack,
-                4: self._on_error,
-                5: self._on_binary_event,
-                6: self._on_binary_ack,
-            }[socketIO_packet_type]
+            delegate_name = self._socketIO_delegate_name_by_packet_type[
+                socketIO_packet_type]
         except KeyError:
             raise PacketError(
                 'unexpected socket.io packet type (%s)' % socketIO_packet_type)
-        delegate(parse_socketIO_packet_data(socketIO_packet_data), namespace)
-        return socketIO_packet_data
+        getattr(self, delegate_name)(data_parsed, namespace)
+        return data_parsed
 
     def _on_connect(self, data_parsed, namespace):
         namespace._connected = True
-        namespace._find_packet_callback('connect')()
+        self._launch_packet_callback(namespace, 'connect')
         self._debug(
             '%s[socket.io connected]', make_logging_prefix(namespace.path))
 
     def _on_disconnect(self, data_parsed, namespace):
         namespace._connected = False
-        namespace._find_packet_callback('disconnect')()
+        self._launch_packet_callback(namespace, 'disconnect')
+
+    def _launch_disconnect_callbacks(self):
+        'Tell every namespace that the connection dropped'
+        for namespace in list(self._namespace_by_path.values()):
+            namespace._connected = False
+            self._launch_packet_callback(namespace, 'disconnect')
 
     def _on_event(self, data_parsed, namespace):
         args = data_parsed.args
-        try:
-            event = args.pop(0)
-        except IndexError:
+        if not args:
             raise PacketError('missing event name')
         if data_parsed.ack_id is not None:
             args.append(self._prepare_to_send_ack(
                 data_parsed.path, data_parsed.ack_id))
-        namespace._find_packet_callback(event)(*args)
+        # Skip the event name without shifting the list
+        self._launch_packet_callback(
+            namespace, args[0], *islice(args, 1, None))
 
     def _on_ack(self, data_parsed, namespace):
         try:
-            ack_callback = self._get_ack_callback(data_parsed.ack_id)
+            entry = self._ack_registry.pop(data_parsed.ack_id)
         except KeyError:
             return
-        ack_callback(*data_parsed.args)
+        if entry.future:
+            entry.future.set_result(tuple(data_parsed.args))
+        if entry.callback:
+            self._launch_callback(
+                namespace, entry.callback, *data_parsed.args)
+
+    def _on_ack_timeout(self, entry):
+        self._warn('[socket.io ack timed out] %s', entry.ack_id)
+        self._notify_waiters()
 
     def _on_error(self, data_parsed, namespace):
-        namespace._find_packet_callback('error')(*data_parsed.args)
+        self._launch_packet_callback(namespace, 'error', *data_parsed.args)
 
     def _on_binary_event(self, data_parsed, namespace):
-        self._warn('[not implemented] binary event')
+        self._on_event(data_parsed, namespace)
 
     def _on_binary_ack(self, data_parsed, namespace):
-        self._warn('[not implemented] binary ack')
+        self._on_ack(data_parsed, namespace)
+
+    # Store names so that subclasses can override the delegates
+    _socketIO_delegate_name_by_packet_type = {
+        0: '_on_connect',
+        1: '_on_disconnect',
+        2: '_on_event',
+        3: '_on_ack',
+        4: '_on_error',
+        5: '_on_binary_event',
+        6: '_on_binary_ack',
+    }
 
     def _prepare_to_send_ack(self, path, ack_id):
         'Return function that acknowledges the server'
         return lambda *args: self._ack(path, ack_id, *args)
 
-    def _set_ack_callback(self, callback):
-        self._ack_id += 1
-        self._callback_by_ack_id[self._ack_id] = callback
-        return self._ack_id
-
-    def _get_ack_callback(self, ack_id):
-        return self._callback_by_ack_id.pop(ack_id)
+    def _set_ack_callback(
+            self, callback, future=None, timeout_in_seconds=None, block=True):
+        # Without a receiver thread, no ack can arrive while we wait for room
+        return self._ack_registry.add(
+            callback, future, timeout_in_seconds,
+            block=block and self._has_receiver)
 
     @property
     def _has_ack_callback(self):
-        return True if self._callback_by_ack_id else False
+        return len(self._ack_registry) > 0
+
+
+try:
+    from .asynchronous import AsyncEngineIO, AsyncSocketIO
+except SyntaxError:  # Python 2 has no asyncio
+    pass
+else:
+    __all__ += 'AsyncEngineIO', 'AsyncSocketIO'
+try:
+    from .managers import SocketIOManager
+except ImportError:  # Python 2 has no selectors
+    pass
+else:
+    __all__ += 'SocketIOManager',
@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import time
+import weakref
+from collections import deque, namedtuple
+from invisibleroads_macros.log import get_log
+from threading import Condition, Thread
+
+from .exceptions import TimeoutError
+
+
+L = get_log(__name__)
+ACK_BLOCK_TIMEOUT_IN_SECONDS = 10
+AckEntry = namedtuple('AckEntry', [
+    'ack_id', 'callback', 'future', 'emit_time'])
+
+
+class AckRegistry(object):
+    """Track emits that wait for the server to acknowledge them.
+
+    - Give up on an ack after timeout_in_seconds, failing its future with
+      TimeoutError; emit(..., ack_timeout_in_seconds=5) overrides it.
+    - Keep at most max_size acks in flight. When full, emit waits up to
+      block_timeout_in_seconds for room and then raises TimeoutError.
+      Without a receiver thread to read acks, emit raises right away.
+    - Read ack_count, timeout_count and get_latency_percentile(99) to see
+      how long the server takes to answer.
+
+    SocketIO('127.0.0.1', 8000, ack_registry=AckRegistry(
+        max_size=1000, timeout_in_seconds=30))
+    """
+
+    def __init__(
+            self, max_size=None, timeout_in_seconds=None,
+            block_timeout_in_seconds=ACK_BLOCK_TIMEOUT_IN_SECONDS,
+            latency_sample_size=1000):
+        self.max_size = max_size
+        self.timeout_in_seconds = timeout_in_seconds
+        self.block_timeout_in_seconds = block_timeout_in_seconds
+        self.ack_count = 0
+        self.timeout_count = 0
+        self.on_timeout = None
+        self._entry_by_ack_id = {}
+        self._ack_ids = itertools.count(1)
+        self._latencies = deque(maxlen=latency_sample_size)
+        self._condition = Condition()
+
+    def __len__(self):
+        return len(self._entry_by_ack_id)
+
+    def add(
+            self, callback=None, future=None, timeout_in_seconds=None,
+            block=True):
+        'Return an ack_id for the callback or future, waiting for room'
+        if timeout_in_seconds is None:
+            timeout_in_seconds = self.timeout_in_seconds
+        with self._condition:
+            if self.max_size and len(self._entry_by_ack_id) >= self.max_size:
+                self._make_room(block)
+            ack_id = next(self._ack_ids)
+            self._entry_by_ack_id[ack_id] = AckEntry(
+                ack_id, callback, future, time.time())
+        if timeout_in_seconds is not None:
+            ACK_TIMER.schedule(self, ack_id, timeout_in_seconds)
+        return ack_id
+
+    def pop(self, ack_id):
+        'Return the entry that the server acknowledged or raise KeyError'
+        with self._condition:
+            entry = self._entry_by_ack_id.pop(ack_id)
+            self.ack_count += 1
+            self._latencies.append(time.time() - entry.emit_time)
+            self._condition.notify_all()
+        return entry
+
+    def discard(self, ack_id):
+        'Forget an ack whose emit never went out'
+        with self._condition:
+            self._entry_by_ack_id.pop(ack_id, None)
+            self._condition.notify_all()
+
+    def get_latency_percentile(self, percentile):
+        'Return seconds within which percentile percent of recent acks came'
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return
+        index = int(round(percentile / 100. * (len(latencies) - 1)))
+        return latencies[index]
+
+    def _make_room(self, block):
+        if not block:
+            raise TimeoutError('too many acks in flight (%s)' % self.max_size)
+        end_time = None if self.block_timeout_in_seconds is None else (
+            time.time() + self.block_timeout_in_seconds)
+        while len(self._entry_by_ack_id) >= self.max_size:
+            if end_time is None:
+                self._condition.wait()
+                continue
+            remaining_time = end_time - time.time()
+            if remaining_time <= 0:
+                raise TimeoutError(
+                    'too many acks in flight (%s)' % self.max_size)
+            self._condition.wait(remaining_time)
+
+    def _expire(self, ack_id):
+        with self._condition:
+            entry = self._entry_by_ack_id.pop(ack_id, None)
+            if not entry:
+                return
+            self.timeout_count += 1
+            self._condition.notify_all()
+        if entry.future:
+            entry.future.set_exception(TimeoutError(
+                'ack timed out (%s)' % ack_id))
+        if self.on_timeout:
+            self.on_timeout(entry)
+
+
+class AckTimer(object):
+    'Expire acks for every registry in the process from one thread'
+
+    # Hold registries weakly so that closed clients do not stay in memory
+    # until their last deadline passes
+
+    def __init__(self):
+        self._deadlines = []
+        self._deadline_index = itertools.count()
+        self._condition = Condition()
+        self._thread = None
+
+    def schedule(self, registry, ack_id, timeout_in_seconds):
+        with self._condition:
+            heapq.heappush(self._deadlines, (
+                time.time() + timeout_in_seconds, next(self._deadline_index),
+                weakref.ref(registry), ack_id))
+            if not self._thread:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                registry_reference, ack_id = self._pop_due_deadline()
+            registry = registry_reference()
+            if registry is None:
+                continue
+            try:
+                registry._expire(ack_id)
+            except Exception:
+                L.exception('[ack timeout error]')
+
+    def _pop_due_deadline(self):
+        while True:
+            if not self._deadlines:
+                self._condition.wait()
+                continue
+            due_time, index, registry_reference, ack_id = self._deadlines[0]
+            remaining_time = due_time - time.time()
+            if remaining_time > 0:
+                self._condition.wait(remaining_time)
+                continue
+            heapq.heappop(self._deadlines)
+            return registry_reference, ack_id
+
+
+ACK_TIMER = AckTimer()
@@ -0,0 +1,819 @@
+import asyncio
+import base64
+import hashlib
+import http.client
+import os
+import requests
+import ssl
+import struct
+import time
+from collections import deque
+from io import BytesIO
+from requests.cookies import MockRequest, MockResponse
+from six.moves.urllib.parse import urlparse as parse_url
+from timeit import default_timer
+
+from . import EngineIO, SocketIO
+from .acks import AckRegistry
+from .codecs import JSONCodec
+from .exceptions import ConnectionError, TimeoutError, PacketError
+from .namespaces import EngineIONamespace, SocketIONamespace
+from .streams import StreamReader, StreamWriter
+from .parsers import (
+    parse_engineIO_session,
+    encode_engineIO_content, decode_engineIO_content,
+    is_binary, format_packet_text, parse_packet_text)
+from .transports import (
+    CONNECT_TIMEOUT_IN_SECONDS, ENGINEIO_PROTOCOL, TRANSPORTS)
+
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+# These options need threads or a proxy tunnel that the asyncio client lacks
+UNSUPPORTED_OPTION_NAMES = (
+    'max_workers', 'manager', 'outbox', 'send_window', 'compression',
+    'proxies')
+# Python 3.5 and 3.6 keep current_task on Task
+get_current_task = getattr(
+    asyncio, 'current_task', None) or asyncio.Task.current_task
+
+
+class AsyncEngineIO(EngineIO):
+    """Drive an engine.io session with asyncio tasks instead of threads.
+
+    Sending methods queue packets and return awaitables, so namespace
+    handlers written for EngineIO run unchanged."""
+
+    def __init__(
+            self, host, port=None, Namespace=EngineIONamespace,
+            wait_for_connection=True, transports=TRANSPORTS,
+            resource='engine.io', **kw):
+        option_names = [x for x in UNSUPPORTED_OPTION_NAMES if kw.get(x)]
+        if option_names:
+            raise ValueError('%s not supported by %s' % (
+                ', '.join(option_names), self.__class__.__name__))
+        self._configure(
+            host, port, wait_for_connection, transports, resource, None, kw)
+        self._send_queue = asyncio.Queue()
+        self._drain_task = None
+        self._pong_time = None
+        self._packet_event = asyncio.Event()
+        self._transport_instance = None
+        self._connection_task = None
+        self._tasks = []
+
+        if Namespace:
+            self.define(Namespace)
+
+    # Connect
+
+    @property
+    def _transport(self):
+        if not self._opened and not self._connection_task:
+            self._connection_task = asyncio.ensure_future(
+                self._connect_transport())
+        return self._transport_instance
+
+    async def _connect_transport(self):
+        last_warning = None
+        try:
+            while True:
+                try:
+                    await self._open_transport()
+                    break
+                except (TimeoutError, ConnectionError) as e:
+                    if not self._wait_for_connection:
+                        raise
+                    warning = '[engine.io waiting for connection] %s' % e
+                    if last_warning != warning:
+                        last_warning = warning
+                        self._warn(warning)
+                    await asyncio.sleep(self._get_reconnect_delay(e))
+        finally:
+            self._connection_task = None
+        self._opened = True
+        if self._stats and self._reconnect_attempt_count:
+            self._stats.count_reconnect()
+        self._reconnect_attempt_count = 0
+        self._wants_to_close = False
+        self._reset_heartbeat()
+        self._connect_namespaces()
+        self._packet_event.set()
+
+    async def _open_transport(self):
+        if 'xhr-polling' in self._client_transports:
+            transport = AsyncXHR_PollingTransport(
+                self._http_session, self._is_secure, self._url,
+                stats=self._stats)
+            engineIO_packet_type, engineIO_packet_data = (
+                await transport.recv_packets())[0]
+            await transport.close()
+        else:
+            transport = AsyncWebsocketTransport(
+                self._http_session, self._is_secure, self._url,
+                stats=self._stats)
+            try:
+                engineIO_packet_type, engineIO_packet_data = (
+                    await asyncio.wait_for(
+                        self._open_direct_transport(transport),
+                        CONNECT_TIMEOUT_IN_SECONDS))[0]
+            except asyncio.TimeoutError:
+                await transport.close()
+                raise TimeoutError('websocket handshake timed out')
+        assert engineIO_packet_type == 0  # engineIO_packet_type == open
+        self._engineIO_session = parse_engineIO_session(engineIO_packet_data)
+        if transport.name == 'websocket':
+            transport.engineIO_session = self._engineIO_session
+            self._transport_instance = transport
+        else:
+            self._transport_instance = await self._negotiate_transport()
+        self.transport_name = self._transport_instance.name
+        self._debug('[engine.io transport selected] %s', self.transport_name)
+        self._stop_tasks()
+        self._tasks = [
+            asyncio.ensure_future(self._send_loop()),
+            asyncio.ensure_future(self._recv_loop()),
+        ]
+
+    async def _open_direct_transport(self, transport):
+        await transport.open()
+        return await transport.recv_packets()
+
+    async def _negotiate_transport(self):
+        transport = AsyncXHR_PollingTransport(
+            self._http_session, self._is_secure, self._url,
+            self._engineIO_session, self._stats)
+        is_ws_client = 'websocket' in self._client_transports
+        is_ws_server = 'websocket' in self._engineIO_session.transport_upgrades
+        if is_ws_client and is_ws_server:
+            ws_transport = AsyncWebsocketTransport(
+                self._http_session, self._is_secure, self._url,
+                self._engineIO_session, self._stats)
+            try:
+                await ws_transport.open()
+                await ws_transport.send_packets([(2, 'probe')])
+                for packet_type, packet_data in (
+                        await ws_transport.recv_packets()):
+                    if packet_type == 3 and packet_data == b'probe':
+                        await ws_transport.send_packets([(5, '')])
+                        transport = ws_transport
+                    else:
+                        self._warn('unexpected engine.io packet')
+            except (TimeoutError, ConnectionError, OSError) as e:
+                self._warn('[engine.io upgrade failed] %s', e)
+            if transport is not ws_transport:
+                await ws_transport.close()
+        return transport
+
+    def _reset_heartbeat(self):
+        self._tasks.append(asyncio.ensure_future(self._heartbeat_loop()))
+        self._debug('[engine.io heartbeat reset]')
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exception_pack):
+        await self.close()
+
+    def __del__(self):
+        pass
+
+    # Act
+
+    def connect(self):
+        'Open the session; return an awaitable that completes when connected'
+        return self._wait_for_transport()
+
+    async def close(self):
+        'Close the session and wait for queued packets to be sent'
+        self._close()
+        await self._drain()
+        self._stop_tasks()
+
+    def _close(self):
+        self._wants_to_close = True
+        self._packet_event.set()
+        if not self._opened:
+            return
+        engineIO_packet_type = 1
+        self._send_packet(engineIO_packet_type)
+        self._opened = False
+
+    def _ping(self, engineIO_packet_data=''):
+        engineIO_packet_type = 2
+        self._ping_time = time.time()
+        self._send_packet(engineIO_packet_type, engineIO_packet_data)
+
+    def _pong(self, engineIO_packet_data=''):
+        engineIO_packet_type = 3
+        self._send_packet(engineIO_packet_type, engineIO_packet_data)
+
+    def _message(
+            self, engineIO_packet_data, with_transport_instance=False,
+            attachments=()):
+        engineIO_packet_type = 4
+        if not with_transport_instance:
+            self._transport
+        if self._stats:
+            self._stats.count_message('sent', len(engineIO_packet_data) + sum(
+                len(x) for x in attachments))
+        self._send_packet(engineIO_packet_type, engineIO_packet_data)
+        for attachment in attachments:
+            self._send_packet(engineIO_packet_type, attachment)
+        self._debug('[socket.io packet queued] %s', engineIO_packet_data)
+
+    def _message_nowait(self, engineIO_packet_data, attachments=()):
+        # The send loop takes packets from a queue without a bound
+        self._message(engineIO_packet_data, attachments=attachments)
+        return True
+
+    def _messages(self, engineIO_packets_data, with_transport_instance=False):
+        'Queue several message packets so that they go out in one write'
+        engineIO_packet_type = 4
+        if not with_transport_instance:
+            self._transport
+        for engineIO_packet_data in engineIO_packets_data:
+            if self._stats:
+                self._stats.count_message('sent', len(engineIO_packet_data))
+            self._send_packet(engineIO_packet_type, engineIO_packet_data)
+        self._debug('[socket.io packets queued] %s', engineIO_packets_data)
+
+    def _send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
+        self._send_queue.put_nowait((
+            engineIO_packet_type, engineIO_packet_data))
+
+    def _drain(self):
+        'Return an awaitable that completes when queued packets are sent'
+        # Share one task among emits; join() also covers later packets
+        if not self._drain_task or self._drain_task.done():
+            self._drain_task = asyncio.ensure_future(self._send_queue.join())
+        # Keep a caller that gives up from cancelling it for the others
+        return asyncio.shield(self._drain_task)
+
+    async def _wait_for_transport(self):
+        self._transport
+        while self._connection_task:
+            await asyncio.shield(self._connection_task)
+
+    # React
+
+    async def wait(self, seconds=None, **kw):
+        'Wait in a loop and react to events as defined in the namespaces'
+        if not self._wants_to_close:
+            self._transport
+        loop = asyncio.get_event_loop()
+        if seconds is not None:
+            deadline = loop.time() + seconds
+        while True:
+            self._packet_event.clear()
+            if self._should_stop_waiting(**kw):
+                break
+            timeout = None if seconds is None else deadline - loop.time()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                await asyncio.wait_for(self._packet_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                break
+
+    async def _send_loop(self):
+        while True:
+            packets = [await self._send_queue.get()]
+            while True:
+                try:
+                    packets.append(self._send_queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await self._transport_instance.send_packets(packets)
+            except (TimeoutError, ConnectionError) as e:
+                self._warn('[packets not sent] %s', e)
+            finally:
+                for packet in packets:
+                    self._send_queue.task_done()
+            if any(packet[0] == 1 for packet in packets):
+                await self._transport_instance.close()
+                return
+
+    async def _recv_loop(self):
+        while not self._wants_to_close:
+            try:
+                transport = self._transport_instance
+                engineIO_packets = await transport.recv_packets()
+            except TimeoutError:
+                continue
+            except ConnectionError as e:
+                if self._wants_to_close:
+                    break
+                self._warn('[connection error] %s', e)
+                self._opened = False
+                self._launch_disconnect_callbacks()
+                self._packet_event.set()
+                try:
+                    await asyncio.sleep(self._get_reconnect_delay(e))
+                except ConnectionError as e:
+                    self._warn('[connection error] %s', e)
+                    break
+                self._transport
+                break
+            for engineIO_packet in engineIO_packets:
+                try:
+                    self._process_packet(engineIO_packet)
+                except PacketError as e:
+                    self._warn('[packet error] %s', e)
+            self._packet_event.set()
+
+    async def _heartbeat_loop(self):
+        ping_interval = self._engineIO_session.ping_interval
+        overdue_in_seconds = (
+            ping_interval + self._engineIO_session.ping_timeout)
+        self._pong_time = time.time()
+        while self._opened:
+            await asyncio.sleep(ping_interval)
+            if time.time() - self._pong_time >= overdue_in_seconds:
+                self._warn(
+                    '[heartbeat timeout] no pong in %s seconds',
+                    overdue_in_seconds)
+                # Wake up the receive loop, which then reconnects
+                await self._transport_instance.close()
+                return
+            self._ping()
+
+    def _on_pong(self, data, namespace):
+        self._pong_time = time.time()
+        super(AsyncEngineIO, self)._on_pong(data, namespace)
+
+    def _stop_tasks(self):
+        current_task = get_current_task()
+        for task in self._tasks:
+            if task is not current_task:
+                task.cancel()
+        self._tasks = []
+
+
+class AsyncSocketIO(AsyncEngineIO, SocketIO):
+    """Create a socket.io client that runs on an asyncio event loop.
+
+    - Define namespaces, handlers and callbacks exactly as with SocketIO.
+    - Methods that send packets return awaitables instead of blocking.
+    - Use transports=['websocket'] to skip the polling handshake.
+    - Options that rely on threads, such as max_workers, outbox and
+      send_window, raise ValueError.
+
+    async with AsyncSocketIO('127.0.0.1', 8000, Namespace) as socketIO:
+        socketIO.emit('aaa', {'xxx': 'yyy'}, on_aaa_response)
+        await socketIO.wait_for_callbacks(seconds=1)
+    """
+
+    def __init__(
+            self, host='127.0.0.1', port=None, Namespace=SocketIONamespace,
+            wait_for_connection=True, transports=TRANSPORTS,
+            resource='socket.io', **kw):
+        self._namespace_by_path = {}
+        self._ack_registry = kw.get('ack_registry')
+        if self._ack_registry is None:
+            self._ack_registry = AckRegistry()
+        self._ack_registry.on_timeout = self._on_ack_timeout
+        self._codec = kw.get('codec') or JSONCodec()
+        self._binary_packet = None
+        super(AsyncSocketIO, self).__init__(
+            host, port, Namespace, wait_for_connection, transports,
+            resource, **kw)
+
+    async def __aexit__(self, *exception_pack):
+        await self.disconnect()
+        await super(AsyncSocketIO, self).__aexit__(*exception_pack)
+
+    # Define
+
+    def define(self, Namespace, path=''):
+        'Define a namespace; wait(for_namespace=namespace) to await its ack'
+        self._namespace_by_path[path] = namespace = Namespace(self, path)
+        if path and self._opened:
+            self.connect(path)
+        return namespace
+
+    async def define_many(self, Namespace_by_path, seconds=None):
+        """Define namespaces, connect them in one write and await them.
+
+        Raise NamespaceError with error_by_path if any of them did not
+        connect within seconds."""
+        await self._wait_for_transport()
+        namespace_by_path, namespaces = self._connect_many(Namespace_by_path)
+        await self.wait(seconds, for_namespaces=namespaces)
+        self._check_namespaces(namespaces)
+        return namespace_by_path
+
+    # Act
+
+    def connect(self, path='', with_transport_instance=False):
+        if not path and not self._opened:
+            return super(AsyncSocketIO, self).connect()
+        socketIO_packet_type = 0
+        self._wants_to_close = False
+        return self._message(
+            self._codec.encode_packet(socketIO_packet_type, path),
+            with_transport_instance)
+
+    def disconnect(self, path=''):
+        super(AsyncSocketIO, self).disconnect(path)
+        return self._drain()
+
+    def emit(self, event, *args, **kw):
+        'Return an awaitable of the ack args if future=True, else of sending'
+        future = super(AsyncSocketIO, self).emit(event, *args, **kw)
+        if future:
+            return asyncio.wrap_future(future)
+        return self._drain()
+
+    async def emit_stream(self, event, chunks, **kw):
+        'Emit chunks as one stream and return its byte count once acked'
+        writer = StreamWriter(self, event, chunks, **kw)
+        futures = deque()
+        try:
+            for chunk in writer.iter_chunks():
+                if len(futures) >= writer.window_size:
+                    await futures.popleft()
+                futures.append(writer.emit_chunk(chunk))
+            if len(futures) >= writer.window_size:
+                await futures.popleft()
+            futures.append(writer.emit_end())
+            while futures:
+                await futures.popleft()
+        except Exception as e:
+            writer.abort(e)
+            raise
+        return writer.byte_count
+
+    def _make_stream_reader(self, namespace, event, timeout_in_seconds):
+        return AsyncStreamReader(namespace, event, timeout_in_seconds)
+
+    def _set_ack_callback(
+            self, callback, future=None, timeout_in_seconds=None, block=True):
+        # Waiting for room would block the loop that receives the acks
+        self._ack_loop = asyncio.get_event_loop()
+        return self._ack_registry.add(
+            callback, future, timeout_in_seconds, block=False)
+
+    def _on_ack_timeout(self, entry):
+        self._warn('[socket.io ack timed out] %s', entry.ack_id)
+        # The ack timer runs in its own thread
+        self._ack_loop.call_soon_threadsafe(self._packet_event.set)
+
+    # React
+
+    async def wait_for_callbacks(self, seconds=None):
+        await self.wait(seconds, for_callbacks=True)
+
+
+class AsyncStreamReader(StreamReader):
+    """Iterate over the chunks of the next stream with async for.
+
+    async for chunk in socketIO.iter_stream('download'):
+        f.write(chunk)
+    """
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._is_finished:
+            raise StopAsyncIteration
+        item, future = self._pop()
+        if future:
+            await self._namespace._io.wait(
+                self.timeout_in_seconds, for_future=future)
+            item = self._pop_after_wait()
+        try:
+            return self._take(item)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def __next__(self):
+        raise TypeError('use async for to read a stream on AsyncSocketIO')
+
+    next = __next__
+
+
+class AbstractAsyncTransport(object):
+
+    __slots__ = (
+        'http_session', 'is_secure', 'url', 'engineIO_session', '_stats',
+        '_http_url', '_host', '_port', '_ssl_context')
+    name = None
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None,
+            stats=None):
+        self.http_session = http_session
+        self.is_secure = is_secure
+        self.url = url
+        self.engineIO_session = engineIO_session
+        self._stats = stats
+        http_scheme = 'https' if is_secure else 'http'
+        self._http_url = '%s://%s/' % (http_scheme, url)
+        url_pack = parse_url(self._http_url)
+        self._host = url_pack.hostname
+        self._port = url_pack.port or (443 if is_secure else 80)
+        self._ssl_context = _get_ssl_context(
+            http_session) if is_secure else None
+
+    async def recv_packets(self):
+        return []
+
+    async def send_packets(self, engineIO_packets):
+        pass
+
+    async def close(self):
+        pass
+
+    def _prepare_request(self, method, params, data=None):
+        'Let requests merge session headers, cookies, auth and params'
+        params = dict(params, EIO=ENGINEIO_PROTOCOL)
+        if self.engineIO_session:
+            params['sid'] = self.engineIO_session.id
+        request = self.http_session.prepare_request(requests.Request(
+            method, self._http_url, params=params, data=data))
+        headers = dict(request.headers)
+        headers['Host'] = '%s:%s' % (self._host, self._port)
+        headers['Accept-Encoding'] = 'identity'
+        return request.path_url, headers, request.body
+
+    def _save_cookies(self, response_headers):
+        'Send cookies that the server set, such as sticky session cookies'
+        if 'set-cookie' not in response_headers:
+            return
+        request = requests.Request('GET', self._http_url)
+        self.http_session.cookies.extract_cookies(
+            MockResponse(response_headers), MockRequest(request))
+
+    def _count_packets(self, direction, engineIO_packets, seconds):
+        stats = self._stats
+        operation = 'send_packet' if direction == 'sent' else 'recv_packet'
+        stats.time_transport(self.name, operation, seconds)
+        for packet_type, packet_data in engineIO_packets:
+            stats.count_packet(
+                self.name, direction, packet_type, len(packet_data) + 1)
+
+    async def _open_connection(self):
+        try:
+            return await asyncio.open_connection(
+                self._host, self._port, ssl=self._ssl_context)
+        except (OSError, ssl.SSLError) as e:
+            raise ConnectionError(e)
+
+
+class AsyncXHR_PollingTransport(AbstractAsyncTransport):
+
+    __slots__ = '_timeout', '_get_connection', '_post_connection'
+    name = 'xhr-polling'
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None,
+            stats=None):
+        super(AsyncXHR_PollingTransport, self).__init__(
+            http_session, is_secure, url, engineIO_session, stats)
+        self._timeout = engineIO_session.ping_timeout if (
+            engineIO_session) else None
+        # Long polls and posts overlap, so each gets its own connection
+        self._get_connection = _HTTPConnection(self)
+        self._post_connection = _HTTPConnection(self)
+
+    async def recv_packets(self):
+        start_time = default_timer()
+        content = await self._get_connection.request(
+            'GET', {'transport': 'polling'}, timeout=self._timeout)
+        engineIO_packets = list(decode_engineIO_content(content))
+        if self._stats:
+            self._count_packets(
+                'received', engineIO_packets, default_timer() - start_time)
+        return engineIO_packets
+
+    async def send_packets(self, engineIO_packets):
+        start_time = default_timer()
+        await self._post_connection.request(
+            'POST', {'transport': 'polling'},
+            bytes(encode_engineIO_content(engineIO_packets)),
+            timeout=self._timeout)
+        if self._stats:
+            self._count_packets(
+                'sent', engineIO_packets, default_timer() - start_time)
+
+    async def close(self):
+        self._get_connection.close()
+        self._post_connection.close()
+
+
+class AsyncWebsocketTransport(AbstractAsyncTransport):
+
+    __slots__ = '_reader', '_writer'
+    name = 'websocket'
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None,
+            stats=None):
+        super(AsyncWebsocketTransport, self).__init__(
+            http_session, is_secure, url, engineIO_session, stats)
+        self._reader = self._writer = None
+
+    async def open(self):
+        self._reader, self._writer = await self._open_connection()
+        path_url, headers, body = self._prepare_request(
+            'GET', {'transport': 'websocket'})
+        key = base64.b64encode(os.urandom(16))
+        headers.update({
+            'Upgrade': 'websocket',
+            'Connection': 'Upgrade',
+            'Sec-WebSocket-Key': key.decode('ascii'),
+            'Sec-WebSocket-Version': '13',
+        })
+        self._writer.write(_format_http_head('GET', path_url, headers))
+        try:
+            status_code, response_headers = await _read_http_head(
+                self._reader)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise ConnectionError(e)
+        self._save_cookies(response_headers)
+        accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_GUID).digest())
+        if status_code != 101 or response_headers.get(
+                'sec-websocket-accept', '').encode('ascii') != accept:
+            self._writer.close()
+            raise ConnectionError(
+                'unexpected websocket handshake (%s)' % status_code)
+
+    async def recv_packets(self):
+        start_time = default_timer()
+        try:
+            opcode, packet_text = await self._recv_message()
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise ConnectionError('recv disconnected (%s)' % e)
+        if opcode == 0x2:
+            engineIO_packets = [(packet_text[0], packet_text[1:])]
+        else:
+            engineIO_packets = [parse_packet_text(packet_text)]
+        if self._stats:
+            self._count_packets(
+                'received', engineIO_packets, default_timer() - start_time)
+        return engineIO_packets
+
+    async def send_packets(self, engineIO_packets):
+        start_time = default_timer()
+        try:
+            for packet_type, packet_data in engineIO_packets:
+                opcode = 0x2 if is_binary(packet_data) else 0x1
+                self._send_frame(opcode, format_packet_text(
+                    packet_type, packet_data))
+            await self._writer.drain()
+        except OSError as e:
+            raise ConnectionError('send disconnected (%s)' % e)
+        if self._stats:
+            self._count_packets(
+                'sent', engineIO_packets, default_timer() - start_time)
+
+    async def close(self):
+        try:
+            self._send_frame(0x8, b'')
+            self._writer.close()
+        except (OSError, AttributeError):
+            pass
+
+    async def _recv_message(self):
+        parts = []
+        message_opcode = None
+        while True:
+            head = await self._reader.readexactly(2)
+            is_final, opcode = head[0] & 0x80, head[0] & 0x0f
+            length = head[1] & 0x7f
+            if length == 126:
+                length = struct.unpack(
+                    '!H', await self._reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack(
+                    '!Q', await self._reader.readexactly(8))[0]
+            payload = await self._reader.readexactly(length)
+            if opcode == 0x8:
+                raise ConnectionError('recv disconnected (close frame)')
+            if opcode == 0x9:
+                self._send_frame(0xa, payload)
+                continue
+            if opcode == 0xa:
+                continue
+            if message_opcode is None:
+                message_opcode = opcode
+            parts.append(payload)
+            if is_final:
+                return message_opcode, b''.join(parts)
+
+    def _send_frame(self, opcode, payload):
+        mask = os.urandom(4)
+        length = len(payload)
+        masks = (mask * (length // 4 + 1))[:length]
+        header = bytearray([0x80 | opcode])
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 65536:
+            header.append(0x80 | 126)
+            header.extend(struct.pack('!H', length))
+        else:
+            header.append(0x80 | 127)
+            header.extend(struct.pack('!Q', length))
+        header.extend(mask)
+        masked = int.from_bytes(payload, 'big') ^ int.from_bytes(masks, 'big')
+        self._writer.write(bytes(header) + masked.to_bytes(length, 'big'))
+
+
+class _HTTPConnection(object):
+    'Reuse one keep-alive HTTP/1.1 connection for sequential requests'
+
+    __slots__ = '_transport', '_reader', '_writer'
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._reader = self._writer = None
+
+    async def request(self, method, params, data=None, timeout=None):
+        try:
+            return await asyncio.wait_for(
+                self._request(method, params, data), timeout)
+        except asyncio.TimeoutError as e:
+            self.close()
+            raise TimeoutError('%s timed out (%s)' % (method, e))
+        except (OSError, asyncio.IncompleteReadError) as e:
+            self.close()
+            raise ConnectionError(e)
+
+    async def _request(self, method, params, data):
+        if not self._writer:
+            self._reader, self._writer = (
+                await self._transport._open_connection())
+        path_url, headers, body = self._transport._prepare_request(
+            method, params, data)
+        if body:
+            headers['Content-Type'] = 'application/octet-stream'
+        self._writer.write(_format_http_head(
+            method, path_url, headers) + (body or b''))
+        status_code, response_headers = await _read_http_head(self._reader)
+        self._transport._save_cookies(response_headers)
+        if 'chunked' in response_headers.get('transfer-encoding', ''):
+            content = await _read_chunked_body(self._reader)
+        elif 'content-length' in response_headers:
+            content = await self._reader.readexactly(
+                int(response_headers['content-length']))
+        else:
+            content = await self._reader.read()
+            self.close()
+        if response_headers.get('connection', '').lower() == 'close':
+            self.close()
+        if 200 != status_code:
+            raise ConnectionError('unexpected status code (%s %s)' % (
+                status_code, content))
+        return content
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+def _format_http_head(method, path_url, headers):
+    lines = ['%s %s HTTP/1.1' % (method, path_url)]
+    lines.extend('%s: %s' % x for x in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def _read_http_head(reader):
+    'Return the status code and headers, keeping repeated Set-Cookie lines'
+    head = await reader.readuntil(b'\r\n\r\n')
+    status_line, header_lines = head.split(b'\r\n', 1)
+    status_code = int(status_line.split(b' ')[1])
+    headers = http.client.parse_headers(BytesIO(header_lines))
+    return status_code, headers
+
+
+async def _read_chunked_body(reader):
+    chunks = []
+    while True:
+        size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+        if not size:
+            await reader.readuntil(b'\r\n')
+            return b''.join(chunks)
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+
+
+def _get_ssl_context(http_session):
+    if not http_session.verify:
+        ssl_context = ssl.create_default_context()
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+    if http_session.verify is True:
+        ssl_context = ssl.create_default_context()
+    else:  # Specify certificate path on disk
+        ssl_context = ssl.create_default_context(cafile=http_session.verify)
+    if http_session.cert:
+        if isinstance(http_session.cert, str):
+            ssl_context.load_cert_chain(http_session.cert)
+        else:
+            ssl_context.load_cert_chain(*http_session.cert)
+    return ssl_context
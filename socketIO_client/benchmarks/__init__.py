@@ -0,0 +1,7 @@
+"""Measure client performance without network or external services.
+
+python -m socketIO_client.benchmarks -o results.json
+python -m socketIO_client.benchmarks.parsers
+python -m socketIO_client.benchmarks.dispatch
+python -m socketIO_client.benchmarks.logs
+"""
@@ -0,0 +1,45 @@
+"""Run benchmark scenarios and save the results as JSON.
+
+python -m socketIO_client.benchmarks
+python -m socketIO_client.benchmarks ack_latency -o results-0.8.json
+"""
+import json
+import platform
+import sys
+import time
+from argparse import ArgumentParser
+
+from .. import __version__
+from .scenarios import SCENARIOS, run_scenarios
+
+
+def main(argv=None):
+    argument_parser = ArgumentParser(prog='socketIO_client.benchmarks')
+    argument_parser.add_argument(
+        'scenario_names', nargs='*', metavar='scenario',
+        help='one or more of %s' % ', '.join(sorted(SCENARIOS)))
+    argument_parser.add_argument(
+        '-o', '--output', help='write results to this JSON file')
+    args = argument_parser.parse_args(argv)
+    scenario_names = args.scenario_names or sorted(SCENARIOS)
+    for scenario_name in scenario_names:
+        if scenario_name not in SCENARIOS:
+            argument_parser.error('unknown scenario (%s)' % scenario_name)
+    report = {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'results': run_scenarios(scenario_names),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(text + '\n')
+    else:
+        sys.stdout.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""Compare event dispatch against the 0.7 lookup.
+
+python -m socketIO_client.benchmarks.dispatch
+"""
+import timeit
+
+from .. import SocketIO
+from ..namespaces import SocketIONamespace
+
+
+EVENT_COUNT = 100000
+
+
+class BenchmarkNamespace(SocketIONamespace):
+
+    def on_aaa(self, *args):
+        pass
+
+
+class BenchmarkSocketIO(SocketIO):
+    'Dispatch without connecting to a server'
+    _url = 'benchmark'
+
+    def __init__(self):
+        pass
+
+    def __del__(self):
+        pass
+
+
+def make_namespace():
+    namespace = BenchmarkNamespace(BenchmarkSocketIO(), '')
+    namespace.on('bbb', lambda *args: None)
+    return namespace
+
+
+def measure_dispatch(dispatch, namespace, event, event_count, repeat=3):
+    'Return events per second'
+    seconds = min(timeit.repeat(
+        lambda: dispatch(namespace, event, event_count),
+        number=1, repeat=repeat))
+    return event_count / seconds
+
+
+def dispatch_events(namespace, event, event_count):
+    socketIO = namespace._io
+    for i in range(event_count):
+        getattr(socketIO, socketIO._socketIO_delegate_name_by_packet_type[2])
+        namespace._find_packet_callback(event)({'xxx': 'yyy'})
+
+
+def dispatch_events_uncached(namespace, event, event_count):
+    'Dispatch the way 0.7 did, building delegates and looking up handlers'
+    socketIO = namespace._io
+    for i in range(event_count):
+        {
+            0: socketIO._on_connect,
+            1: socketIO._on_disconnect,
+            2: socketIO._on_event,
+            3: socketIO._on_ack,
+            4: socketIO._on_error,
+            5: socketIO._on_binary_event,
+            6: socketIO._on_binary_ack,
+        }[2]
+        find_packet_callback_uncached(namespace, event)({'xxx': 'yyy'})
+
+
+def find_packet_callback_uncached(namespace, event):
+    try:
+        callback = namespace._callback_by_event[event]
+    except KeyError:
+        pass
+    else:
+        return callback
+    return getattr(
+        namespace, 'on_' + event.replace(' ', '_'),
+        lambda *args: namespace.on_event(event, *args))
+
+
+def run_dispatch(event_count=EVENT_COUNT):
+    results = []
+    for handler_name, event in [
+        ('on', 'bbb'),
+        ('method', 'aaa'),
+        ('on_event', 'ccc'),
+    ]:
+        namespace = make_namespace()
+        old_rate = measure_dispatch(
+            dispatch_events_uncached, namespace, event, event_count)
+        new_rate = measure_dispatch(
+            dispatch_events, namespace, event, event_count)
+        results.append({
+            'handler': handler_name,
+            'old_events_per_second': old_rate,
+            'new_events_per_second': new_rate,
+            'speedup': new_rate / old_rate,
+        })
+    return results
+
+
+def main():
+    for result in run_dispatch():
+        print(
+            '%(handler)8s  old %(old_events_per_second)10.0f events/s  '
+            'new %(new_events_per_second)10.0f events/s  '
+            '%(speedup).1fx' % result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compare logging with disabled levels against the 0.7 logging.
+
+python -m socketIO_client.benchmarks.logs
+"""
+import logging
+import timeit
+
+from ..logs import L, LoggingMixin
+from ..namespaces import LoggingSocketIONamespace, make_logging_prefix
+from .dispatch import BenchmarkSocketIO
+
+
+PAYLOAD_SIZES = 100, 10000, 100000
+CALL_COUNT = 1000
+
+
+class BenchmarkLogger(LoggingMixin):
+    _log_name = 'benchmark'
+
+    def _skip(self, msg, *attrs):
+        pass
+
+
+def measure_call(call, call_count, repeat=3):
+    'Return nanoseconds per call'
+    seconds = min(timeit.repeat(
+        lambda: [call() for x in range(call_count)],
+        number=1, repeat=repeat))
+    return 1e9 * seconds / call_count
+
+
+def run_logs(payload_sizes=PAYLOAD_SIZES, call_count=CALL_COUNT):
+    logger = BenchmarkLogger()
+    namespace = LoggingSocketIONamespace(BenchmarkSocketIO(), '/chat')
+    level = L.level
+    L.setLevel(logging.WARNING)
+    try:
+        results = []
+        for payload_size in payload_sizes:
+            payload = 'x' * payload_size
+            args = {'xxx': payload}, [payload]
+            results.append({
+                'payload_size': payload_size,
+                'skip_ns': measure_call(lambda: logger._skip(
+                    '[socket.io packet sent] %s', payload), call_count),
+                'old_debug_ns': measure_call(lambda: log_eagerly(
+                    logger, logging.DEBUG, '[socket.io packet sent] %s',
+                    payload), call_count),
+                'new_debug_ns': measure_call(lambda: logger._debug(
+                    '[socket.io packet sent] %s', payload), call_count),
+                'old_event_ns': measure_call(lambda: log_event_eagerly(
+                    namespace, 'aaa', *args), call_count),
+                'new_event_ns': measure_call(lambda: namespace.on_event(
+                    'aaa', *args), call_count),
+            })
+    finally:
+        L.setLevel(level)
+    return results
+
+
+def log_eagerly(logger, level, msg, *attrs):
+    'Log the way 0.7 did, building the message before checking the level'
+    L.log(level, '%s %s' % (logger._log_name, msg), *attrs)
+
+
+def log_event_eagerly(namespace, event, *args):
+    'Log the way 0.7 did, formatting every argument with repr()'
+    arguments = [repr(_) for _ in args]
+    log_eagerly(
+        namespace, logging.INFO, '%s[socket.io event] %s(%s)',
+        make_logging_prefix(namespace.path), event, ', '.join(arguments))
+
+
+def main():
+    for result in run_logs():
+        print(
+            '%(payload_size)8d chars  debug old %(old_debug_ns)6.0fns '
+            'new %(new_debug_ns)6.0fns  event old %(old_event_ns)10.0fns '
+            'new %(new_event_ns)6.0fns  no-op call %(skip_ns)6.0fns' % result)
+
+
+if __name__ == '__main__':
+    main()
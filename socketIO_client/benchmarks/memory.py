@@ -0,0 +1,160 @@
+"""Compare memory per queued packet and per client against objects with a
+__dict__, and measure clients connected to a local stand-in server.
+
+python -m socketIO_client.benchmarks.memory
+"""
+from six.moves import socketserver
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from .. import SocketIO
+from ..namespaces import SocketIONamespace
+from ..parsers import encode_engineIO_packet_data
+from ..transports import WebsocketTransport, _QueuedPacket
+from . import servers
+from .servers import LocalServer
+
+
+CLIENT_COUNT = 10000
+CONNECTED_CLIENT_COUNT = 100
+PACKET_COUNT = 10000
+TRACEBACK_LIMIT = 25
+# Namespaces keep __dict__ so that subclasses can set their own attributes
+SLOT_NOTES = {
+    'SocketIONamespace': 'keeps __dict__ and __weakref__ for subclasses',
+}
+
+
+def measure_allocation(make, count):
+    'Return bytes that each of count objects keeps allocated'
+    tracemalloc.start()
+    try:
+        objects = [make() for x in range(count)]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del objects
+    return size / float(count)
+
+
+def measure_slots(Class, count):
+    'Return bytes per instance of Class with a __dict__ and with __slots__'
+    names = get_slot_names(Class)
+    # Use a class per measurement so that instances share dictionary keys
+    DictClass = type('Dict' + Class.__name__, (object,), {})
+
+    def make_instance(InstanceClass):
+        x = InstanceClass.__new__(InstanceClass)
+        for name in names:
+            setattr(x, name, None)
+        return x
+
+    return (
+        measure_allocation(lambda: make_instance(DictClass), count),
+        measure_allocation(lambda: make_instance(Class), count))
+
+
+def measure_queued_packets(count):
+    'Return bytes per queued emit packet with a __dict__ and with __slots__'
+    DictQueuedPacket = type('DictQueuedPacket', (object,), {
+        '__init__': _QueuedPacket.__dict__['__init__']})
+
+    def make_packet(PacketClass):
+        # Build the data of each packet so that it counts too
+        return PacketClass(4, encode_engineIO_packet_data(
+            '2["bbb",{"xxx":"%s"}]' % ('y' * 10)))
+
+    return (
+        measure_allocation(lambda: make_packet(DictQueuedPacket), count),
+        measure_allocation(lambda: make_packet(_QueuedPacket), count))
+
+
+def measure_connected_clients(server, count):
+    'Return bytes that each idle websocket client keeps, without the server'
+    tracemalloc.start(TRACEBACK_LIMIT)
+    socketIOs = []
+    try:
+        for x in range(count):
+            socketIOs.append(SocketIO(
+                server.host, server.port, transports=['websocket']))
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        for socketIO in socketIOs:
+            socketIO.disconnect()
+    # The server runs in this process, so skip what its threads allocate
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(
+        False, x.__file__, all_frames=True) for x in (
+        servers, socketserver)])
+    size = sum(x.size for x in snapshot.traces)
+    return size / float(count)
+
+
+def get_slot_names(Class):
+    names = []
+    for BaseClass in reversed(Class.__mro__):
+        slots = BaseClass.__dict__.get('__slots__', ())
+        if isinstance(slots, str):
+            slots = slots,
+        names.extend(x for x in slots if x not in (
+            '__dict__', '__weakref__'))
+    return names
+
+
+def run_memory(
+        server=None, client_count=CLIENT_COUNT, packet_count=PACKET_COUNT,
+        connected_client_count=CONNECTED_CLIENT_COUNT):
+    """Return bytes per object, first for bare objects without the values
+    that they refer to and then for whole packets and connected clients"""
+    if server is None:
+        with LocalServer() as server:
+            return run_memory(
+                server, client_count, packet_count, connected_client_count)
+    results = []
+    for Class, count in [
+        (_QueuedPacket, packet_count),
+        (SocketIONamespace, client_count),
+        (WebsocketTransport, client_count),
+    ]:
+        old_bytes, new_bytes = measure_slots(Class, count)
+        results.append({
+            'object': Class.__name__,
+            'count': count,
+            'old_bytes': old_bytes,
+            'new_bytes': new_bytes,
+            'note': SLOT_NOTES.get(Class.__name__, 'bare object'),
+        })
+    old_bytes, new_bytes = measure_queued_packets(packet_count)
+    results.append({
+        'object': 'queued packet',
+        'count': packet_count,
+        'old_bytes': old_bytes,
+        'new_bytes': new_bytes,
+        'note': 'with its packet data',
+    })
+    # A connected client has no twin with a __dict__ to compare against
+    results.append({
+        'object': 'connected client',
+        'count': connected_client_count,
+        'old_bytes': None,
+        'new_bytes': measure_connected_clients(
+            server, connected_client_count),
+        'note': 'idle websocket client with its session and socket',
+    })
+    return results
+
+
+def main():
+    for result in run_memory():
+        line = '%(object)20s  x%(count)-6d' % result
+        if result['old_bytes'] is not None:
+            line += '  old %(old_bytes)8.1f bytes' % result
+        else:
+            line += '  %18s' % ''
+        print(line + '  new %(new_bytes)8.1f bytes  %(note)s' % result)
+
+
+if __name__ == '__main__':
+    main()
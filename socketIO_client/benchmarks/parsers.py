@@ -0,0 +1,174 @@
+"""Compare the engine.io payload codec against the 0.7 codec.
+
+python -m socketIO_client.benchmarks.parsers
+"""
+import timeit
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from ..parsers import (
+    decode_engineIO_content, decode_engineIO_packet_views,
+    encode_engineIO_content, format_packet_text, parse_packet_text)
+from ..symmetries import get_byte
+
+
+CONTENT_SIZES = 1000, 100000, 10000000
+PACKET_SIZE = 100
+SMALL_PACKET_SIZE = 20
+LARGE_PACKET_SIZE = 1000000
+
+
+def make_packets(content_size, packet_size=PACKET_SIZE):
+    'Make enough message packets to fill content_size bytes'
+    packet_data = '2["x",%s]' % ('"%s"' % ('x' * max(0, packet_size - 12)))
+    packet_count = max(1, content_size // (len(packet_data) + 6))
+    return [(4, packet_data)] * packet_count
+
+
+def make_content(content_size, packet_size=PACKET_SIZE):
+    return bytes(encode_engineIO_content(make_packets(
+        content_size, packet_size)))
+
+
+def measure_decoder(decode, content, repeat=3):
+    return min(timeit.repeat(
+        lambda: list(decode(content)), number=1, repeat=repeat))
+
+
+def measure_encoder(encode, packets, repeat=3):
+    return min(timeit.repeat(
+        lambda: encode(packets), number=1, repeat=repeat))
+
+
+def measure_encoder_allocation(encode, packets):
+    'Return peak bytes allocated while encoding per byte of content'
+    tracemalloc.start()
+    try:
+        content_size = len(encode(packets))
+        peak_size = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak_size / float(content_size)
+
+
+def run_decoders(content_sizes=CONTENT_SIZES):
+    results = []
+    for content_size in content_sizes:
+        content = make_content(content_size)
+        old_seconds = measure_decoder(
+            decode_engineIO_content_bytewise, content)
+        new_seconds = measure_decoder(decode_engineIO_content, content)
+        view_seconds = measure_decoder(decode_engineIO_packet_views, content)
+        results.append({
+            'content_size': len(content),
+            'old_seconds': old_seconds,
+            'new_seconds': new_seconds,
+            'view_seconds': view_seconds,
+            'speedup': old_seconds / new_seconds,
+        })
+    return results
+
+
+def run_encoders(content_sizes=CONTENT_SIZES, packet_sizes=(
+        SMALL_PACKET_SIZE, PACKET_SIZE, LARGE_PACKET_SIZE)):
+    results = []
+    for packet_size in packet_sizes:
+        for content_size in content_sizes:
+            if content_size < packet_size:
+                continue
+            results.append(run_encoder(content_size, packet_size))
+    return results
+
+
+def run_encoder(content_size, packet_size):
+    text_packets = make_packets(content_size, packet_size)
+    # Send pre-encoded bytes to skip UTF-8 encoding in the new encoder
+    byte_packets = [(packet_type, packet_data.encode('utf-8')) for (
+        packet_type, packet_data) in text_packets]
+    old_seconds = measure_encoder(
+        encode_engineIO_content_concatenated, text_packets)
+    new_seconds = measure_encoder(encode_engineIO_content, text_packets)
+    bytes_seconds = measure_encoder(encode_engineIO_content, byte_packets)
+    result = {
+        'content_size': len(encode_engineIO_content(text_packets)),
+        'packet_size': packet_size,
+        'old_seconds': old_seconds,
+        'new_seconds': new_seconds,
+        'bytes_seconds': bytes_seconds,
+        'speedup': old_seconds / new_seconds,
+    }
+    if tracemalloc:
+        result['old_allocation'] = measure_encoder_allocation(
+            encode_engineIO_content_concatenated, text_packets)
+        result['new_allocation'] = measure_encoder_allocation(
+            encode_engineIO_content, text_packets)
+        result['bytes_allocation'] = measure_encoder_allocation(
+            encode_engineIO_content, byte_packets)
+    return result
+
+
+def decode_engineIO_content_bytewise(content):
+    'Decode the way 0.7 did, reading the length header one byte at a time'
+    content_index = 0
+    content_length = len(content)
+    while content_index < content_length:
+        try:
+            while get_byte(content, content_index) != 0:
+                content_index += 1
+            content_index += 1
+            packet_length_string = ''
+            byte = get_byte(content, content_index)
+            while byte != 255:
+                packet_length_string += str(byte)
+                content_index += 1
+                byte = get_byte(content, content_index)
+        except IndexError:
+            break
+        while get_byte(content, content_index) == 255:
+            content_index += 1
+        packet_length = int(packet_length_string)
+        packet_text = content[content_index:content_index + packet_length]
+        content_index += packet_length
+        yield parse_packet_text(packet_text)
+
+
+def encode_engineIO_content_concatenated(engineIO_packets):
+    'Encode the way 0.7 did, concatenating a prefix onto each packet'
+    content = bytearray()
+    for packet_type, packet_data in engineIO_packets:
+        packet_text = format_packet_text(packet_type, packet_data)
+        length_string = str(len(packet_text))
+        header_digits = bytearray([0])
+        for i in range(len(length_string)):
+            header_digits.append(ord(length_string[i]) - 48)
+        header_digits.append(255)
+        content.extend(header_digits + packet_text)
+    return content
+
+
+def main():
+    print('decode')
+    for result in run_decoders():
+        print(
+            '%(content_size)10d bytes  old %(old_seconds).6fs  '
+            'new %(new_seconds).6fs  %(speedup).1fx  '
+            'views %(view_seconds).6fs' % result)
+    print('encode')
+    for result in run_encoders():
+        line = (
+            '%(content_size)10d bytes in %(packet_size)7d byte packets  '
+            'old %(old_seconds).6fs  '
+            'new %(new_seconds).6fs  %(speedup).1fx  '
+            'bytes %(bytes_seconds).6fs' % result)
+        if 'new_allocation' in result:
+            line += (
+                '  peak bytes per byte old %(old_allocation).2f '
+                'new %(new_allocation).2f '
+                'bytes %(bytes_allocation).2f' % result)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""Measure the client against a local stand-in server.
+
+Each scenario returns results that json.dumps can save.
+"""
+import time
+from timeit import default_timer
+
+from .. import SocketIO
+try:
+    from ..managers import SocketIOManager
+except ImportError:
+    SocketIOManager = None
+from .dispatch import run_dispatch
+from .logs import run_logs
+from .memory import run_memory, tracemalloc
+from .parsers import run_decoders, run_encoders
+from .servers import PAYLOAD, LocalServer
+
+
+TRANSPORT_PACKS = {
+    'xhr-polling': ['xhr-polling'],
+    'websocket': ['xhr-polling', 'websocket'],
+    'websocket-direct': ['websocket'],
+}
+
+
+def run_emit_throughput(server, transport_name, event_count=1000):
+    'Count events per second that one client can emit without acks'
+    with _connect(server, transport_name) as socketIO:
+        start_time = default_timer()
+        for x in range(event_count):
+            socketIO.emit('bbb', PAYLOAD)
+        # Wait for the server to acknowledge the last event
+        socketIO.emit('emit_with_callback', lambda *args: None)
+        socketIO.wait_for_callbacks(seconds=10)
+        seconds = default_timer() - start_time
+    return {
+        'transport': transport_name,
+        'event_count': event_count,
+        'seconds': seconds,
+        'events_per_second': event_count / seconds,
+    }
+
+
+def run_ack_latency(server, transport_name, ack_count=200):
+    'Time round trips from emit to ack callback'
+    latencies = []
+    with _connect(server, transport_name) as socketIO:
+        for x in range(ack_count):
+            start_time = default_timer()
+            socketIO.emit('emit_with_callback', lambda *args: None)
+            socketIO.wait_for_callbacks(seconds=10)
+            latencies.append(default_timer() - start_time)
+    result = {'transport': transport_name, 'ack_count': ack_count}
+    result.update(summarize(latencies))
+    return result
+
+
+def run_connect_time(server, transport_name, connect_count=20):
+    'Time the handshake, transport upgrade and namespace connect'
+    latencies = []
+    for x in range(connect_count):
+        start_time = default_timer()
+        socketIO = _connect(server, transport_name)
+        latencies.append(default_timer() - start_time)
+        socketIO.disconnect()
+    result = {'transport': transport_name, 'connect_count': connect_count}
+    result.update(summarize(latencies))
+    return result
+
+
+def run_reconnect_storm(server, client_count=100, timeout_in_seconds=60):
+    'Drop every session at once and time until all clients are back'
+    if SocketIOManager:
+        manager = SocketIOManager().start()
+        kw = dict(manager=manager)
+    else:
+        manager = None
+        kw = dict(max_workers=1)
+    socketIOs = [_connect(
+        server, 'websocket', **kw) for x in range(client_count)]
+    try:
+        old_session_ids = [x._engineIO_session.id for x in socketIOs]
+        start_time = default_timer()
+        server.drop_sessions()
+        end_time = start_time + timeout_in_seconds
+        while default_timer() < end_time:
+            waiting_count = sum(1 for socketIO, old_session_id in zip(
+                socketIOs, old_session_ids
+            ) if not socketIO.connected or (
+                socketIO._engineIO_session.id == old_session_id))
+            if not waiting_count:
+                break
+            time.sleep(0.01)
+        seconds = default_timer() - start_time
+    finally:
+        for socketIO in socketIOs:
+            socketIO.disconnect()
+        if manager:
+            manager.stop()
+    return {
+        'client_count': client_count,
+        'reconnected_count': client_count - waiting_count,
+        'seconds': seconds,
+    }
+
+
+def run_parsers():
+    'Run the payload codec comparison on sizes that finish quickly'
+    return {
+        'decode': run_decoders((1000, 100000)),
+        'encode': run_encoders((1000, 100000), (100,)),
+    }
+
+
+def run_dispatch_scenario():
+    'Run the event dispatch comparison'
+    return run_dispatch(10000)
+
+
+def run_logs_scenario():
+    'Run the disabled logging comparison'
+    return run_logs((100, 10000), 1000)
+
+
+def run_memory_scenario(server):
+    'Run the memory comparison if tracemalloc is available'
+    return run_memory(server) if tracemalloc else []
+
+
+def run_scenarios(scenario_names, server=None):
+    'Return results by scenario name, starting a local server if needed'
+    if server is None:
+        with LocalServer() as server:
+            return run_scenarios(scenario_names, server)
+    results = {}
+    for scenario_name in scenario_names:
+        if scenario_name == 'parsers':
+            results[scenario_name] = run_parsers()
+        elif scenario_name == 'dispatch':
+            results[scenario_name] = run_dispatch_scenario()
+        elif scenario_name == 'logs':
+            results[scenario_name] = run_logs_scenario()
+        elif scenario_name == 'memory':
+            results[scenario_name] = run_memory_scenario(server)
+        elif scenario_name == 'reconnect_storm':
+            results[scenario_name] = [run_reconnect_storm(server)]
+        else:
+            run = SCENARIOS[scenario_name]
+            results[scenario_name] = [run(
+                server, transport_name) for transport_name in sorted(
+                TRANSPORT_PACKS)]
+    return results
+
+
+def summarize(latencies):
+    'Return the mean and percentiles of latencies in milliseconds'
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def get_percentile(percent):
+        return 1000 * latencies[int(round(percent / 100. * (count - 1)))]
+
+    return {
+        'mean_ms': 1000 * sum(latencies) / count,
+        'p50_ms': get_percentile(50),
+        'p90_ms': get_percentile(90),
+        'p99_ms': get_percentile(99),
+        'max_ms': 1000 * latencies[-1],
+    }
+
+
+def _connect(server, transport_name, **kw):
+    socketIO = SocketIO(
+        server.host, server.port, transports=TRANSPORT_PACKS[transport_name],
+        wait_for_connection=False, **kw)
+    # Measure the websocket rather than the polling it starts on
+    socketIO._wait_for_upgrade()
+    return socketIO
+
+
+SCENARIOS = {
+    'emit_throughput': run_emit_throughput,
+    'ack_latency': run_ack_latency,
+    'connect_time': run_connect_time,
+    'reconnect_storm': run_reconnect_storm,
+    'parsers': run_parsers,
+    'dispatch': run_dispatch_scenario,
+    'logs': run_logs_scenario,
+    'memory': run_memory_scenario,
+}
@@ -0,0 +1,541 @@
+"""Serve engine.io and socket.io from a local thread for benchmarks.
+
+The server speaks engine.io protocol 3 over xhr-polling and websocket and
+answers the same socket.io events as tests/serve.js.
+
+with LocalServer() as server:
+    SocketIO(server.host, server.port)
+"""
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import uuid
+import zlib
+from six.moves import queue, socketserver
+from six.moves.urllib.parse import parse_qs, urlparse as parse_url
+
+from ..compressions import DEFLATE_TRAILER, MAX_WINDOW_BITS, parse_extension
+from ..parsers import (
+    BinaryData, decode_engineIO_content, encode_engineIO_content)
+from ..symmetries import get_byte
+
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+PAYLOAD = {'xxx': 'yyy'}
+UNICODE_PAYLOAD = {u'인삼': u'★ 뿌리 ★'}
+BINARY_PAYLOAD = {'data': b'\xff\xff\xff', 'array': [b'\xee', b'\xdd']}
+
+
+class LocalServer(object):
+    """Serve engine.io and socket.io on a local port in a daemon thread.
+
+    Set compression_threshold to gzip polling responses and accept
+    permessage-deflate for messages of at least that many bytes.
+    """
+
+    namespace_paths = '', '/chat', '/news'
+
+    def __init__(
+            self, host='127.0.0.1', port=0, ping_interval_in_seconds=25,
+            ping_timeout_in_seconds=60, compression_threshold=None):
+        self.ping_interval_in_seconds = ping_interval_in_seconds
+        self.ping_timeout_in_seconds = ping_timeout_in_seconds
+        self.compression_threshold = compression_threshold
+        self._server = _ThreadingServer((host, port), _RequestHandler)
+        self._server.engine = self
+        self._session_by_id = {}
+        self._lock = threading.Lock()
+        self._is_stopped = False
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self.host, self.port = self._server.server_address
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exception_pack):
+        self.stop()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Refuse requests on connections that clients kept alive
+        self._is_stopped = True
+        self.drop_sessions()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def drop_sessions(self):
+        'Close every session as if the server restarted'
+        with self._lock:
+            sessions = list(self._session_by_id.values())
+            self._session_by_id.clear()
+        for session in sessions:
+            session.close()
+        return len(sessions)
+
+    def mute_sessions(self):
+        'Stop answering current sessions as if their connections went dead'
+        with self._lock:
+            sessions = list(self._session_by_id.values())
+        for session in sessions:
+            session.is_muted = True
+        return len(sessions)
+
+    @property
+    def session_count(self):
+        return len(self._session_by_id)
+
+    def _open_session(self, upgrades):
+        session = _Session(self)
+        with self._lock:
+            self._session_by_id[session.id] = session
+        session.send(b'0' + json.dumps({
+            'sid': session.id,
+            'upgrades': upgrades,
+            'pingInterval': int(self.ping_interval_in_seconds * 1000),
+            'pingTimeout': int(self.ping_timeout_in_seconds * 1000),
+        }).encode('utf-8'))
+        session.send(b'40')
+        return session
+
+    def _poll(self, params):
+        if 'sid' not in params:
+            session = self._open_session(['websocket'])
+            return '200 OK', _encode_payload([session.outbox.get()])
+        session = self._session_by_id.get(params['sid'])
+        if not session or session.closed:
+            return '400 Bad Request', b'{"code":1}'
+        # Answer long polls quickly while the client switches to websocket
+        timeout = 0.1 if session.is_upgrading else (
+            self.ping_interval_in_seconds)
+        return '200 OK', _encode_payload(session.drain(timeout) or [b'6'])
+
+    def _post(self, params, body):
+        session = self._session_by_id.get(params.get('sid'))
+        if not session or session.closed:
+            return '400 Bad Request', b'{"code":1}'
+        for packet_type, packet_data in decode_engineIO_content(body):
+            session.receive(packet_type, packet_data)
+        return '200 OK', b'ok'
+
+    def _serve_websocket(self, websocket, params):
+        if 'sid' in params:
+            session = self._session_by_id.get(params['sid'])
+            if not session:
+                return
+        else:
+            session = self._open_session([])
+            session.upgrade(websocket)
+        while not session.closed:
+            try:
+                packet_type, packet_data = websocket.recv()
+            except (EOFError, socket.error):
+                break
+            if packet_type == 2 and packet_data == b'probe':
+                session.is_upgrading = True
+                websocket.send(b'3probe')
+                # Release a pending long poll
+                session.outbox.put(b'6')
+            elif packet_type == 5:
+                session.upgrade(websocket)
+            else:
+                session.receive(packet_type, packet_data)
+        if session.websocket is websocket:
+            session.close()
+
+    def _receive_socketIO(self, session, packet_type, data, buffers=()):
+        path = ''
+        if data.startswith('/'):
+            path, _, data = data.partition(',')
+        prefix = path + ',' if path else ''
+        if packet_type == 0:
+            if path in self.namespace_paths:
+                session.paths.add(path)
+                session.send('40' + prefix)
+            else:
+                session.send('44' + prefix + '"Invalid namespace"')
+            return
+        if packet_type == 1:
+            session.paths.discard(path)
+            return
+        ack_id = ''
+        while data and data[0].isdigit():
+            ack_id, data = ack_id + data[0], data[1:]
+        args = _reconstruct(json.loads(data) if data else [], buffers)
+        if packet_type == 2:
+            self._receive_event(session, prefix, ack_id, args[0], args[1:])
+        elif packet_type == 3:
+            session.send_socketIO(2, prefix, '', [
+                'server_received_callback'] + args)
+
+    def _receive_event(self, session, prefix, ack_id, event, args):
+        def emit(*args):
+            session.send_socketIO(2, prefix, '', list(args))
+
+        def ack(*args):
+            session.send_socketIO(3, prefix, ack_id, list(args))
+
+        if ack_id and event in (
+                'message', 'bbb', 'emit_with_payload', 'emit_with_event'):
+            ack(*args)
+        elif event == 'message':
+            emit('message', args[0] if args and args[0] else (
+                'message_response'))
+        elif event == 'emit':
+            emit('emit_response')
+        elif event == 'emit_with_payload':
+            emit('emit_with_payload_response', *args)
+        elif event == 'emit_with_multiple_payloads':
+            emit('emit_with_multiple_payloads_response', *args)
+        elif event == 'emit_with_callback':
+            ack()
+        elif event == 'emit_with_callback_with_payload':
+            ack(PAYLOAD)
+        elif event == 'emit_with_callback_with_multiple_payloads':
+            ack(PAYLOAD, PAYLOAD)
+        elif event == 'emit_with_callback_with_unicode_payload':
+            ack(UNICODE_PAYLOAD)
+        elif event == 'emit_with_callback_with_binary_payload':
+            ack(BINARY_PAYLOAD)
+        elif event == 'emit_with_event':
+            emit('emit_with_event_response', *args)
+        elif event == 'trigger_server_expects_callback':
+            session.send_socketIO(2, prefix, '0', [
+                'server_expects_callback'] + args)
+        elif event == 'emit_stream':
+            emit('emit_stream_response', *args)
+            if ack_id:
+                ack()
+        elif event == 'aaa':
+            emit('aaa_response', PAYLOAD)
+
+
+class _Session(object):
+
+    def __init__(self, server):
+        self.id = uuid.uuid4().hex
+        self.server = server
+        self.outbox = queue.Queue()
+        self.websocket = None
+        self.closed = False
+        self.is_muted = False
+        self.is_upgrading = False
+        self.paths = set()
+        self._binary_packet = None
+        self._send_lock = threading.Lock()
+
+    def send(self, packet_text):
+        'Send engine.io packet text, or BinaryData starting with a type byte'
+        if self.is_muted:
+            return
+        if not isinstance(packet_text, bytes):
+            packet_text = packet_text.encode('utf-8')
+        websocket = self.websocket
+        if websocket:
+            websocket.send(packet_text, opcode=2 if isinstance(
+                packet_text, BinaryData) else 1)
+        else:
+            self.outbox.put(packet_text)
+
+    def send_socketIO(self, packet_type, prefix, ack_id, args):
+        buffers = []
+        args = _deconstruct(args, buffers)
+        with self._send_lock:
+            if buffers:
+                self.send('4%s%s-%s%s%s' % (
+                    packet_type + 3, len(buffers), prefix, ack_id,
+                    json.dumps(args)))
+                for x in buffers:
+                    self.send(BinaryData(b'\x04' + x))
+            else:
+                self.send('4%s%s%s%s' % (
+                    packet_type, prefix, ack_id, json.dumps(args)))
+
+    def drain(self, timeout):
+        packets = []
+        try:
+            packets.append(self.outbox.get(timeout=timeout))
+            while True:
+                packets.append(self.outbox.get_nowait())
+        except queue.Empty:
+            pass
+        return packets
+
+    def upgrade(self, websocket):
+        with self._send_lock:
+            for packet_text in self.drain(0):
+                websocket.send(packet_text, opcode=2 if isinstance(
+                    packet_text, BinaryData) else 1)
+            self.websocket = websocket
+            self.is_upgrading = False
+
+    def receive(self, packet_type, packet_data):
+        if self._binary_packet:
+            socketIO_packet_type, data, buffers, attachment_count = (
+                self._binary_packet)
+            buffers.append(bytes(packet_data))
+            if len(buffers) == attachment_count:
+                self._binary_packet = None
+                self.server._receive_socketIO(
+                    self, socketIO_packet_type, data, buffers)
+        elif packet_type == 1:
+            self.close()
+        elif packet_type == 2:
+            self.send(b'3' + bytes(packet_data))
+        elif packet_type == 4:
+            data = bytes(packet_data).decode('utf-8')
+            socketIO_packet_type, data = int(data[0]), data[1:]
+            if socketIO_packet_type in (5, 6):
+                attachment_count, data = data.split('-', 1)
+                self._binary_packet = (
+                    socketIO_packet_type - 3, data, [], int(attachment_count))
+            else:
+                self.server._receive_socketIO(
+                    self, socketIO_packet_type, data)
+
+    def close(self):
+        self.closed = True
+        self.outbox.put(b'1')
+        if self.websocket:
+            self.websocket.close()
+
+
+class _WebSocket(object):
+
+    def __init__(
+            self, connection, deflate_parameter_by_name=None, threshold=0):
+        self.connection = connection
+        self._send_lock = threading.Lock()
+        self._deflate_parameter_by_name = deflate_parameter_by_name
+        self._threshold = threshold
+        self._compressor = None
+        self._decompressor = zlib.decompressobj(-MAX_WINDOW_BITS)
+
+    def send(self, data, opcode=1):
+        header = bytearray([0x80 | opcode])
+        if self._deflate_parameter_by_name is not None and opcode in (
+                1, 2) and len(data) >= self._threshold:
+            header[0] |= 0x40
+            data = self._compress(bytes(data))
+        length = len(data)
+        if length < 126:
+            header.append(length)
+        elif length < 65536:
+            header.append(126)
+            header.extend(struct.pack('!H', length))
+        else:
+            header.append(127)
+            header.extend(struct.pack('!Q', length))
+        try:
+            with self._send_lock:
+                self.connection.sendall(bytes(header) + bytes(data))
+        except socket.error:
+            pass
+
+    def recv(self):
+        'Return the packet type and packet data of the next message'
+        while True:
+            head = bytearray(self._read(2))
+            opcode, length = head[0] & 0x0f, head[1] & 0x7f
+            if length == 126:
+                length = struct.unpack('!H', self._read(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._read(8))[0]
+            mask = self._read(4)
+            data = bytes(_unmask(self._read(length), mask))
+            if head[0] & 0x40:
+                data = self._decompressor.decompress(data + DEFLATE_TRAILER)
+            if opcode == 0x8:
+                raise EOFError
+            if opcode == 0x9:
+                self.send(data, opcode=0xa)
+                continue
+            if opcode == 0x2:
+                return get_byte(data, 0), data[1:]
+            return int(data[0:1]), data[1:]
+
+    def close(self):
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+
+    def _compress(self, data):
+        parameter_by_name = self._deflate_parameter_by_name
+        if self._compressor is None or (
+                'server_no_context_takeover' in parameter_by_name):
+            self._compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -int(
+                    parameter_by_name.get('server_max_window_bits') or
+                    MAX_WINDOW_BITS))
+        data = self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH)
+        return data[:-len(DEFLATE_TRAILER)]
+
+    def _read(self, count):
+        chunks = []
+        while count:
+            chunk = self.connection.recv(count)
+            if not chunk:
+                raise EOFError
+            chunks.append(chunk)
+            count -= len(chunk)
+        return b''.join(chunks)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self._buffer = b''
+        try:
+            while self._handle_request():
+                pass
+        except (EOFError, socket.error):
+            pass
+
+    def _handle_request(self):
+        head = self._read_until(b'\r\n\r\n').decode('latin-1')
+        lines = head.split('\r\n')
+        method, target = lines[0].split(' ')[:2]
+        headers = {}
+        for line in lines[1:]:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+        body = self._read_exactly(int(headers.get('content-length', 0)))
+        params = dict((k, v[0]) for k, v in parse_qs(
+            parse_url(target).query).items())
+        server = self.server.engine
+        if server._is_stopped:
+            return False
+        if headers.get('upgrade', '').lower() == 'websocket':
+            deflate_parameter_by_name = self._upgrade(headers)
+            server._serve_websocket(_WebSocket(
+                self.request, deflate_parameter_by_name,
+                server.compression_threshold), params)
+            return False
+        if method == 'GET':
+            status, content = server._poll(params)
+        else:
+            status, content = server._post(params, body)
+        extra_head = ''
+        threshold = server.compression_threshold
+        if threshold is not None and len(content) >= threshold and (
+                'gzip' in headers.get('accept-encoding', '')):
+            compressor = zlib.compressobj(
+                zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED,
+                16 + MAX_WINDOW_BITS)
+            content = compressor.compress(content) + compressor.flush()
+            extra_head = 'Content-Encoding: gzip\r\n'
+        self.request.sendall((
+            'HTTP/1.1 %s\r\n'
+            'Content-Type: application/octet-stream\r\n'
+            'Content-Length: %s\r\n%s'
+            'Connection: keep-alive\r\n\r\n' % (
+                status, len(content), extra_head)
+        ).encode('latin-1') + content)
+        return True
+
+    def _upgrade(self, headers):
+        'Accept the websocket and return agreed deflate parameters, if any'
+        accept = base64.b64encode(hashlib.sha1(
+            headers['sec-websocket-key'].encode('latin-1') +
+            WEBSOCKET_GUID).digest()).decode('latin-1')
+        extra_head = ''
+        deflate_parameter_by_name = None
+        if self.server.engine.compression_threshold is not None:
+            deflate_parameter_by_name = parse_extension(headers.get(
+                'sec-websocket-extensions', ''), 'permessage-deflate')
+        if deflate_parameter_by_name is not None:
+            # Agree to the parameters that the client offered
+            extra_head = 'Sec-WebSocket-Extensions: %s\r\n' % '; '.join(
+                ['permessage-deflate'] + [
+                    '%s=%s' % (k, v) if v else k
+                    for k, v in sorted(deflate_parameter_by_name.items())
+                    if v or k != 'client_max_window_bits'])
+        self.request.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: %s\r\n%s\r\n' % (
+                accept, extra_head)).encode('latin-1'))
+        return deflate_parameter_by_name
+
+    def _read_until(self, marker):
+        while marker not in self._buffer:
+            self._buffer += self._recv()
+        head, self._buffer = self._buffer.split(marker, 1)
+        return head
+
+    def _read_exactly(self, count):
+        while len(self._buffer) < count:
+            self._buffer += self._recv()
+        body, self._buffer = self._buffer[:count], self._buffer[count:]
+        return body
+
+    def _recv(self):
+        chunk = self.request.recv(65536)
+        if not chunk:
+            raise EOFError
+        return chunk
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 1024
+
+
+def _encode_payload(packet_texts):
+    engineIO_packets = []
+    for packet_text in packet_texts:
+        if isinstance(packet_text, BinaryData):
+            engineIO_packets.append((
+                get_byte(packet_text, 0), BinaryData(packet_text[1:])))
+        else:
+            engineIO_packets.append((
+                int(packet_text[0:1]), packet_text[1:]))
+    return bytes(encode_engineIO_content(engineIO_packets))
+
+
+def _unmask(data, mask):
+    # XOR the whole frame as one integer instead of byte by byte
+    length = len(data)
+    masks = (mask * (length // 4 + 1))[:length]
+    return bytearray(_xor(data, masks, length))
+
+
+def _xor(data, masks, length):
+    try:
+        return (int.from_bytes(data, 'big') ^ int.from_bytes(
+            masks, 'big')).to_bytes(length, 'big')
+    except AttributeError:  # Python 2
+        return bytearray(x ^ y for x, y in zip(
+            bytearray(data), bytearray(masks)))
+
+
+def _deconstruct(x, buffers):
+    if isinstance(x, (bytes, bytearray)) and not isinstance(x, str):
+        buffers.append(bytes(x))
+        return {'_placeholder': True, 'num': len(buffers) - 1}
+    if isinstance(x, list):
+        return [_deconstruct(y, buffers) for y in x]
+    if isinstance(x, dict):
+        return dict((k, _deconstruct(v, buffers)) for k, v in x.items())
+    return x
+
+
+def _reconstruct(x, buffers):
+    if isinstance(x, dict) and x.get('_placeholder'):
+        return buffers[x['num']]
+    if isinstance(x, list):
+        return [_reconstruct(y, buffers) for y in x]
+    if isinstance(x, dict):
+        return dict((k, _reconstruct(v, buffers)) for k, v in x.items())
+    return x
@@ -0,0 +1,134 @@
+import json
+import six
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from .exceptions import PacketError
+from .parsers import BinaryData, SocketIOData, parse_socketIO_packet_data
+from .symmetries import encode_string, get_character
+
+
+class JSONCodec(object):
+    """Format socket.io packets as text with JSON arguments.
+
+    Pass dumps and loads to use a different JSON library; dumps may return
+    either text or UTF-8 bytes."""
+
+    supports_binary = False
+
+    def __init__(self, dumps=None, loads=None):
+        self.dumps = dumps or _dump_json
+        self.loads = loads or json.loads
+
+    def encode_packet(
+            self, packet_type, path='', ack_id=None, args=None,
+            attachment_count=0):
+        packet_prefix = str(packet_type)
+        if attachment_count:
+            packet_prefix += str(attachment_count) + '-'
+        if path:
+            packet_prefix += path + ','
+        if ack_id is not None:
+            packet_prefix += str(ack_id)
+        if not args:
+            return packet_prefix
+        packet_body = self.dumps(args)
+        if isinstance(packet_body, six.binary_type):
+            return encode_string(packet_prefix) + packet_body
+        return packet_prefix + packet_body
+
+    def decode_packet(self, engineIO_packet_data):
+        try:
+            packet_type = int(get_character(engineIO_packet_data, 0))
+        except (IndexError, ValueError):
+            raise PacketError('unexpected socket.io packet')
+        socketIO_packet_data = engineIO_packet_data[1:]
+        if packet_type not in (5, 6):
+            return packet_type, parse_socketIO_packet_data(
+                socketIO_packet_data, self.loads)
+        # Read the attachment count of a binary event or ack
+        count_index = socketIO_packet_data.find(b'-')
+        if count_index < 1:
+            raise PacketError('missing attachment count')
+        try:
+            attachment_count = int(socketIO_packet_data[:count_index])
+        except ValueError:
+            raise PacketError('invalid attachment count')
+        data_parsed = parse_socketIO_packet_data(
+            socketIO_packet_data[count_index + 1:], self.loads)
+        return packet_type, data_parsed._replace(
+            attachment_count=attachment_count)
+
+
+class FastJSONCodec(JSONCodec):
+    'Use orjson or ujson if installed and json otherwise'
+
+    def __init__(self):
+        if orjson:
+            dumps, loads = _dump_orjson, orjson.loads
+        elif ujson:
+            dumps, loads = _dump_ujson, ujson.loads
+        else:
+            dumps, loads = _dump_json, json.loads
+        super(FastJSONCodec, self).__init__(dumps, loads)
+
+
+class MsgPackCodec(object):
+    'Format socket.io packets as binary for socket.io-msgpack-parser'
+
+    # Pack bytes in place instead of sending them as attachments
+    supports_binary = True
+
+    def __init__(self):
+        if not msgpack:
+            raise ImportError('MsgPackCodec requires: pip install msgpack')
+
+    def encode_packet(
+            self, packet_type, path='', ack_id=None, args=None,
+            attachment_count=0):
+        packet = {'type': packet_type, 'nsp': path or '/'}
+        if args:
+            packet['data'] = list(args)
+        if ack_id is not None:
+            packet['id'] = ack_id
+        return BinaryData(msgpack.packb(packet, use_bin_type=True))
+
+    def decode_packet(self, engineIO_packet_data):
+        try:
+            packet = msgpack.unpackb(bytes(engineIO_packet_data), raw=False)
+            packet_type = packet['type']
+        except (ValueError, TypeError, KeyError, msgpack.UnpackException):
+            raise PacketError('unexpected socket.io packet')
+        path = packet.get('nsp', '/')
+        args = packet.get('data', [])
+        if not isinstance(args, list):
+            args = [args]
+        return packet_type, SocketIOData(
+            path='' if path == '/' else path,
+            ack_id=packet.get('id'),
+            args=args)
+
+
+def _dump_json(x):
+    return json.dumps(x, ensure_ascii=False)
+
+
+def _dump_orjson(x):
+    try:
+        return orjson.dumps(x)
+    except TypeError:  # Let json convert what orjson refuses
+        return _dump_json(x)
+
+
+def _dump_ujson(x):
+    return ujson.dumps(x, ensure_ascii=False)
@@ -0,0 +1,167 @@
+import threading
+import zlib
+from timeit import default_timer
+
+from .exceptions import ConnectionError
+
+
+DEFLATE_TRAILER = b'\x00\x00\xff\xff'
+MAX_WINDOW_BITS = 15
+# zlib cannot write raw deflate streams with an 8-bit window
+MIN_CLIENT_WINDOW_BITS = 9
+
+
+class PerMessageDeflate(object):
+    """Offer permessage-deflate (RFC 7692) when opening a websocket.
+
+    - Compress messages of at least min_size bytes with zlib level.
+    - Limit our window with client_max_window_bits and ask the server to
+      limit its window with server_max_window_bits.
+    - Set client_no_context_takeover=True or server_no_context_takeover=True
+      to reset the compression context after every message, which saves
+      memory per connection at the cost of a lower ratio.
+
+    SocketIO('127.0.0.1', 8000, compression=PerMessageDeflate(min_size=1024))
+    """
+
+    def __init__(
+            self, min_size=1024, level=zlib.Z_DEFAULT_COMPRESSION,
+            client_max_window_bits=MAX_WINDOW_BITS,
+            server_max_window_bits=MAX_WINDOW_BITS,
+            client_no_context_takeover=False,
+            server_no_context_takeover=False):
+        if not MIN_CLIENT_WINDOW_BITS <= client_max_window_bits <= (
+                MAX_WINDOW_BITS):
+            raise ValueError('client window bits must be between 9 and 15')
+        if not 8 <= server_max_window_bits <= MAX_WINDOW_BITS:
+            raise ValueError('server window bits must be between 8 and 15')
+        self.min_size = min_size
+        self.level = level
+        self.client_max_window_bits = client_max_window_bits
+        self.server_max_window_bits = server_max_window_bits
+        self.client_no_context_takeover = client_no_context_takeover
+        self.server_no_context_takeover = server_no_context_takeover
+
+    def get_offer(self):
+        'Return the value of the Sec-WebSocket-Extensions request header'
+        parameters = ['permessage-deflate']
+        if self.client_no_context_takeover:
+            parameters.append('client_no_context_takeover')
+        if self.server_no_context_takeover:
+            parameters.append('server_no_context_takeover')
+        if self.server_max_window_bits < MAX_WINDOW_BITS:
+            parameters.append(
+                'server_max_window_bits=%s' % self.server_max_window_bits)
+        if self.client_max_window_bits < MAX_WINDOW_BITS:
+            parameters.append(
+                'client_max_window_bits=%s' % self.client_max_window_bits)
+        else:
+            parameters.append('client_max_window_bits')
+        return '; '.join(parameters)
+
+    def accept(self, response_header, stats=None):
+        """Return a context for the connection or None if the server declined.
+
+        Raise ConnectionError if the server asks for a window that we
+        cannot compress with."""
+        parameter_by_name = parse_extension(
+            response_header or '', 'permessage-deflate')
+        if parameter_by_name is None:
+            return
+        client_max_window_bits = int(parameter_by_name.get(
+            'client_max_window_bits') or MAX_WINDOW_BITS)
+        if client_max_window_bits < MIN_CLIENT_WINDOW_BITS:
+            raise ConnectionError(
+                'unsupported permessage-deflate client_max_window_bits=%s' % (
+                    client_max_window_bits))
+        return DeflateContext(
+            min_size=self.min_size,
+            level=self.level,
+            window_bits=min(
+                self.client_max_window_bits, client_max_window_bits),
+            no_context_takeover=self.client_no_context_takeover or (
+                'client_no_context_takeover' in parameter_by_name),
+            stats=stats)
+
+
+class DeflateContext(object):
+    'Compress and decompress the messages of one websocket'
+
+    def __init__(
+            self, min_size, level, window_bits, no_context_takeover,
+            stats=None):
+        self.min_size = min_size
+        if window_bits < MIN_CLIENT_WINDOW_BITS:
+            raise ValueError('window bits must be between 9 and 15')
+        self._level = level
+        self._window_bits = window_bits
+        self._no_context_takeover = no_context_takeover
+        self._stats = stats
+        self._compressor = None
+        # A full window reads whatever window the server picked
+        self._decompressor = zlib.decompressobj(-MAX_WINDOW_BITS)
+
+    def compress(self, data):
+        start_time = default_timer()
+        if self._compressor is None or self._no_context_takeover:
+            self._compressor = zlib.compressobj(
+                self._level, zlib.DEFLATED, -self._window_bits)
+        compressed_data = self._compressor.compress(
+            data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if compressed_data.endswith(DEFLATE_TRAILER):
+            compressed_data = compressed_data[:-len(DEFLATE_TRAILER)]
+        if self._stats:
+            self._stats.add(
+                len(data), len(compressed_data), default_timer() - start_time)
+        return compressed_data
+
+    def decompress(self, compressed_data):
+        start_time = default_timer()
+        data = self._decompressor.decompress(
+            bytes(compressed_data) + DEFLATE_TRAILER)
+        if self._stats:
+            self._stats.add(
+                len(data), len(compressed_data), default_timer() - start_time)
+        return data
+
+
+class CompressionStats(object):
+    """Count bytes before and after compression in both directions.
+
+    Read ratio for raw bytes per compressed byte and compression_seconds for
+    time spent in zlib. Polling responses that the server gzipped count
+    toward the bytes but not the time, which urllib3 spends decoding them.
+    """
+
+    def __init__(self):
+        self.message_count = 0
+        self.raw_byte_count = 0
+        self.compressed_byte_count = 0
+        self.compression_seconds = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self):
+        if not self.compressed_byte_count:
+            return 1
+        return self.raw_byte_count / float(self.compressed_byte_count)
+
+    def add(self, raw_byte_count, compressed_byte_count, seconds=0):
+        with self._lock:
+            self.message_count += 1
+            self.raw_byte_count += raw_byte_count
+            self.compressed_byte_count += compressed_byte_count
+            self.compression_seconds += seconds
+
+
+def parse_extension(header, extension_name):
+    'Return parameters of extension_name in the header or None if absent'
+    for extension in header.split(','):
+        parts = [x.strip() for x in extension.split(';')]
+        if parts[0].lower() != extension_name:
+            continue
+        parameter_by_name = {}
+        for part in parts[1:]:
+            name, _, value = part.partition('=')
+            parameter_by_name[name.strip().lower()] = value.strip().strip('"')
+        return parameter_by_name
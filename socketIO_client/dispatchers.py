@@ -0,0 +1,62 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from invisibleroads_macros.log import get_log
+from threading import Lock
+
+
+L = get_log(__name__)
+
+
+class PacketDispatcher(object):
+    'Run callbacks in a thread pool, one at a time for each key'
+
+    def __init__(self, max_workers, notify=None):
+        self._max_workers = max_workers
+        self._executor = None
+        self._notify = notify
+        self._callbacks_by_key = {}
+        self._callback_count = 0
+        self._lock = Lock()
+
+    def submit(self, key, callback, *args):
+        with self._lock:
+            self._callback_count += 1
+            try:
+                callbacks = self._callbacks_by_key[key]
+            except KeyError:
+                callbacks = self._callbacks_by_key[key] = deque()
+                # Start threads again if the client reconnects after close
+                if not self._executor:
+                    self._executor = ThreadPoolExecutor(self._max_workers)
+                self._executor.submit(self._run, key, callbacks)
+            callbacks.append((callback, args))
+
+    @property
+    def is_idle(self):
+        return not self._callback_count
+
+    def shutdown(self, wait=True):
+        'Let the threads exit once they run the callbacks already queued'
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait)
+
+    def _run(self, key, callbacks):
+        # Drain callbacks for this key in order; a new worker starts when
+        # submit() finds no queue for the key
+        while True:
+            with self._lock:
+                try:
+                    callback, args = callbacks.popleft()
+                except IndexError:
+                    del self._callbacks_by_key[key]
+                    return
+            try:
+                callback(*args)
+            except Exception:
+                L.exception('[callback error] %s', callback)
+            with self._lock:
+                self._callback_count -= 1
+            if self._notify:
+                self._notify()
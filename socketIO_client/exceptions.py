@@ -10,5 +10,19 @@ class TimeoutError(SocketIOError):
     pass
 
 
+class SendWindowFullError(TimeoutError):
+    'Report that queued bytes stayed above the send window high water mark'
+
+
 class PacketError(SocketIOError):
     pass
+
+
+class NamespaceError(ConnectionError):
+    'Report which namespaces failed to connect and why'
+
+    def __init__(self, error_by_path):
+        super(NamespaceError, self).__init__(
+            'could not connect socket.io namespaces (%s)' % ', '.join(
+                '%s: %s' % x for x in sorted(error_by_path.items())))
+        self.error_by_path = error_by_path
@@ -1,55 +1,204 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
 from invisibleroads_macros.log import get_log
-from threading import Thread, Event
+from threading import Condition, Thread, current_thread
 
 from .exceptions import ConnectionError, TimeoutError
 
 
 L = get_log(__name__)
+HEARTBEAT_WORKER_COUNT = 4
 
 
-class HeartbeatThread(Thread):
+class HeartbeatScheduler(object):
+    """Schedule pings for every connection in the process from one thread.
 
-    daemon = True
+    Send the pings from a few worker threads so that a connection whose
+    socket stalls delays only its own heartbeat."""
 
-    def __init__(
+    def __init__(self, max_workers=HEARTBEAT_WORKER_COUNT):
+        self._heartbeats = []
+        self._heartbeat_index = itertools.count()
+        self._condition = Condition()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers)
+
+    def add(
+            self, send_heartbeat,
+            relax_interval_in_seconds,
+            hurry_interval_in_seconds,
+            ping_timeout_in_seconds=None,
+            on_timeout=None):
+        heartbeat = Heartbeat(
             self, send_heartbeat,
             relax_interval_in_seconds,
-            hurry_interval_in_seconds):
-        super(HeartbeatThread, self).__init__()
+            hurry_interval_in_seconds,
+            ping_timeout_in_seconds,
+            on_timeout)
+        with self._condition:
+            self._schedule(heartbeat, 0)
+            if not self._thread:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+        return heartbeat
+
+    def _schedule(self, heartbeat, interval_in_seconds):
+        # Invalidate entries already in the heap instead of searching for them
+        heartbeat._generation += 1
+        heapq.heappush(self._heartbeats, (
+            time.time() + interval_in_seconds, next(self._heartbeat_index),
+            heartbeat._generation, heartbeat))
+        self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                heartbeat = self._pop_due_heartbeat()
+                heartbeat._is_beating = True
+            try:
+                self._executor.submit(self._beat, heartbeat)
+            except RuntimeError:
+                # The interpreter shut down the workers on its way out
+                return
+
+    def _beat(self, heartbeat):
+        heartbeat._beat_thread = current_thread()
+        interval_in_seconds = None
+        try:
+            interval_in_seconds = heartbeat._beat()
+        except Exception:
+            L.exception('[heartbeat error]')
+            heartbeat._halted = True
+        finally:
+            heartbeat._beat_thread = None
+            with self._condition:
+                heartbeat._is_beating = False
+                if not heartbeat._halted:
+                    self._schedule(heartbeat, interval_in_seconds)
+                self._condition.notify_all()
+
+    def _pop_due_heartbeat(self):
+        while True:
+            if not self._heartbeats:
+                self._condition.wait()
+                continue
+            due_time, index, generation, heartbeat = self._heartbeats[0]
+            if heartbeat._halted or generation != heartbeat._generation:
+                heapq.heappop(self._heartbeats)
+                continue
+            remaining_time = due_time - time.time()
+            if remaining_time > 0:
+                self._condition.wait(remaining_time)
+                continue
+            heapq.heappop(self._heartbeats)
+            return heartbeat
+
+
+class Heartbeat(object):
+    'Ping one connection on a shared schedule and watch for missed pongs'
+
+    def __init__(
+            self, scheduler, send_heartbeat,
+            relax_interval_in_seconds,
+            hurry_interval_in_seconds,
+            ping_timeout_in_seconds=None,
+            on_timeout=None):
+        self._scheduler = scheduler
         self._send_heartbeat = send_heartbeat
         self._relax_interval_in_seconds = relax_interval_in_seconds
         self._hurry_interval_in_seconds = hurry_interval_in_seconds
-        self._adrenaline = Event()
-        self._rest = Event()
-        self._halt = Event()
-
-    def run(self):
-        try:
-            while not self._halt.is_set():
-                try:
-                    self._send_heartbeat()
-                except TimeoutError:
-                    pass
-                if self._adrenaline.is_set():
-                    interval_in_seconds = self._hurry_interval_in_seconds
-                else:
-                    interval_in_seconds = self._relax_interval_in_seconds
-                self._rest.wait(interval_in_seconds)
-        except ConnectionError:
-            L.debug('[heartbeat connection error]')
+        self._ping_timeout_in_seconds = ping_timeout_in_seconds
+        self._on_timeout = on_timeout
+        self._hurried = False
+        self._halted = False
+        self._is_beating = False
+        self._beat_thread = None
+        self._generation = 0
+        self.ping_time = None
+        self.pong_time = time.time()
+        self.missed_pong_count = 0
 
     def relax(self):
-        self._adrenaline.clear()
+        self._hurried = False
 
     def hurry(self):
-        self._adrenaline.set()
-        self._rest.set()
-        self._rest.clear()
+        with self._scheduler._condition:
+            self._hurried = True
+            if not self._halted and not self._is_beating:
+                self._scheduler._schedule(self, 0)
 
     @property
     def hurried(self):
-        return self._adrenaline.is_set()
+        return self._hurried
 
     def halt(self):
-        self._rest.set()
-        self._halt.set()
+        with self._scheduler._condition:
+            self._halted = True
+            self._scheduler._condition.notify()
+
+    def join(self):
+        'Wait for a ping in progress to finish'
+        if current_thread() is self._beat_thread:
+            return
+        with self._scheduler._condition:
+            while self._is_beating:
+                self._scheduler._condition.wait()
+
+    def receive_pong(self):
+        self.pong_time = time.time()
+        self.missed_pong_count = 0
+
+    def reset(self):
+        'Restart the pong clock, as when nobody was reading pongs'
+        self.ping_time = None
+        self.pong_time = time.time()
+        self.missed_pong_count = 0
+
+    @property
+    def is_overdue(self):
+        'Return True if the server stopped answering pings'
+        if self._ping_timeout_in_seconds is None:
+            return False
+        return time.time() - self.pong_time >= (
+            self._relax_interval_in_seconds + self._ping_timeout_in_seconds)
+
+    def _beat(self):
+        'Send a ping and return seconds until the next one'
+        if self.ping_time and self.ping_time > self.pong_time:
+            self.missed_pong_count += 1
+        if self._on_timeout and self.is_overdue:
+            # Let the connection decide whether to drop or keep waiting
+            self._on_timeout()
+            if self._halted:
+                return
+        try:
+            self.ping_time = time.time()
+            self._send_heartbeat()
+        except TimeoutError:
+            pass
+        except ConnectionError:
+            L.debug('[heartbeat connection error]')
+            self._halted = True
+            return
+        except Exception:
+            L.exception('[heartbeat error]')
+            self._halted = True
+            return
+        if self._hurried:
+            interval_in_seconds = self._hurry_interval_in_seconds
+        else:
+            interval_in_seconds = self._relax_interval_in_seconds
+        if self._on_timeout and self._ping_timeout_in_seconds is not None:
+            # Wake up in time to notice that the server stopped answering
+            remaining_time = self.pong_time + (
+                self._relax_interval_in_seconds +
+                self._ping_timeout_in_seconds) - time.time()
+            if remaining_time > 0:
+                interval_in_seconds = min(interval_in_seconds, remaining_time)
+        return interval_in_seconds
+
+
+HEARTBEAT_SCHEDULER = HeartbeatScheduler()
@@ -1,21 +1,33 @@
 import logging
+import numbers
 import time
 from invisibleroads_macros.log import get_log
 
 
 L = get_log('socketIO-client')
+LOG_BODY_SIZE = 1000
 
 
 class LoggingMixin(object):
 
+    __slots__ = ()
+    # Log at most this many characters of each argument; None logs all
+    _log_body_size = LOG_BODY_SIZE
+
     def _log(self, level, msg, *attrs):
-        L.log(level, '%s %s' % (self._log_name, msg), *attrs)
+        if not L.isEnabledFor(level):
+            return
+        L.log(level, '%s %s' % (self._log_name, msg), *[
+            _truncate(x, self._log_body_size) for x in attrs])
 
     def _debug(self, msg, *attrs):
-        self._log(logging.DEBUG, msg, *attrs)
+        # Check before the call to _log because every packet logs here
+        if L.isEnabledFor(logging.DEBUG):
+            self._log(logging.DEBUG, msg, *attrs)
 
     def _info(self, msg, *attrs):
-        self._log(logging.INFO, msg, *attrs)
+        if L.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, msg, *attrs)
 
     def _warn(self, msg, *attrs):
         self._log(logging.WARNING, msg, *attrs)
@@ -30,7 +42,29 @@ class LoggingMixin(object):
                 if last_warning != warning:
                     last_warning = warning
                     self._warn(warning)
-                time.sleep(1)
+
+
+class FormattedArguments(object):
+    'Format handler arguments only if a log record needs them'
+
+    def __init__(self, args, callback=None):
+        self.args = args
+        self.callback = callback
+
+    def __str__(self):
+        arguments = [repr(_) for _ in self.args]
+        if self.callback:
+            arguments.append('callback(*args)')
+        return ', '.join(arguments)
+
+
+def _truncate(value, size):
+    if size is None or isinstance(value, numbers.Number):
+        return value
+    text = '%s' % (value,)
+    if len(text) <= size:
+        return text
+    return '%s... (%s characters)' % (text[:size], len(text))
 
 
 def _yield_elapsed_time(seconds=None):
@@ -0,0 +1,330 @@
+import heapq
+import itertools
+import selectors
+import socket
+import threading
+import time
+
+from .dispatchers import PacketDispatcher
+from .exceptions import ConnectionError, TimeoutError
+
+
+MANAGER_WORKER_COUNT = 4
+
+
+class SocketIOManager(object):
+    """Drive the websocket transports of many clients from one thread.
+
+    - Pass manager=manager to each SocketIO or EngineIO client.
+    - Call manager.start() to read packets, send pings and drop dead
+      sessions for every client in one selectors loop on a background
+      thread, or call manager.wait(seconds) to run the loop yourself.
+    - The loop only reads whole messages that have arrived and hands them
+      to max_workers threads, one at a time for each client, so a slow
+      handler or a half-sent frame cannot stall other clients.
+    - Pings and reconnects run in another max_workers threads, and the
+      loop schedules reconnects on the backoff of each reconnect policy.
+    - Clients that do not upgrade to websocket get their own threads.
+
+    manager = SocketIOManager().start()
+    socketIOs = [SocketIO(
+        '127.0.0.1', 8000, transports=['xhr-polling', 'websocket'],
+        manager=manager) for x in range(1000)]
+    """
+
+    def __init__(self, selector=None, max_workers=MANAGER_WORKER_COUNT):
+        self._selector = selector or selectors.DefaultSelector()
+        self._max_workers = max_workers
+        self._session_by_client = {}
+        self._heartbeats = []
+        self._reconnects = []
+        self._schedule_index = itertools.count()
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self._thread = None
+        self._wait_count = 0
+        self._dispatcher = None
+        self._sender = None
+        self._wakeup_reader = self._wakeup_writer = None
+
+    @property
+    def clients(self):
+        with self._lock:
+            return list(self._session_by_client)
+
+    def start(self):
+        'Run the loop in a daemon thread'
+        with self._lock:
+            if not self._thread:
+                self._halt.clear()
+                self._open()
+                self._thread = threading.Thread(target=self.wait)
+                self._thread.daemon = True
+                self._thread.start()
+        return self
+
+    def stop(self):
+        'Stop the loop and close its wakeup sockets and worker threads'
+        self._halt.set()
+        self._wake()
+        thread = self._thread
+        if thread and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+        with self._lock:
+            # A loop that is still running closes them when it exits
+            if not self._wait_count:
+                self._close()
+
+    def wait(self, seconds=None):
+        'Read packets, send pings and drop dead sessions for all clients'
+        end_time = None if seconds is None else time.time() + seconds
+        with self._lock:
+            self._open()
+            self._wait_count += 1
+        try:
+            while not self._halt.is_set():
+                timeout = self._get_timeout(end_time)
+                if timeout is not None and timeout < 0:
+                    break
+                for key, events in self._selector.select(timeout):
+                    if key.data is None:
+                        self._drain_wakeups()
+                    else:
+                        self._receive(key.data)
+                self._send_heartbeats()
+                self._start_reconnects()
+        finally:
+            with self._lock:
+                self._wait_count -= 1
+                if self._halt.is_set() and not self._wait_count:
+                    self._close()
+
+    def _open(self):
+        'Make the wakeup sockets and worker threads that stop() closed'
+        if not self._dispatcher:
+            self._dispatcher = PacketDispatcher(self._max_workers)
+        if not self._sender:
+            # Keep blocking sends and connects away from the handlers
+            self._sender = PacketDispatcher(self._max_workers)
+        if self._wakeup_reader:
+            return
+        # Interrupt select() when another thread changes the registrations
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+
+    def _close(self):
+        if self._dispatcher:
+            self._dispatcher.shutdown(wait=False)
+            self._dispatcher = None
+        if self._sender:
+            self._sender.shutdown(wait=False)
+            self._sender = None
+        del self._reconnects[:]
+        if not self._wakeup_reader:
+            return
+        self._selector.unregister(self._wakeup_reader)
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+        self._wakeup_reader = self._wakeup_writer = None
+
+    def _register(self, client):
+        'Watch the transport that the client just opened'
+        transport = client._transport_instance
+        if client.transport_name != 'websocket':
+            client._reset_heartbeat()
+            client._start_receiver_thread()
+            return
+        session = _ManagedSession(client, transport)
+        with self._lock:
+            old_session = self._session_by_client.pop(client, None)
+            if old_session:
+                self._forget(old_session)
+            self._session_by_client[client] = session
+            self._selector.register(
+                session.fileno, selectors.EVENT_READ, session)
+            self._schedule_heartbeat(session)
+        self._wake()
+        client._debug('[manager registered] %s', client.transport_name)
+
+    def _unregister(self, client):
+        with self._lock:
+            session = self._session_by_client.pop(client, None)
+            if session:
+                self._forget(session)
+        self._wake()
+
+    def _forget(self, session):
+        session.is_closed = True
+        try:
+            self._selector.unregister(session.fileno)
+        except (KeyError, ValueError):
+            pass
+
+    def _receive(self, session):
+        'Read whole messages without blocking and queue them for handlers'
+        client, transport = session.client, session.transport
+        if session.is_closed:
+            return
+        engineIO_packets, error = [], None
+        try:
+            while True:
+                engineIO_packets.extend(transport.recv_packet(block=False))
+        except TimeoutError:
+            pass
+        except ConnectionError as e:
+            error = e
+        if engineIO_packets:
+            session.receive_time = time.time()
+            self._submit(
+                client, client._process_packets, transport, engineIO_packets)
+        if error:
+            self._drop_later(session, error)
+
+    def _send_heartbeats(self):
+        'Hand due pings to the sender threads without waiting for them'
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._heartbeats or self._heartbeats[0][0] > now:
+                    return
+                session = heapq.heappop(self._heartbeats)[-1]
+            if session.is_closed:
+                continue
+            engineIO_session = session.client._engineIO_session
+            if now - session.receive_time > (
+                    engineIO_session.ping_interval +
+                    engineIO_session.ping_timeout):
+                self._drop_later(session, ConnectionError('ping timed out'))
+                continue
+            self._send(session.client, self._ping, session)
+            with self._lock:
+                self._schedule_heartbeat(session)
+
+    def _ping(self, session):
+        if session.is_closed:
+            return
+        try:
+            session.client._ping()
+        except TimeoutError:
+            pass
+        except ConnectionError as e:
+            self._drop_later(session, e)
+
+    def _schedule_heartbeat(self, session):
+        ping_interval = session.client._engineIO_session.ping_interval
+        heapq.heappush(self._heartbeats, (
+            time.time() + ping_interval, next(self._schedule_index),
+            session))
+
+    def _submit(self, client, callback, *args):
+        'Run callback in a worker after the callbacks queued for client'
+        self._run_later(self._dispatcher, client, callback, *args)
+
+    def _send(self, client, callback, *args):
+        'Run callback in a sender after the sends queued for client'
+        self._run_later(self._sender, client, callback, *args)
+
+    def _run_later(self, dispatcher, client, callback, *args):
+        if dispatcher:
+            try:
+                dispatcher.submit(client, callback, *args)
+                return
+            except RuntimeError:
+                pass  # stop() shut down the workers
+        callback(*args)
+
+    def _drop_later(self, session, e):
+        'Stop watching a dead session now and drop it after its packets'
+        with self._lock:
+            self._forget(session)
+        self._submit(session.client, self._drop, session, e)
+
+    def _drop(self, session, e):
+        'Forget a dead session and schedule a reconnect for its client'
+        client = session.client
+        with self._lock:
+            if self._session_by_client.get(client) is session:
+                del self._session_by_client[client]
+            self._forget(session)
+        if session.transport is not client._transport_instance:
+            return
+        client._opened = False
+        client._launch_disconnect_callbacks()
+        client._notify_waiters()
+        if client._wants_to_close:
+            return
+        client._warn('[connection error] %s', e)
+        self._schedule_reconnect(client, e)
+
+    def _schedule_reconnect(self, client, e):
+        'Queue a reconnect for when the client reconnect policy allows'
+        try:
+            delay = client._get_reconnect_delay(e)
+        except ConnectionError as error:
+            client._warn('[connection error] %s', error)
+            return
+        with self._lock:
+            heapq.heappush(self._reconnects, (
+                time.time() + delay, next(self._schedule_index), client, e))
+        self._wake()
+
+    def _start_reconnects(self):
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._reconnects or self._reconnects[0][0] > now:
+                    return
+                client, e = heapq.heappop(self._reconnects)[-2:]
+            self._send(client, self._reconnect, client, e)
+
+    def _reconnect(self, client, e):
+        if client._wants_to_close:
+            return
+        try:
+            client._transport
+        except ConnectionError as error:
+            client._warn('[connection error] %s', error)
+            self._schedule_reconnect(client, error)
+
+    def _get_timeout(self, end_time):
+        now = time.time()
+        timeouts = []
+        if end_time is not None:
+            timeouts.append(end_time - now)
+        with self._lock:
+            for schedule in self._heartbeats, self._reconnects:
+                if schedule:
+                    timeouts.append(max(0, schedule[0][0] - now))
+        return min(timeouts) if timeouts else None
+
+    def _wake(self):
+        wakeup_writer = self._wakeup_writer
+        if not wakeup_writer:
+            return
+        try:
+            wakeup_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain_wakeups(self):
+        wakeup_reader = self._wakeup_reader
+        if not wakeup_reader:
+            return
+        try:
+            while wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+
+class _ManagedSession(object):
+
+    def __init__(self, client, transport):
+        self.client = client
+        self.transport = transport
+        self.fileno = transport.fileno()
+        self.receive_time = time.time()
+        self.is_closed = False
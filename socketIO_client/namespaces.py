@@ -1,15 +1,28 @@
-from .logs import LoggingMixin
+from .logs import FormattedArguments, LoggingMixin
+
+
+DEFAULT_CALLBACK_LIMIT = 256
 
 
 class EngineIONamespace(LoggingMixin):
     'Define engine.io client behavior'
 
+    # Keep a __dict__ so that code written for 0.7 can still set attributes
+    __slots__ = (
+        '_io', '_callback_by_event', '_once_events', '_dispatch_table',
+        '_default_callback_by_event', '_log_name', '_log_body_size',
+        '__dict__', '__weakref__')
+
     def __init__(self, io):
         self._io = io
         self._callback_by_event = {}
         self._once_events = set()
+        self._dispatch_table = {}
+        self._default_callback_by_event = {}
         self._log_name = io._url
+        self._log_body_size = io._log_body_size
         self.initialize()
+        self._compile_dispatch_table()
 
     def initialize(self):
         """Initialize custom variables here.
@@ -18,6 +31,7 @@ class EngineIONamespace(LoggingMixin):
     def on(self, event, callback):
         'Define a callback to handle an event emitted by the server'
         self._callback_by_event[event] = callback
+        self._dispatch_table.pop(event, None)
 
     def once(self, event, callback):
         'Define a callback to handle the first event emitted by the server'
@@ -31,6 +45,7 @@ class EngineIONamespace(LoggingMixin):
         except KeyError:
             pass
         self._callback_by_event.pop(event, None)
+        self._dispatch_table.pop(event, None)
 
     def send(self, data):
         'Send a message'
@@ -64,23 +79,61 @@ class EngineIONamespace(LoggingMixin):
         """Called when client receives noop packet from engine.io server.
         You can override this method."""
 
+    def _compile_dispatch_table(self):
+        'Map events to handlers once instead of looking them up per packet'
+        for name in dir(self.__class__):
+            if not name.startswith('on_'):
+                continue
+            event = name[3:]
+            if event not in self._callback_by_event:
+                self._dispatch_table[event] = getattr(self, name)
+
     def _find_packet_callback(self, event):
+        try:
+            return self._dispatch_table[event]
+        except KeyError:
+            pass
         # Check callbacks defined by on()
         try:
             callback = self._callback_by_event[event]
         except KeyError:
-            pass
+            # Skip the method lookup for events that fell back before
+            try:
+                return self._default_callback_by_event[event]
+            except KeyError:
+                pass
+            callback = self._find_method_callback(event)
+            if not callback:
+                return self._remember_default_callback(event)
         else:
             if event in self._once_events:
                 self.off(event)
-            return callback
+                return callback
+        self._dispatch_table[event] = callback
+        return callback
+
+    def _remember_default_callback(self, event):
+        # Keep fallbacks apart from the table and stop remembering them
+        # at a limit, so that random event names cannot grow memory
+        callback = self._find_default_callback(event)
+        if len(self._default_callback_by_event) < DEFAULT_CALLBACK_LIMIT:
+            self._default_callback_by_event[event] = callback
+        return callback
+
+    def _find_method_callback(self, event):
         # Check callbacks defined explicitly
+        return getattr(self, 'on_' + event, None)
+
+    def _find_default_callback(self, event):
         return getattr(self, 'on_' + event)
 
 
 class SocketIONamespace(EngineIONamespace):
     'Define socket.io client behavior'
 
+    __slots__ = (
+        'path', '_transport', '_connected', '_invalid', '_was_connected')
+
     def __init__(self, io, path):
         self.path = path
         super(SocketIONamespace, self).__init__(io)
@@ -92,7 +145,17 @@ class SocketIONamespace(EngineIONamespace):
         self._io.disconnect(self.path)
 
     def emit(self, event, *args, **kw):
-        self._io.emit(event, path=self.path, *args, **kw)
+        return self._io.emit(event, path=self.path, *args, **kw)
+
+    def emit_nowait(self, event, *args, **kw):
+        return self._io.emit_nowait(event, path=self.path, *args, **kw)
+
+    def emit_stream(self, event, chunks, **kw):
+        return self._io.emit_stream(event, chunks, path=self.path, **kw)
+
+    def iter_stream(self, event, timeout_in_seconds=None):
+        'Return an iterator over the chunks of the next stream for event'
+        return self._io._make_stream_reader(self, event, timeout_in_seconds)
 
     def send(self, data='', callback=None):
         self._io.send(data, callback)
@@ -146,23 +209,21 @@ class SocketIONamespace(EngineIONamespace):
                 self._was_connected = True
             else:
                 event = 'reconnect'
-        # Check callbacks defined by on()
-        try:
-            callback = self._callback_by_event[event]
-        except KeyError:
-            pass
-        else:
-            if event in self._once_events:
-                self.off(event)
-            return callback
-        # Check callbacks defined explicitly or use on_event()
-        return getattr(
-            self, 'on_' + event.replace(' ', '_'),
-            lambda *args: self.on_event(event, *args))
+        return super(SocketIONamespace, self)._find_packet_callback(event)
+
+    def _find_method_callback(self, event):
+        # Check callbacks defined explicitly
+        return getattr(self, 'on_' + event.replace(' ', '_'), None)
+
+    def _find_default_callback(self, event):
+        # Use on_event()
+        return lambda *args: self.on_event(event, *args)
 
 
 class LoggingEngineIONamespace(EngineIONamespace):
 
+    __slots__ = ()
+
     def on_open(self):
         self._debug('[engine.io open]')
         super(LoggingEngineIONamespace, self).on_open()
@@ -193,15 +254,16 @@ class LoggingEngineIONamespace(EngineIONamespace):
 
     def on_event(self, event, *args):
         callback, args = find_callback(args)
-        arguments = [repr(_) for _ in args]
-        if callback:
-            arguments.append('callback(*args)')
-        self._info('[engine.io event] %s(%s)', event, ', '.join(arguments))
+        self._info(
+            '[engine.io event] %s(%s)', event,
+            FormattedArguments(args, callback))
         super(LoggingEngineIONamespace, self).on_event(event, *args)
 
 
 class LoggingSocketIONamespace(SocketIONamespace, LoggingEngineIONamespace):
 
+    __slots__ = ()
+
     def on_connect(self):
         self._debug(
             '%s[socket.io connect]', make_logging_prefix(self.path))
@@ -219,12 +281,9 @@ class LoggingSocketIONamespace(SocketIONamespace, LoggingEngineIONamespace):
 
     def on_event(self, event, *args):
         callback, args = find_callback(args)
-        arguments = [repr(_) for _ in args]
-        if callback:
-            arguments.append('callback(*args)')
         self._info(
             '%s[socket.io event] %s(%s)', make_logging_prefix(self.path),
-            event, ', '.join(arguments))
+            event, FormattedArguments(args, callback))
         super(LoggingSocketIONamespace, self).on_event(event, *args)
 
     def on_error(self, data):
@@ -0,0 +1,236 @@
+import base64
+import itertools
+import json
+import sqlite3
+import six
+import time
+from collections import deque, namedtuple
+from threading import Condition
+
+from .exceptions import TimeoutError
+from .parsers import BinaryData, is_binary
+from .symmetries import memoryview
+
+
+OVERFLOWS = 'drop-oldest', 'drop-newest', 'block'
+OUTBOX_BLOCK_TIMEOUT_IN_SECONDS = 10
+OutboxEntry = namedtuple('OutboxEntry', [
+    'queued_time', 'engineIO_packets_data'])
+
+
+class Outbox(object):
+    """Hold messages while the client is disconnected and send them in order
+    after it reconnects.
+
+    - Keep at most max_size messages. When full, overflow='drop-oldest'
+      drops the oldest message, 'drop-newest' drops the new message and
+      'block' waits up to block_timeout_in_seconds for room. Without a
+      receiver thread to reconnect and flush, 'block' raises TimeoutError
+      right away.
+    - Send up to batch_size messages per transport write.
+    - Read depth, dropped_count, flushed_count and max_latency_in_seconds
+      to see how far behind the client is.
+
+    SocketIO('127.0.0.1', 8000, outbox=Outbox(max_size=10000))
+    """
+
+    def __init__(
+            self, max_size=1000, overflow='drop-oldest', batch_size=100,
+            block_timeout_in_seconds=OUTBOX_BLOCK_TIMEOUT_IN_SECONDS):
+        if overflow not in OVERFLOWS:
+            raise ValueError('overflow must be one of %s' % ', '.join(
+                OVERFLOWS))
+        self.max_size = max_size
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.block_timeout_in_seconds = block_timeout_in_seconds
+        self.dropped_count = 0
+        self.flushed_count = 0
+        self.total_latency_in_seconds = 0
+        self.max_latency_in_seconds = 0
+        self._entries = deque()
+        self._condition = Condition()
+        self._flushing_count = None
+
+    @property
+    def depth(self):
+        with self._condition:
+            return self._count()
+
+    @property
+    def mean_latency_in_seconds(self):
+        if not self.flushed_count:
+            return 0
+        return self.total_latency_in_seconds / float(self.flushed_count)
+
+    def put(self, engineIO_packets_data, block=True):
+        'Queue packets that belong to one message, such as its attachments'
+        entry = OutboxEntry(time.time(), [
+            _copy_packet_data(x) for x in engineIO_packets_data])
+        with self._condition:
+            if self.max_size and self._count() >= self.max_size:
+                if not self._make_room(block):
+                    self.dropped_count += 1
+                    return False
+            self._append(entry)
+        return True
+
+    def _make_room(self, block=True):
+        if self.overflow == 'drop-newest':
+            return False
+        if self.overflow == 'drop-oldest':
+            # Keep messages that are on their way to the server
+            offset = self._flushing_count or 0
+            if self._count() <= offset:
+                return False
+            self._remove(1, offset)
+            self.dropped_count += 1
+            return True
+        if not block:
+            raise TimeoutError('outbox full')
+        end_time = None if self.block_timeout_in_seconds is None else (
+            time.time() + self.block_timeout_in_seconds)
+        while self._count() >= self.max_size:
+            if end_time is None:
+                self._condition.wait()
+                continue
+            remaining_time = end_time - time.time()
+            if remaining_time <= 0:
+                raise TimeoutError('outbox full')
+            self._condition.wait(remaining_time)
+        return True
+
+    def _can_send_now(self, is_connected):
+        'Return True if a new message would not jump ahead of queued ones'
+        with self._condition:
+            return is_connected and self._flushing_count is None and (
+                not self._count())
+
+    def _start_batch(self):
+        'Return the next batch to send or an empty list when done'
+        with self._condition:
+            if self._flushing_count is not None:
+                return []  # Another thread is sending a batch
+            entries = self._peek(self.batch_size)
+            self._flushing_count = len(entries) if entries else None
+            return entries
+
+    def _finish_batch(self, entries):
+        now = time.time()
+        with self._condition:
+            self._remove(len(entries))
+            self._flushing_count = None
+            for entry in entries:
+                latency_in_seconds = now - entry.queued_time
+                self.total_latency_in_seconds += latency_in_seconds
+                self.max_latency_in_seconds = max(
+                    self.max_latency_in_seconds, latency_in_seconds)
+            self.flushed_count += len(entries)
+            self._condition.notify_all()
+
+    def _cancel_batch(self):
+        with self._condition:
+            self._flushing_count = None
+
+    def _count(self):
+        return len(self._entries)
+
+    def _append(self, entry):
+        self._entries.append(entry)
+
+    def _peek(self, count):
+        return list(itertools.islice(self._entries, count))
+
+    def _remove(self, count, offset=0):
+        if offset:
+            for x in range(count):
+                del self._entries[offset]
+            return
+        for x in range(count):
+            self._entries.popleft()
+
+
+class DiskOutbox(Outbox):
+    """Keep queued messages in an SQLite file so that they survive restarts.
+
+    SocketIO('127.0.0.1', 8000, outbox=DiskOutbox('outbox.sqlite'))
+    """
+
+    def __init__(self, path, *args, **kw):
+        super(DiskOutbox, self).__init__(*args, **kw)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'queued_time REAL, '
+            'packets TEXT)')
+        self._connection.commit()
+        self._size = self._connection.execute(
+            'SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def close(self):
+        with self._condition:
+            self._connection.close()
+
+    def _count(self):
+        return self._size
+
+    def _append(self, entry):
+        self._connection.execute(
+            'INSERT INTO outbox (queued_time, packets) VALUES (?, ?)', (
+                entry.queued_time,
+                _dump_packets_data(entry.engineIO_packets_data)))
+        self._connection.commit()
+        self._size += 1
+
+    def _peek(self, count):
+        rows = self._connection.execute(
+            'SELECT queued_time, packets FROM outbox ORDER BY id LIMIT ?',
+            (count,))
+        return [OutboxEntry(queued_time, _load_packets_data(
+            packets)) for queued_time, packets in rows]
+
+    def _remove(self, count, offset=0):
+        self._connection.execute(
+            'DELETE FROM outbox WHERE id IN ('
+            'SELECT id FROM outbox ORDER BY id LIMIT ? OFFSET ?)',
+            (count, offset))
+        self._connection.commit()
+        self._size = max(0, self._size - count)
+
+
+def _copy_packet_data(engineIO_packet_data):
+    # Copy views so that later changes to the caller's buffer do not leak in
+    if isinstance(engineIO_packet_data, memoryview):
+        return BinaryData(engineIO_packet_data.tobytes())
+    return engineIO_packet_data
+
+
+def _dump_packets_data(engineIO_packets_data):
+    # Store JSON instead of pickles so that reading the file runs no code
+    packets = []
+    for x in engineIO_packets_data:
+        if is_binary(x):
+            packets.append(['binary', _encode_base64(x)])
+        elif isinstance(x, six.text_type):
+            packets.append(['text', x])
+        else:
+            packets.append(['bytes', _encode_base64(x)])
+    return json.dumps(packets)
+
+
+def _load_packets_data(packets):
+    engineIO_packets_data = []
+    for kind, x in json.loads(packets):
+        if kind == 'binary':
+            engineIO_packets_data.append(BinaryData(base64.b64decode(x)))
+        elif kind == 'text':
+            engineIO_packets_data.append(x)
+        else:
+            engineIO_packets_data.append(base64.b64decode(x))
+    return engineIO_packets_data
+
+
+def _encode_base64(x):
+    return base64.b64encode(bytes(x)).decode('ascii')
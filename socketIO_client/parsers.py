@@ -1,14 +1,42 @@
+import base64
 import json
 import six
 from collections import namedtuple
 from six.moves.urllib.parse import urlparse as parse_url
 
-from .symmetries import decode_string, encode_string, get_byte, get_character
+from .symmetries import (
+    decode_string, encode_string, get_byte, get_character, memoryview)
 
 
 EngineIOSession = namedtuple('EngineIOSession', [
     'id', 'ping_interval', 'ping_timeout', 'transport_upgrades'])
-SocketIOData = namedtuple('SocketIOData', ['path', 'ack_id', 'args'])
+# Python 2 sends str as text, so only bytearray and memoryview are binary
+BINARY_TYPES = (bytearray, memoryview) if six.PY2 else (
+    bytes, bytearray, memoryview)
+# Map raw digits in binary payload length headers to and from ASCII digits
+ASCII_DIGITS = bytes(bytearray(48 + x if x < 10 else x for x in range(256)))
+RAW_DIGITS = bytes(bytearray(
+    x - 48 if 48 <= x < 58 else x for x in range(256)))
+
+
+class BinaryData(six.binary_type):
+    'Mark engine.io packet data to send as binary instead of text'
+
+
+class SocketIOData(namedtuple('SocketIOData', [
+        'path', 'ack_id', 'args', 'attachment_count'])):
+    'Hold a parsed socket.io packet without a __dict__ for each instance'
+
+    __slots__ = ()
+
+    def __new__(cls, path='', ack_id=None, args=None, attachment_count=0):
+        return super(SocketIOData, cls).__new__(
+            cls, path, ack_id, args, attachment_count)
+
+
+def is_binary(engineIO_packet_data):
+    'Return True if packet data should go in a binary packet'
+    return isinstance(engineIO_packet_data, (BinaryData, memoryview))
 
 
 def parse_host(host, port, resource):
@@ -31,39 +59,90 @@ def parse_engineIO_session(engineIO_packet_data):
 
 
 def encode_engineIO_content(engineIO_packets):
-    content = bytearray()
+    'Size the buffer first and then write each packet into it once'
+    if not isinstance(engineIO_packets, (list, tuple)):
+        engineIO_packets = list(engineIO_packets)
+    # Share length digits between packets of the same length
+    packet_length_digits_by_length = {}
+    content_length = 0
+    for packet_type, packet_data in engineIO_packets:
+        packet_length = _get_packet_body_length(packet_data) + 1
+        packet_length_digits = packet_length_digits_by_length.get(
+            packet_length)
+        if packet_length_digits is None:
+            packet_length_digits = encode_string(str(
+                packet_length)).translate(RAW_DIGITS)
+            packet_length_digits_by_length[
+                packet_length] = packet_length_digits
+        # Add the marker, length digits and 255 separator
+        content_length += packet_length + len(packet_length_digits) + 2
+    content = bytearray(content_length)
+    content_index = 0
     for packet_type, packet_data in engineIO_packets:
-        packet_text = format_packet_text(packet_type, packet_data)
-        content.extend(_make_packet_prefix(packet_text) + packet_text)
+        if isinstance(packet_data, six.text_type):
+            # Encode one body at a time so that no copy outlives its packet
+            packet_body = encode_string(packet_data)
+            packet_type_byte = 48 + packet_type
+        elif is_binary(packet_data):
+            packet_body = packet_data
+            packet_type_byte = packet_type
+            content[content_index] = 1
+        else:
+            packet_body = packet_data
+            packet_type_byte = 48 + packet_type
+        # Count the packet type character in the packet length
+        packet_length_digits = packet_length_digits_by_length[
+            len(packet_body) + 1]
+        content_index += 1
+        digits_end = content_index + len(packet_length_digits)
+        content[content_index:digits_end] = packet_length_digits
+        content[digits_end] = 255
+        content[digits_end + 1] = packet_type_byte
+        content_index = digits_end + 2 + len(packet_body)
+        content[digits_end + 2:content_index] = packet_body
     return content
 
 
+def encode_engineIO_packet_data(packet_data):
+    'Encode text as UTF-8 and pass bytes through without copying'
+    if isinstance(packet_data, six.text_type):
+        return encode_string(packet_data)
+    return packet_data
+
+
 def decode_engineIO_content(content):
-    content_index = 0
-    content_length = len(content)
-    while content_index < content_length:
-        try:
-            content_index, packet_length = _read_packet_length(
-                content, content_index)
-        except IndexError:
-            break
-        content_index, packet_text = _read_packet_text(
-            content, content_index, packet_length)
-        engineIO_packet_type, engineIO_packet_data = parse_packet_text(
-            packet_text)
-        yield engineIO_packet_type, engineIO_packet_data
+    if not content:
+        return iter(())
+    if get_byte(content, 0) in (0, 1):
+        return _decode_binary_payload(content, content)
+    return _decode_text_payload(content)
 
 
-def format_socketIO_packet_data(path=None, ack_id=None, args=None):
-    socketIO_packet_data = json.dumps(args, ensure_ascii=False) if args else ''
-    if ack_id is not None:
-        socketIO_packet_data = str(ack_id) + socketIO_packet_data
-    if path:
-        socketIO_packet_data = path + ',' + socketIO_packet_data
-    return socketIO_packet_data
+def decode_engineIO_packet_views(content):
+    'Yield packet type and a memoryview of packet data for each packet'
+    if not content:
+        return iter(())
+    if get_byte(content, 0) in (0, 1):
+        return _decode_binary_payload(content, memoryview(content))
+    # Text payloads are decoded, and so copied, before they are viewed
+    return ((packet_type, memoryview(packet_data)) for (
+        packet_type, packet_data) in _decode_text_payload(content))
 
 
-def parse_socketIO_packet_data(socketIO_packet_data):
+def deconstruct_binary_args(args):
+    'Swap bytes-like args for placeholders and return them as attachments'
+    attachments = []
+    if _has_binary(args):
+        args = _deconstruct_binary(args, attachments)
+    return args, attachments
+
+
+def reconstruct_binary_args(args, attachments):
+    'Swap placeholders in args for their binary attachments'
+    return _reconstruct_binary(args, attachments)
+
+
+def parse_socketIO_packet_data(socketIO_packet_data, loads=json.loads):
     data = decode_string(socketIO_packet_data)
     if data.startswith('/'):
         try:
@@ -80,7 +159,7 @@ def parse_socketIO_packet_data(socketIO_packet_data):
     except (ValueError, IndexError):
         ack_id = None
     try:
-        args = json.loads(data)
+        args = loads(data)
     except ValueError:
         args = []
     if isinstance(args, six.string_types):
@@ -89,7 +168,11 @@ def parse_socketIO_packet_data(socketIO_packet_data):
 
 
 def format_packet_text(packet_type, packet_data):
-    return encode_string(str(packet_type) + packet_data)
+    if is_binary(packet_data):
+        return b''.join((six.int2byte(packet_type), packet_data))
+    if isinstance(packet_data, six.text_type):
+        return encode_string(str(packet_type) + packet_data)
+    return encode_string(str(packet_type)) + packet_data
 
 
 def parse_packet_text(packet_text):
@@ -98,43 +181,92 @@ def parse_packet_text(packet_text):
     return packet_type, packet_data
 
 
-def get_namespace_path(socketIO_packet_data):
-    if not socketIO_packet_data.startswith(b'/'):
-        return ''
-    # Loop incrementally in case there is binary data
-    parts = []
-    for i in range(len(socketIO_packet_data)):
-        character = get_character(socketIO_packet_data, i)
-        if ',' == character:
-            break
-        parts.append(character)
-    return ''.join(parts)
+def _get_packet_body_length(packet_data):
+    'Return the encoded length of packet data without encoding ASCII text'
+    if not isinstance(packet_data, six.text_type):
+        return len(packet_data)
+    # Python 3.7 knows whether text is ASCII without encoding it
+    is_ascii = getattr(packet_data, 'isascii', None)
+    if is_ascii and is_ascii():
+        return len(packet_data)
+    return len(encode_string(packet_data))
 
 
-def _make_packet_prefix(packet):
-    length_string = str(len(packet))
-    header_digits = bytearray([0])
-    for i in range(len(length_string)):
-        header_digits.append(ord(length_string[i]) - 48)
-    header_digits.append(255)
-    return header_digits
+def _has_binary(x):
+    if isinstance(x, BINARY_TYPES):
+        return True
+    if isinstance(x, (list, tuple)):
+        return any(_has_binary(y) for y in x)
+    if isinstance(x, dict):
+        return any(_has_binary(y) for y in x.values())
+    return False
 
 
-def _read_packet_length(content, content_index):
-    while get_byte(content, content_index) != 0:
-        content_index += 1
-    content_index += 1
-    packet_length_string = ''
-    byte = get_byte(content, content_index)
-    while byte != 255:
-        packet_length_string += str(byte)
-        content_index += 1
-        byte = get_byte(content, content_index)
-    return content_index, int(packet_length_string)
+def _deconstruct_binary(x, attachments):
+    if isinstance(x, BINARY_TYPES):
+        # Send a view of the caller's buffer instead of a copy
+        attachments.append(memoryview(x))
+        return {'_placeholder': True, 'num': len(attachments) - 1}
+    if isinstance(x, (list, tuple)):
+        return [_deconstruct_binary(y, attachments) for y in x]
+    if isinstance(x, dict):
+        return dict((k, _deconstruct_binary(
+            v, attachments)) for k, v in x.items())
+    return x
 
 
-def _read_packet_text(content, content_index, packet_length):
-    while get_byte(content, content_index) == 255:
-        content_index += 1
-    packet_text = content[content_index:content_index + packet_length]
-    return content_index + packet_length, packet_text
+def _reconstruct_binary(x, attachments):
+    if isinstance(x, list):
+        return [_reconstruct_binary(y, attachments) for y in x]
+    if isinstance(x, dict):
+        if x.get('_placeholder') is True:
+            try:
+                return attachments[x['num']]
+            except (KeyError, IndexError, TypeError):
+                return x
+        return dict((k, _reconstruct_binary(
+            v, attachments)) for k, v in x.items())
+    return x
+
+
+def _decode_binary_payload(content, content_slicer):
+    # <0 for string | 1 for binary><length digits as bytes><255><packet>
+    content_index = 0
+    content_length = len(content)
+    while content_index < content_length:
+        is_binary = get_byte(content, content_index) == 1
+        length_index = content.find(b'\xff', content_index + 1)
+        if length_index < 0:
+            break
+        packet_length = int(bytes(content[
+            content_index + 1:length_index]).translate(ASCII_DIGITS))
+        packet_index = length_index + 1
+        content_index = packet_index + packet_length
+        packet_type = get_byte(content, packet_index)
+        if not is_binary:
+            packet_type -= 48  # Convert ASCII digit
+        yield packet_type, content_slicer[packet_index + 1:content_index]
+
+
+def _decode_text_payload(content):
+    # <length in characters>:<packet>, where b<type><base64> is binary and
+    # lengths count UTF-16 code units as in JavaScript, so this copies the
+    # whole payload into UTF-16 before reading any packet
+    data = decode_string(content).encode('utf-16-le')
+    data_index = 0
+    data_length = len(data)
+    while data_index < data_length:
+        length_index = data.find(b':\x00', data_index)
+        if length_index < 0:
+            break
+        packet_length = int(data[data_index:length_index].decode('utf-16-le'))
+        packet_index = length_index + 2
+        data_index = packet_index + 2 * packet_length
+        packet_text = data[packet_index:data_index].decode('utf-16-le')
+        if packet_text.startswith('b'):
+            packet_type = int(packet_text[1])
+            packet_data = base64.b64decode(packet_text[2:])
+        else:
+            packet_type = int(packet_text[0])
+            packet_data = encode_string(packet_text[1:])
+        yield packet_type, packet_data
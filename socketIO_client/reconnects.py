@@ -0,0 +1,44 @@
+import random
+
+
+class ReconnectPolicy(object):
+    """Space out connection attempts so that clients do not retry in step.
+
+    - Wait min_delay_in_seconds before the first retry and multiply the
+      delay by multiplier after each failure up to max_delay_in_seconds.
+    - Shorten each delay by a random fraction up to jitter; jitter=1 picks
+      delays anywhere between zero and the full delay.
+    - Give up after max_attempts failed attempts and call on_give_up with
+      the last error; max_attempts=None retries forever.
+
+    SocketIO('127.0.0.1', 8000, reconnect_policy=ReconnectPolicy(
+        min_delay_in_seconds=0.5, max_delay_in_seconds=60, max_attempts=10))
+    """
+
+    def __init__(
+            self, min_delay_in_seconds=1, max_delay_in_seconds=30,
+            multiplier=2, jitter=0.5, max_attempts=None, on_give_up=None):
+        self.min_delay_in_seconds = min_delay_in_seconds
+        self.max_delay_in_seconds = max_delay_in_seconds
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.max_attempts = max_attempts
+        self.on_give_up = on_give_up
+
+    def get_delay(self, attempt_index):
+        'Return seconds to wait before the attempt after attempt_index'
+        try:
+            delay_in_seconds = self.min_delay_in_seconds * (
+                self.multiplier ** attempt_index)
+        except OverflowError:
+            delay_in_seconds = self.max_delay_in_seconds
+        delay_in_seconds = min(delay_in_seconds, self.max_delay_in_seconds)
+        return delay_in_seconds * (1 - self.jitter * random.random())
+
+    def should_give_up(self, attempt_count):
+        return self.max_attempts is not None and (
+            attempt_count >= self.max_attempts)
+
+    def give_up(self, e):
+        if self.on_give_up:
+            self.on_give_up(e)
@@ -0,0 +1,224 @@
+import threading
+from collections import defaultdict
+from timeit import default_timer
+
+
+class Stats(object):
+    """Receive measurements from the client and ignore them.
+
+    Subclass and override the methods to send measurements elsewhere.
+    The client skips its hooks for stats whose is_enabled is False, so
+    leaving stats unset or passing Stats() costs almost nothing.
+
+    - count_packet() gets every engine.io packet that a transport sent or
+      received, with its size including the packet type byte.
+    - time_transport() gets seconds spent in each send_packet and
+      recv_packet; polling and websocket reads include time spent waiting
+      for the server.
+    - count_message() gets every socket.io message passed to _message()
+      or received in _process_packet(), and with direction 'dropped'
+      every new message that a full outbox dropped.
+    - time_handler() gets seconds spent in each event handler.
+    - count_reconnect_attempt(), count_reconnect() and
+      set_heartbeat_rtt() track the health of the connection.
+    """
+
+    is_enabled = False
+
+    def count_packet(
+            self, transport_name, direction, packet_type, byte_count):
+        pass
+
+    def time_transport(self, transport_name, operation, seconds):
+        pass
+
+    def count_message(self, direction, byte_count):
+        pass
+
+    def time_handler(self, event, seconds):
+        pass
+
+    def count_reconnect_attempt(self):
+        pass
+
+    def count_reconnect(self):
+        pass
+
+    def set_heartbeat_rtt(self, seconds):
+        pass
+
+
+class MemoryStats(Stats):
+    """Keep measurements in memory.
+
+    SocketIO('127.0.0.1', 8000, stats=MemoryStats())
+
+    Counts and timings are dictionaries keyed by tuples, for example
+    packet_count_by_key[('websocket', 'sent', 4)] and
+    handler_timing_by_event['news'].seconds.
+    """
+
+    is_enabled = True
+
+    def __init__(self):
+        self.packet_count_by_key = defaultdict(int)
+        self.packet_byte_count_by_key = defaultdict(int)
+        self.transport_timing_by_key = defaultdict(Timing)
+        self.message_count_by_direction = defaultdict(int)
+        self.message_byte_count_by_direction = defaultdict(int)
+        self.handler_timing_by_event = defaultdict(Timing)
+        self.reconnect_attempt_count = 0
+        self.reconnect_count = 0
+        self.heartbeat_rtt_in_seconds = None
+        self._lock = threading.Lock()
+
+    def count_packet(
+            self, transport_name, direction, packet_type, byte_count):
+        key = transport_name, direction, packet_type
+        with self._lock:
+            self.packet_count_by_key[key] += 1
+            self.packet_byte_count_by_key[key] += byte_count
+
+    def time_transport(self, transport_name, operation, seconds):
+        with self._lock:
+            self.transport_timing_by_key[transport_name, operation].add(
+                seconds)
+
+    def count_message(self, direction, byte_count):
+        with self._lock:
+            self.message_count_by_direction[direction] += 1
+            self.message_byte_count_by_direction[direction] += byte_count
+
+    def time_handler(self, event, seconds):
+        with self._lock:
+            self.handler_timing_by_event[event].add(seconds)
+
+    def count_reconnect_attempt(self):
+        with self._lock:
+            self.reconnect_attempt_count += 1
+
+    def count_reconnect(self):
+        with self._lock:
+            self.reconnect_count += 1
+
+    def set_heartbeat_rtt(self, seconds):
+        self.heartbeat_rtt_in_seconds = seconds
+
+
+class PrometheusStats(MemoryStats):
+    """Keep measurements in memory and format them for Prometheus.
+
+    Serve format_text() from the endpoint that Prometheus scrapes.
+    """
+
+    def __init__(self, prefix='socketio'):
+        super(PrometheusStats, self).__init__()
+        self.prefix = prefix
+
+    def format_text(self):
+        'Return measurements in the Prometheus text exposition format'
+        with self._lock:
+            lines = []
+            self._format_counters(
+                lines, 'packets_total', 'engine.io packets',
+                ('transport', 'direction', 'packet_type'),
+                self.packet_count_by_key)
+            self._format_counters(
+                lines, 'packet_bytes_total', 'engine.io packet bytes',
+                ('transport', 'direction', 'packet_type'),
+                self.packet_byte_count_by_key)
+            self._format_timings(
+                lines, 'transport_seconds', 'seconds in transport calls',
+                ('transport', 'operation'), self.transport_timing_by_key)
+            self._format_counters(
+                lines, 'messages_total', 'socket.io messages',
+                ('direction',), self.message_count_by_direction)
+            self._format_counters(
+                lines, 'message_bytes_total', 'socket.io message bytes',
+                ('direction',), self.message_byte_count_by_direction)
+            self._format_timings(
+                lines, 'handler_seconds', 'seconds in event handlers',
+                ('event',), self.handler_timing_by_event)
+            self._format_counters(
+                lines, 'reconnect_attempts_total', 'reconnect attempts',
+                (), {(): self.reconnect_attempt_count})
+            self._format_counters(
+                lines, 'reconnects_total', 'successful reconnects',
+                (), {(): self.reconnect_count})
+            if self.heartbeat_rtt_in_seconds is not None:
+                self._format_metric(
+                    lines, 'heartbeat_rtt_seconds', 'latest ping round trip',
+                    'gauge', [('', '', self.heartbeat_rtt_in_seconds)])
+        return ''.join(x + '\n' for x in lines)
+
+    def _format_counters(
+            self, lines, name, description, label_names, count_by_key):
+        self._format_metric(lines, name, description, 'counter', [(
+            '', _format_labels(label_names, key), count,
+        ) for key, count in sorted(count_by_key.items(), key=_sort_key)])
+
+    def _format_timings(
+            self, lines, name, description, label_names, timing_by_key):
+        samples = []
+        for key, timing in sorted(timing_by_key.items(), key=_sort_key):
+            labels = _format_labels(label_names, key)
+            samples.append(('_count', labels, timing.count))
+            samples.append(('_sum', labels, timing.seconds))
+        self._format_metric(lines, name, description, 'summary', samples)
+
+    def _format_metric(self, lines, name, description, metric_type, samples):
+        if not samples:
+            return
+        name = '%s_%s' % (self.prefix, name)
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for suffix, labels, value in samples:
+            lines.append('%s%s%s %s' % (name, suffix, labels, repr(value)))
+
+
+class Timing(object):
+    'Count calls and add up their seconds'
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0
+
+    def add(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+
+
+def get_stats(kw):
+    'Return stats from client options or None if they are disabled'
+    stats = kw.get('stats')
+    return stats if stats and stats.is_enabled else None
+
+
+def time_handler(stats, event, callback):
+    'Wrap callback so that stats gets the seconds that it spends'
+    def timed_callback(*args):
+        start_time = default_timer()
+        try:
+            return callback(*args)
+        finally:
+            stats.time_handler(event, default_timer() - start_time)
+    return timed_callback
+
+
+def _format_labels(label_names, key):
+    if not isinstance(key, tuple):
+        key = key,
+    if not label_names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (
+        name, _escape_label_value(value),
+    ) for name, value in zip(label_names, key))
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _sort_key(item):
+    return str(item[0])
@@ -0,0 +1,176 @@
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from threading import Lock
+
+from .exceptions import ConnectionError, PacketError, TimeoutError
+from .symmetries import memoryview
+
+
+STREAM_CHUNK_SIZE = 65536
+STREAM_WINDOW_SIZE = 8
+STREAM_ACK_TIMEOUT_IN_SECONDS = 30
+
+
+class StreamReader(object):
+    """Iterate over the chunks of the next stream emitted for an event.
+
+    for chunk in namespace.iter_stream('download'):
+        f.write(chunk)
+
+    - Acknowledge each chunk only when the loop takes it, so that a sender
+      that waits for acks never has more than its window of chunks queued.
+    - Raise PacketError if chunks arrive out of order or the sender gives
+      up, and TimeoutError if no chunk comes within timeout_in_seconds.
+    - Read stream_id and byte_count to see what arrived.
+    """
+
+    def __init__(self, namespace, event, timeout_in_seconds=None):
+        self.stream_id = None
+        self.byte_count = 0
+        self.timeout_in_seconds = timeout_in_seconds
+        self._namespace = namespace
+        self._event = event
+        self._next_index = 0
+        self._items = deque()
+        self._future = None
+        self._lock = Lock()
+        self._is_finished = False
+        namespace.on(event, self.receive)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._is_finished:
+            raise StopIteration
+        item, future = self._pop()
+        if future:
+            self._namespace._io.wait(
+                self.timeout_in_seconds, for_future=future)
+            item = self._pop_after_wait()
+        return self._take(item)
+
+    next = __next__
+
+    def receive(self, header, *args):
+        'Hold a chunk until the loop takes it'
+        ack = args[-1] if args and callable(args[-1]) else None
+        chunk = args[0] if args and not callable(args[0]) else b''
+        with self._lock:
+            self._items.append((header, chunk, ack))
+            future, self._future = self._future, None
+        if future:
+            future.set_result(None)
+
+    def _take(self, item):
+        header, chunk, ack = item
+        try:
+            self._check(header)
+        except PacketError:
+            self._finish()
+            raise
+        if ack:
+            ack()
+        if header.get('error'):
+            self._finish()
+            raise PacketError('stream aborted (%s)' % header['error'])
+        if header.get('end'):
+            self._finish()
+            raise StopIteration
+        self._next_index += 1
+        self.byte_count += len(chunk)
+        return bytes(chunk)
+
+    def _pop(self):
+        'Return the next item or a future that receive() will complete'
+        with self._lock:
+            if self._items:
+                return self._items.popleft(), None
+            self._future = Future()
+            return None, self._future
+
+    def _pop_after_wait(self):
+        with self._lock:
+            if self._items:
+                return self._items.popleft()
+            self._future = None
+        self._finish()
+        if self._namespace._io._wants_to_close:
+            raise ConnectionError('stream closed before its end')
+        raise TimeoutError('stream chunk did not arrive in %s seconds' % (
+            self.timeout_in_seconds))
+
+    def _check(self, header):
+        try:
+            stream_id, index = header['stream_id'], header['index']
+        except (KeyError, TypeError):
+            raise PacketError('invalid stream header (%s)' % (header,))
+        if self.stream_id is None:
+            self.stream_id = stream_id
+        elif stream_id != self.stream_id:
+            raise PacketError('unexpected stream (%s)' % stream_id)
+        if index != self._next_index:
+            raise PacketError('stream chunk out of order (%s != %s)' % (
+                index, self._next_index))
+
+    def _finish(self):
+        self._is_finished = True
+        self._namespace.off(self._event)
+
+
+class StreamWriter(object):
+    'Emit the numbered chunks of one stream and return their ack futures'
+
+    def __init__(self, io, event, chunks, **kw):
+        self.stream_id = uuid.uuid4().hex
+        self.byte_count = 0
+        self.window_size = kw.get('window_size', STREAM_WINDOW_SIZE)
+        self._io = io
+        self._event = event
+        self._chunks = chunks
+        self._chunk_size = kw.get('chunk_size', STREAM_CHUNK_SIZE)
+        self._path = kw.get('path', '')
+        self._ack_timeout_in_seconds = kw.get(
+            'ack_timeout_in_seconds', STREAM_ACK_TIMEOUT_IN_SECONDS)
+        self._index = 0
+
+    def iter_chunks(self):
+        for chunk in iter_stream_chunks(self._chunks, self._chunk_size):
+            if len(chunk):
+                yield chunk
+
+    def emit_chunk(self, chunk):
+        # Send a view of the chunk instead of a copy
+        future = self._emit({}, memoryview(chunk))
+        self._index += 1
+        self.byte_count += len(chunk)
+        return future
+
+    def emit_end(self):
+        return self._emit({'end': True})
+
+    def abort(self, error):
+        'Tell the reader that the stream failed'
+        self._io._warn('[socket.io stream aborted] %s', error)
+        try:
+            self._io.emit(self._event, self._make_header({
+                'error': str(error)}), path=self._path)
+        except (TimeoutError, ConnectionError):
+            pass
+
+    def _emit(self, header, *args):
+        return self._io.emit(
+            self._event, self._make_header(header), *args, path=self._path,
+            future=True, ack_timeout_in_seconds=self._ack_timeout_in_seconds)
+
+    def _make_header(self, header):
+        header.update(stream_id=self.stream_id, index=self._index)
+        return header
+
+
+def iter_stream_chunks(chunks, chunk_size=STREAM_CHUNK_SIZE):
+    'Iterate over chunks, reading chunk_size bytes at a time from files'
+    if hasattr(chunks, 'read'):
+        return iter(lambda: chunks.read(chunk_size), b'')
+    return iter(chunks)
@@ -1,10 +1,57 @@
 # coding: utf-8
+import gc
+import json
 import logging
+import requests
+import socket
+import struct
+import tempfile
 import time
-from unittest import TestCase
+import weakref
+from concurrent.futures import Future
+from io import BytesIO
+from threading import (
+    Thread, current_thread as threading_current_thread,
+    enumerate as threading_enumerate)
+from unittest import TestCase, skipIf
 
-from .. import SocketIO, LoggingNamespace, find_callback
-from ..exceptions import ConnectionError
+from .. import SocketIO, SocketIONamespace, LoggingNamespace, find_callback
+from .. import transports
+from ..exceptions import ConnectionError, PacketError
+from ..exceptions import NamespaceError, SendWindowFullError, TimeoutError
+from ..heartbeats import HeartbeatScheduler
+from ..logs import L
+from ..outboxes import DiskOutbox, Outbox
+from ..reconnects import ReconnectPolicy
+from ..codecs import FastJSONCodec, JSONCodec, MsgPackCodec, msgpack
+from ..compressions import PerMessageDeflate
+from ..acks import AckRegistry
+from ..stats import MemoryStats, PrometheusStats, Stats
+from ..benchmarks.parsers import (
+    measure_encoder_allocation, tracemalloc)
+from ..benchmarks.dispatch import (
+    BenchmarkSocketIO, make_namespace, run_dispatch)
+from ..benchmarks.logs import run_logs
+from ..benchmarks.memory import run_memory
+from ..benchmarks.scenarios import run_ack_latency, run_reconnect_storm
+from ..benchmarks.servers import LocalServer
+from ..parsers import (
+    BinaryData, SocketIOData,
+    decode_engineIO_content, decode_engineIO_packet_views,
+    encode_engineIO_content, encode_engineIO_packet_data,
+    deconstruct_binary_args, reconstruct_binary_args)
+from ..transports import TRANSPORTS, PooledHTTPAdapter, _FrameReader
+from ..windows import SendWindow
+try:
+    import asyncio
+    from .. import AsyncSocketIO
+    from ..asynchronous import _read_http_head
+except ImportError:
+    asyncio = None
+try:
+    from .. import SocketIOManager
+except ImportError:
+    SocketIOManager = None
 
 
 HOST = '127.0.0.1'
@@ -107,7 +154,6 @@ class BaseMixin(object):
             'emit_with_payload_response': (UNICODE_PAYLOAD,),
         })
 
-    """
     def test_emit_with_binary_payload(self):
         'Emit with binary payload'
         namespace = self.socketIO.define(Namespace)
@@ -116,7 +162,6 @@ class BaseMixin(object):
         self.assertEqual(namespace.args_by_event, {
             'emit_with_payload_response': (BINARY_PAYLOAD,),
         })
-    """
 
     def test_emit_with_callback(self):
         'Emit with callback'
@@ -125,6 +170,29 @@ class BaseMixin(object):
         self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
         self.assertEqual(self.response_count, 1)
 
+    def test_emit_with_future(self):
+        'Emit and get a future that resolves with the ack args'
+        future = self.socketIO.emit(
+            'emit_with_callback_with_payload', future=True)
+        self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        self.assertEqual(future.result(0), (PAYLOAD,))
+
+    def test_namespace_emit_with_future(self):
+        'Return the ack future of a namespace emit'
+        chat_namespace = self.socketIO.define(Namespace, '/chat')
+        future = chat_namespace.emit(
+            'emit_with_callback_with_payload', future=True)
+        self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        self.assertEqual(future.result(0), (PAYLOAD,))
+
+    def test_emit_with_ack_timeout(self):
+        'Stop waiting for callbacks when the server never acks'
+        future = self.socketIO.emit(
+            'emit', self.on_response, future=True, ack_timeout_in_seconds=0.5)
+        self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        self.assertIsInstance(future.exception(0), TimeoutError)
+        self.assertEqual(self.response_count, 0)
+
     def test_emit_with_callback_with_payload(self):
         'Emit with callback with payload'
         self.assertEqual(self.response_count, 0)
@@ -141,14 +209,12 @@ class BaseMixin(object):
         self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
         self.assertEqual(self.response_count, 1)
 
-    """
     def test_emit_with_callback_with_binary_payload(self):
         'Emit with callback with binary payload'
         self.socketIO.emit(
             'emit_with_callback_with_binary_payload', self.on_binary_response)
         self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
         self.assertTrue(self.called_on_response)
-    """
 
     def test_emit_with_event(self):
         'Emit to trigger an event'
@@ -165,6 +231,19 @@ class BaseMixin(object):
         self.socketIO.wait(self.wait_time_in_seconds)
         self.assertEqual(self.response_count, 2)
 
+    def test_emit_from_threads(self):
+        'Emit from several threads at once'
+        self.socketIO.on('emit_with_event_response', self.on_response)
+        threads = [Thread(
+            target=self.socketIO.emit, args=('emit_with_event', PAYLOAD),
+        ) for x in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.socketIO.wait(self.wait_time_in_seconds)
+        self.assertEqual(self.response_count, 10)
+
     def test_once(self):
         'Listen for an event only once'
         self.socketIO.once('emit_with_event_response', self.on_response)
@@ -174,6 +253,16 @@ class BaseMixin(object):
         self.socketIO.wait(self.wait_time_in_seconds)
         self.assertEqual(self.response_count, 1)
 
+    def test_on_after_dispatch(self):
+        'Replace a handler after events reached the first one'
+        self.socketIO.on('emit_with_event_response', self.on_response)
+        self.socketIO.emit('emit_with_event', PAYLOAD)
+        self.socketIO.wait(self.wait_time_in_seconds)
+        self.socketIO.on('emit_with_event_response', lambda *args: None)
+        self.socketIO.emit('emit_with_event', PAYLOAD)
+        self.socketIO.wait(self.wait_time_in_seconds)
+        self.assertEqual(self.response_count, 1)
+
     def test_send(self):
         'Send'
         namespace = self.socketIO.define(Namespace)
@@ -188,14 +277,12 @@ class BaseMixin(object):
         self.socketIO.wait(self.wait_time_in_seconds)
         self.assertEqual(namespace.response, DATA)
 
-    """
     def test_send_with_binary_data(self):
         'Send with binary data'
         namespace = self.socketIO.define(Namespace)
         self.socketIO.send(BINARY_DATA)
         self.socketIO.wait(self.wait_time_in_seconds)
         self.assertEqual(namespace.response, BINARY_DATA)
-    """
 
     def test_ack(self):
         'Respond to a server callback request'
@@ -207,7 +294,6 @@ class BaseMixin(object):
             'server_received_callback': (PAYLOAD,),
         })
 
-    """
     def test_binary_ack(self):
         'Respond to a server callback request with binary data'
         namespace = self.socketIO.define(Namespace)
@@ -218,7 +304,6 @@ class BaseMixin(object):
             'server_expects_callback': (BINARY_PAYLOAD,),
             'server_received_callback': (BINARY_PAYLOAD,),
         })
-    """
 
     def test_wait_with_disconnect(self):
         'Exit loop when the client wants to disconnect'
@@ -234,6 +319,24 @@ class BaseMixin(object):
         self.assertRaises(
             ConnectionError, self.socketIO.define, Namespace, '/invalid')
 
+    def test_namespace_define_many(self):
+        'Connect several namespaces at once and report failures by path'
+        namespace_by_path = self.socketIO.define_many({
+            '/chat': Namespace, '/news': Namespace},
+            seconds=self.wait_time_in_seconds)
+        for namespace in namespace_by_path.values():
+            namespace.emit('emit_with_payload', PAYLOAD)
+        self.socketIO.wait(self.wait_time_in_seconds)
+        for namespace in namespace_by_path.values():
+            self.assertEqual(namespace.args_by_event, {
+                'emit_with_payload_response': (PAYLOAD,)})
+        with self.assertRaises(NamespaceError) as context:
+            self.socketIO.define_many({
+                '/chat': Namespace, '/invalid': Namespace},
+                seconds=self.wait_time_in_seconds)
+        self.assertEqual(context.exception.error_by_path, {
+            '/invalid': 'invalid namespace'})
+
     def test_namespace_emit(self):
         'Emit to namespaces'
         main_namespace = self.socketIO.define(Namespace)
@@ -247,7 +350,6 @@ class BaseMixin(object):
             'emit_with_payload_response': (PAYLOAD,),
         })
 
-    """
     def test_namespace_emit_with_binary_payload(self):
         'Emit to namespaces with binary payload'
         main_namespace = self.socketIO.define(Namespace)
@@ -260,7 +362,6 @@ class BaseMixin(object):
         self.assertEqual(news_namespace.args_by_event, {
             'emit_with_payload_response': (BINARY_PAYLOAD,),
         })
-    """
 
     def test_namespace_ack(self):
         'Respond to server callback request in namespace'
@@ -272,7 +373,6 @@ class BaseMixin(object):
             'server_received_callback': (PAYLOAD,),
         })
 
-    """
     def test_namespace_ack_with_binary_payload(self):
         'Respond to server callback request in namespace with binary payload'
         chat_namespace = self.socketIO.define(Namespace, '/chat')
@@ -283,7 +383,6 @@ class BaseMixin(object):
             'server_expects_callback': (BINARY_PAYLOAD,),
             'server_received_callback': (BINARY_PAYLOAD,),
         })
-    """
 
     def on_event(self):
         self.response_count += 1
@@ -313,6 +412,24 @@ class Test_XHR_PollingTransport(BaseMixin, TestCase):
             'xhr-polling'], verify=False)
         self.assertEqual(self.socketIO.transport_name, 'xhr-polling')
 
+    def test_reuse_connections(self):
+        'Reuse keep-alive connections from a pool shared across clients'
+        http_adapter = PooledHTTPAdapter(pool_maxsize=4)
+        socketIOs = [SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling'], verify=False, http_adapter=http_adapter)
+            for x in range(2)]
+        for socketIO in socketIOs:
+            socketIO.emit('emit_with_callback', self.on_response)
+            socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        transports = [x._transport_instance for x in socketIOs]
+        for socketIO in socketIOs:
+            socketIO.disconnect()
+        self.assertEqual(self.response_count, 2)
+        self.assertEqual(len(http_adapter.poolmanager.pools), 1)
+        self.assertTrue(all(x.reused_connection_count for x in transports))
+        # The second client found connections that the first one opened
+        self.assertLessEqual(transports[1].fresh_connection_count, 2)
+
 
 class Test_WebsocketTransport(BaseMixin, TestCase):
 
@@ -320,8 +437,1046 @@ class Test_WebsocketTransport(BaseMixin, TestCase):
         super(Test_WebsocketTransport, self).setUp()
         self.socketIO = SocketIO(HOST, PORT, LoggingNamespace, transports=[
             'xhr-polling', 'websocket'], verify=False)
+        self.socketIO._wait_for_upgrade()
+        self.assertEqual(self.socketIO.transport_name, 'websocket')
+
+    def test_upgrade_in_background(self):
+        'Keep emitting over polling while the client upgrades'
+        socketIO = SocketIO(HOST, PORT, transports=[
+            'xhr-polling', 'websocket'], verify=False)
+        payloads = []
+        socketIO.on('emit_with_payload_response', payloads.append)
+        for x in range(100):
+            socketIO.emit('emit_with_payload', x)
+        socketIO._wait_for_upgrade()
+        end_time = time.time() + self.wait_time_in_seconds
+        while len(payloads) < 100 and time.time() < end_time:
+            socketIO.wait(0.1)
+        socketIO.disconnect()
+        self.assertEqual(payloads, list(range(100)))
+        self.assertEqual(socketIO.transport_name, 'websocket')
+        self.assertTrue(socketIO.upgrade_duration_in_seconds > 0)
+        self.assertIsNone(socketIO.upgrade_error)
+
+
+class Test_DirectWebsocketTransport(BaseMixin, TestCase):
+
+    def setUp(self):
+        super(Test_DirectWebsocketTransport, self).setUp()
+        self.socketIO = SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'websocket'], verify=False)
+        self.assertEqual(self.socketIO.transport_name, 'websocket')
+
+    def test_stalled_handshake(self):
+        'Give up on a websocket handshake that never gets an answer'
+        server = socket.socket()
+        self.addCleanup(server.close)
+        server.bind((HOST, 0))
+        server.listen(1)
+        self.addCleanup(
+            setattr, transports, 'CONNECT_TIMEOUT_IN_SECONDS',
+            transports.CONNECT_TIMEOUT_IN_SECONDS)
+        transports.CONNECT_TIMEOUT_IN_SECONDS = 0.5
+        start_time = time.time()
+        with self.assertRaises(ConnectionError):
+            transports.WebsocketTransport(
+                requests.Session(), False,
+                '%s:%s/socket.io' % server.getsockname())
+        self.assertLess(time.time() - start_time, 5)
+
+
+class Test_ReceiverThread(BaseMixin, TestCase):
+
+    def setUp(self):
+        super(Test_ReceiverThread, self).setUp()
+        self.socketIO = SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling', 'websocket'], verify=False, max_workers=4)
+        self.socketIO._wait_for_upgrade()
+        self.assertEqual(self.socketIO.transport_name, 'websocket')
+
+    def test_shutdown_workers(self):
+        'Stop the callback threads when the client closes'
+        with SocketIO(HOST, PORT, LoggingNamespace, transports=[
+                'xhr-polling', 'websocket'], verify=False,
+                max_workers=4) as socketIO:
+            for x in range(4):
+                socketIO.emit('emit_with_callback', self.on_response)
+            socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+            threads = list(socketIO._dispatcher._executor._threads)
+        self.assertTrue(threads)
+        for x in range(50):
+            if not any(x.is_alive() for x in threads):
+                break
+            time.sleep(0.1)
+        self.assertFalse(any(x.is_alive() for x in threads))
+        self.assertEqual(self.response_count, 4)
+
+    def test_reconnect(self):
+        'Reconnect after the receiver thread handled the first connect'
+        self.socketIO.on('reconnect', self.on_event)
+        self.socketIO.disconnect()
+        self.socketIO.connect()
+        self.socketIO.wait(self.wait_time_in_seconds)
+        self.assertTrue(self.response_count > 0)
+
+
+@skipIf(not SocketIOManager, 'selectors is not available')
+class Test_SocketIOManager(BaseMixin, TestCase):
+
+    def setUp(self):
+        super(Test_SocketIOManager, self).setUp()
+        self.manager = SocketIOManager().start()
+        self.socketIO = SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling', 'websocket'], verify=False, manager=self.manager)
         self.assertEqual(self.socketIO.transport_name, 'websocket')
 
+    def tearDown(self):
+        super(Test_SocketIOManager, self).tearDown()
+        self.manager.stop()
+
+    def test_reconnect(self):
+        'Reconnect after the manager handled the first connect'
+        self.socketIO.on('reconnect', self.on_event)
+        self.socketIO.disconnect()
+        self.socketIO.connect()
+        self.socketIO.wait(self.wait_time_in_seconds)
+        self.assertTrue(self.response_count > 0)
+
+    def test_reconnect_after_connection_error(self):
+        'Reconnect in a sender thread after the websocket closes'
+        self.socketIO._transport_instance._connection.sock.shutdown(2)
+        for x in range(50):
+            time.sleep(0.1)
+            if self.socketIO.connected:
+                break
+        self.assertTrue(self.socketIO.connected)
+        self.socketIO.emit('emit_with_callback', self.on_response)
+        self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        self.assertEqual(self.response_count, 1)
+
+    def test_reconnect_many_clients(self):
+        'Reconnect dropped clients from a fixed number of sender threads'
+        socketIOs = [SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling', 'websocket'], verify=False, manager=self.manager)
+            for x in range(10)]
+        for socketIO in socketIOs:
+            socketIO._transport_instance._connection.sock.shutdown(2)
+        for x in range(50):
+            time.sleep(0.1)
+            if all(socketIO.connected for socketIO in socketIOs):
+                break
+        self.assertTrue(all(socketIO.connected for socketIO in socketIOs))
+        self.assertLessEqual(
+            len(self.manager._sender._executor._threads),
+            self.manager._max_workers)
+        for socketIO in socketIOs:
+            socketIO.disconnect()
+
+    def test_ping_outside_loop(self):
+        'Send pings from a sender thread instead of the loop thread'
+        ping_threads = []
+        self.socketIO._ping = lambda: ping_threads.append(
+            threading_current_thread())
+        session = self.manager._session_by_client[self.socketIO]
+        with self.manager._lock:
+            self.manager._heartbeats.insert(0, (0, -1, session))
+        self.manager._wake()
+        for x in range(50):
+            time.sleep(0.1)
+            if ping_threads:
+                break
+        self.assertEqual(len(ping_threads), 1)
+        self.assertIsNot(ping_threads[0], self.manager._thread)
+
+    def test_many_clients(self):
+        'Read packets for many clients without a thread for each'
+        socketIOs = [SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling', 'websocket'], verify=False, manager=self.manager)
+            for x in range(20)]
+        self.assertFalse(any(x._heartbeat for x in socketIOs))
+        self.assertFalse(any(x._receiver_thread for x in socketIOs))
+        for socketIO in socketIOs:
+            socketIO.emit('emit_with_callback', self.on_response)
+        for socketIO in socketIOs:
+            socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+            socketIO.disconnect()
+        self.assertEqual(self.response_count, 20)
+        self.assertEqual(self.manager.clients, [self.socketIO])
+
+    def test_partial_message(self):
+        'Leave a half-sent message in the buffer instead of blocking'
+        reader, writer = socket.socketpair()
+        self.addCleanup(reader.close)
+        self.addCleanup(writer.close)
+        frame_reader = _FrameReader(FakeConnection(sock=reader))
+        writer.sendall(b'\x81\x044h')
+        with self.assertRaises(TimeoutError):
+            frame_reader.recv_message(block=False)
+        writer.sendall(b'ey')
+        self.assertEqual(frame_reader.recv_message(block=False), (1, b'4hey'))
+
+    def test_slow_handler(self):
+        'Handle packets of other clients while one handler is busy'
+        socketIO = SocketIO(HOST, PORT, LoggingNamespace, transports=[
+            'xhr-polling', 'websocket'], verify=False, manager=self.manager)
+        socketIO.on('emit_response', lambda *args: time.sleep(1))
+        socketIO.emit('emit')
+        self.socketIO.emit('emit_with_callback', self.on_response)
+        start_time = time.time()
+        self.socketIO.wait_for_callbacks(seconds=self.wait_time_in_seconds)
+        self.assertLess(time.time() - start_time, 1)
+        self.assertEqual(self.response_count, 1)
+        socketIO.disconnect()
+
+    def test_stop(self):
+        'Close the wakeup sockets when the manager stops'
+        wakeup_reader = self.manager._wakeup_reader
+        self.manager.stop()
+        self.assertEqual(wakeup_reader.fileno(), -1)
+        self.assertIsNone(self.manager._dispatcher)
+        self.manager.start()
+        self.assertIsNotNone(self.manager._wakeup_reader)
+
+
+@skipIf(asyncio is None, 'asyncio is not available')
+class Test_AsyncSocketIO(TestCase):
+
+    transports = TRANSPORTS
+
+    def setUp(self):
+        super(Test_AsyncSocketIO, self).setUp()
+        self.response_count = 0
+        self.wait_time_in_seconds = 1
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.socketIO = AsyncSocketIO(
+            HOST, PORT, LoggingNamespace, transports=self.transports,
+            verify=False)
+        self.complete(self.socketIO.connect())
+
+    def tearDown(self):
+        super(Test_AsyncSocketIO, self).tearDown()
+        self.complete(self.socketIO.disconnect())
+        self.complete(self.socketIO.close())
+        self.loop.close()
+
+    def complete(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def test_emit_with_payload(self):
+        'Emit with payload'
+        namespace = self.socketIO.define(Namespace)
+        self.complete(self.socketIO.emit('emit_with_payload', PAYLOAD))
+        self.complete(self.socketIO.wait(self.wait_time_in_seconds))
+        self.assertEqual(namespace.args_by_event, {
+            'emit_with_payload_response': (PAYLOAD,),
+        })
+
+    def test_emit_with_binary_payload(self):
+        'Emit with binary payload'
+        namespace = self.socketIO.define(Namespace)
+        self.complete(self.socketIO.emit('emit_with_payload', BINARY_PAYLOAD))
+        self.complete(self.socketIO.wait(self.wait_time_in_seconds))
+        self.assertEqual(namespace.args_by_event, {
+            'emit_with_payload_response': (BINARY_PAYLOAD,),
+        })
+
+    def test_emit_with_callback(self):
+        'Emit with callback'
+        self.socketIO.emit('emit_with_callback', self.on_response)
+        self.complete(self.socketIO.wait_for_callbacks(
+            self.wait_time_in_seconds))
+        self.assertEqual(self.response_count, 1)
+
+    def test_emit_with_future(self):
+        'Await the ack args'
+        future = self.socketIO.emit(
+            'emit_with_callback_with_payload', future=True)
+        self.assertEqual(self.complete(asyncio.wait_for(
+            future, self.wait_time_in_seconds)), (PAYLOAD,))
+
+    def test_namespace_emit_with_future(self):
+        'Await the ack args of a namespace emit'
+        chat_namespace = self.socketIO.define(Namespace, '/chat')
+        self.complete(self.socketIO.wait(for_namespace=chat_namespace))
+        future = chat_namespace.emit(
+            'emit_with_callback_with_payload', future=True)
+        self.assertEqual(self.complete(asyncio.wait_for(
+            future, self.wait_time_in_seconds)), (PAYLOAD,))
+
+    def test_namespace_ack(self):
+        'Respond to server callback request in namespace'
+        chat_namespace = self.socketIO.define(Namespace, '/chat')
+        self.complete(self.socketIO.wait(for_namespace=chat_namespace))
+        chat_namespace.emit('trigger_server_expects_callback', PAYLOAD)
+        self.complete(self.socketIO.wait(self.wait_time_in_seconds))
+        self.assertEqual(chat_namespace.args_by_event, {
+            'server_expects_callback': (PAYLOAD,),
+            'server_received_callback': (PAYLOAD,),
+        })
+
+    def test_namespace_define_many(self):
+        'Await several namespaces that connect in one write'
+        namespace_by_path = self.complete(self.socketIO.define_many({
+            '/chat': Namespace, '/news': Namespace}, seconds=5))
+        self.assertEqual(sorted(namespace_by_path), ['/chat', '/news'])
+        for namespace in namespace_by_path.values():
+            self.assertTrue(namespace._connected)
+        with self.assertRaises(NamespaceError):
+            self.complete(self.socketIO.define_many({
+                '/invalid': Namespace}, seconds=5))
+
+    def test_emit_stream(self):
+        'Await stream acks and read the chunks back with async for'
+        reader = self.socketIO.iter_stream('emit_stream_response')
+        chunks = [bytes(bytearray([x]) * 1000) for x in range(5)]
+        byte_count = self.complete(asyncio.wait_for(self.socketIO.emit_stream(
+            'emit_stream', iter(chunks), window_size=2), 5))
+        self.assertEqual(byte_count, 5000)
+        received_chunks = []
+        while True:
+            try:
+                received_chunks.append(self.complete(reader.__anext__()))
+            except StopAsyncIteration:
+                break
+        self.assertEqual(received_chunks, chunks)
+        with self.assertRaises(TypeError):
+            next(self.socketIO.iter_stream('emit_stream_response'))
+
+    def test_share_drain(self):
+        'Await one drain task however many packets are queued'
+        self.socketIO.emit('emit')
+        drain_task = self.socketIO._drain_task
+        self.complete(self.socketIO.emit('emit'))
+        self.assertIs(self.socketIO._drain_task, drain_task)
+        self.assertEqual(self.socketIO.compression_stats.message_count, 0)
+
+    def test_unsupported_options(self):
+        'Reject options that need threads'
+        with self.assertRaises(ValueError):
+            AsyncSocketIO(HOST, PORT, outbox=Outbox())
+        with self.assertRaises(ValueError):
+            AsyncSocketIO(HOST, PORT, proxies={
+                'http': 'http://proxy.example.com:8080'})
+
+    def test_save_cookies(self):
+        'Send cookies that the server set with later requests'
+        reader = asyncio.StreamReader()
+        reader.feed_data(
+            b'HTTP/1.1 200 OK\r\nSet-Cookie: io=x; Path=/\r\n'
+            b'Set-Cookie: lb=y\r\nContent-Length: 0\r\n\r\n')
+        status_code, response_headers = self.complete(
+            _read_http_head(reader))
+        self.assertEqual(status_code, 200)
+        transport = self.socketIO._transport_instance
+        transport._save_cookies(response_headers)
+        headers = transport._prepare_request('GET', {})[1]
+        self.assertEqual(
+            sorted(headers['Cookie'].split('; ')), ['io=x', 'lb=y'])
+
+    def test_reconnect_after_missed_pongs(self):
+        'Reconnect when the server stops answering pings'
+        server = LocalServer(
+            ping_interval_in_seconds=0.1, ping_timeout_in_seconds=0.2).start()
+        socketIO = AsyncSocketIO(
+            server.host, server.port, transports=self.transports)
+        try:
+            self.complete(socketIO.connect())
+            session_id = socketIO._engineIO_session.id
+            server.mute_sessions()
+            for x in range(30):
+                self.complete(socketIO.wait(0.1))
+                if socketIO._engineIO_session.id != session_id and (
+                        socketIO.connected):
+                    break
+            self.assertNotEqual(socketIO._engineIO_session.id, session_id)
+        finally:
+            self.complete(socketIO.close())
+            server.stop()
+
+    def on_response(self, *args):
+        self.response_count += 1
+
+
+class Test_AsyncSocketIO_WebsocketTransport(Test_AsyncSocketIO):
+
+    transports = ['websocket']
+
+
+class Test_HeartbeatScheduler(TestCase):
+
+    def test_share_thread(self):
+        'Ping many connections from one thread'
+        scheduler = HeartbeatScheduler()
+        ping_counts = [0] * 100
+
+        def make_send_heartbeat(index):
+            def send_heartbeat():
+                ping_counts[index] += 1
+            return send_heartbeat
+
+        thread_count = len(threading_enumerate())
+        heartbeats = [scheduler.add(
+            make_send_heartbeat(x), 60, 0.01) for x in range(100)]
+        time.sleep(0.1)
+        self.assertEqual(ping_counts, [1] * 100)
+        self.assertLessEqual(
+            len(threading_enumerate()), thread_count + 1 + 4)
+        heartbeats[0].hurry()
+        heartbeats[1].halt()
+        heartbeats[1].join()
+        time.sleep(0.1)
+        self.assertTrue(ping_counts[0] > 2)
+        self.assertEqual(ping_counts[1:], [1] * 99)
+
+    def test_stalled_send(self):
+        'Keep pinging other connections while one send stalls'
+        scheduler = HeartbeatScheduler()
+        ping_counts = [0, 0]
+
+        def send_stalled_heartbeat():
+            ping_counts[0] += 1
+            time.sleep(0.5)
+
+        def send_heartbeat():
+            ping_counts[1] += 1
+
+        heartbeats = [
+            scheduler.add(send_stalled_heartbeat, 0.01, 0.01),
+            scheduler.add(send_heartbeat, 0.01, 0.01)]
+        time.sleep(0.2)
+        self.assertEqual(ping_counts[0], 1)
+        self.assertTrue(ping_counts[1] > 5)
+        for heartbeat in heartbeats:
+            heartbeat.halt()
+
+    def test_detect_missed_pongs(self):
+        'Count missed pongs and give up after the ping timeout'
+        timeouts = []
+
+        def on_timeout():
+            timeouts.append(1)
+            heartbeat.halt()
+
+        scheduler = HeartbeatScheduler()
+        heartbeat = scheduler.add(lambda: None, 0.01, 0.01, 0.05, on_timeout)
+        time.sleep(0.02)
+        self.assertTrue(heartbeat.missed_pong_count > 0)
+        heartbeat.receive_pong()
+        self.assertEqual(heartbeat.missed_pong_count, 0)
+        time.sleep(0.2)
+        self.assertTrue(heartbeat.is_overdue)
+        self.assertEqual(timeouts, [1])
+
+    def test_reconnect_after_missed_pongs(self):
+        'Reconnect when the server stops answering pings'
+        server = LocalServer(
+            ping_interval_in_seconds=0.1, ping_timeout_in_seconds=0.2).start()
+        namespaces = []
+        try:
+            socketIO = SocketIO(
+                server.host, server.port, Namespace,
+                transports=['xhr-polling', 'websocket'], max_workers=1)
+            namespaces.append(socketIO.get_namespace())
+            namespaces.append(socketIO.define(Namespace, '/chat'))
+            socketIO.wait(0.3)
+            self.assertTrue(socketIO.heartbeat_rtt_in_seconds < 0.1)
+            session_id = socketIO._engineIO_session.id
+            server.mute_sessions()
+            for x in range(30):
+                time.sleep(0.1)
+                if socketIO._engineIO_session.id != session_id and (
+                        socketIO.connected):
+                    break
+            self.assertNotEqual(socketIO._engineIO_session.id, session_id)
+            socketIO.disconnect()
+        finally:
+            server.stop()
+        for namespace in namespaces:
+            self.assertIn('disconnect', namespace.args_by_event)
+
+
+class Test_ReconnectPolicy(TestCase):
+
+    def test_back_off(self):
+        'Double delays up to the maximum and shorten them by jitter'
+        policy = ReconnectPolicy(
+            min_delay_in_seconds=1, max_delay_in_seconds=5, jitter=0)
+        self.assertEqual([policy.get_delay(x) for x in range(5)], [
+            1, 2, 4, 5, 5])
+        self.assertEqual(policy.get_delay(10000), 5)
+        policy.jitter = 0.5
+        delays = [policy.get_delay(2) for x in range(100)]
+        self.assertTrue(all(2 <= x <= 4 for x in delays))
+        self.assertTrue(len(set(delays)) > 1)
+
+    def test_give_up(self):
+        'Give up after max_attempts and report the last error'
+        errors = []
+        server = LocalServer().start()
+        socketIO = SocketIO(
+            server.host, server.port, transports=['xhr-polling'],
+            max_workers=1, reconnect_policy=ReconnectPolicy(
+                min_delay_in_seconds=0.01, max_attempts=2,
+                on_give_up=errors.append))
+        server.stop()
+        for x in range(50):
+            time.sleep(0.1)
+            if errors:
+                break
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(socketIO._reconnect_attempt_count, 2)
+        socketIO.wait(seconds=1)
+        self.assertFalse(socketIO.connected)
+
+
+class Test_AckRegistry(TestCase):
+
+    def test_timeout(self):
+        'Fail the future of an ack that never came'
+        registry = AckRegistry(timeout_in_seconds=0.1)
+        timed_out_entries = []
+        registry.on_timeout = timed_out_entries.append
+        future = Future()
+        ack_id = registry.add(future=future)
+        self.assertIsInstance(future.exception(1), TimeoutError)
+        self.assertEqual([x.ack_id for x in timed_out_entries], [ack_id])
+        self.assertEqual((len(registry), registry.timeout_count), (0, 1))
+        with self.assertRaises(KeyError):
+            registry.pop(ack_id)
+
+    def test_max_size(self):
+        'Wait for room and then give up when too many acks are in flight'
+        registry = AckRegistry(max_size=2, block_timeout_in_seconds=0.1)
+        ack_ids = [registry.add(callback=len) for x in range(2)]
+        with self.assertRaises(TimeoutError):
+            registry.add(callback=len)
+        with self.assertRaises(TimeoutError):
+            registry.add(callback=len, block=False)
+        Thread(target=registry.pop, args=(ack_ids[0],)).start()
+        registry.block_timeout_in_seconds = None
+        registry.add(callback=len)
+        self.assertEqual(len(registry), 2)
+
+    def test_max_size_without_receiver(self):
+        'Give up at once when no thread can read the acks that make room'
+        server = LocalServer().start()
+        socketIO = SocketIO(
+            server.host, server.port, transports=['websocket'],
+            ack_registry=AckRegistry(max_size=1))
+        try:
+            socketIO.emit('emit', len)
+            start_time = time.time()
+            with self.assertRaises(TimeoutError):
+                socketIO.emit('emit', len)
+            self.assertFalse(socketIO.emit_nowait('emit', len))
+            self.assertLess(time.time() - start_time, 1)
+        finally:
+            socketIO.disconnect()
+            server.stop()
+
+    def test_release_registry(self):
+        'Let go of registries whose acks are still waiting to expire'
+        registry = AckRegistry(timeout_in_seconds=60)
+        registry.add(callback=len)
+        registry_reference = weakref.ref(registry)
+        del registry
+        gc.collect()
+        self.assertIsNone(registry_reference())
+
+    def test_latency(self):
+        'Report ack latency percentiles'
+        registry = AckRegistry()
+        self.assertIsNone(registry.get_latency_percentile(50))
+        for x in range(10):
+            registry.pop(registry.add(callback=len))
+        self.assertEqual(registry.ack_count, 10)
+        self.assertLessEqual(
+            registry.get_latency_percentile(50),
+            registry.get_latency_percentile(99))
+
+
+class Test_Outbox(TestCase):
+
+    def test_overflow(self):
+        'Drop the oldest or newest message or block when full'
+        outbox = Outbox(max_size=2)
+        for x in range(3):
+            outbox.put([str(x)])
+        self.assertEqual(outbox.dropped_count, 1)
+        self.assertEqual([x.engineIO_packets_data for x in (
+            outbox._start_batch())], [['1'], ['2']])
+        outbox = Outbox(max_size=2, overflow='drop-newest')
+        for x in range(3):
+            outbox.put([str(x)])
+        self.assertEqual([x.engineIO_packets_data for x in (
+            outbox._start_batch())], [['0'], ['1']])
+        outbox = Outbox(
+            max_size=1, overflow='block', block_timeout_in_seconds=0.01)
+        outbox.put(['0'])
+        with self.assertRaises(TimeoutError):
+            outbox.put(['1'])
+        # Do not wait for a flush that only the caller could run
+        outbox.block_timeout_in_seconds = 60
+        with self.assertRaises(TimeoutError):
+            outbox.put(['1'], block=False)
+
+    def test_flush_in_batches(self):
+        'Send batches in order and measure how long messages waited'
+        outbox = Outbox(batch_size=2)
+        for x in range(3):
+            outbox.put([str(x)])
+        self.assertFalse(outbox._can_send_now(is_connected=True))
+        batches = []
+        while True:
+            entries = outbox._start_batch()
+            if not entries:
+                break
+            outbox._finish_batch(entries)
+            batches.append([x.engineIO_packets_data[0] for x in entries])
+        self.assertEqual(batches, [['0', '1'], ['2']])
+        self.assertEqual(outbox.flushed_count, 3)
+        self.assertEqual(outbox.depth, 0)
+        self.assertTrue(outbox.max_latency_in_seconds > 0)
+        self.assertTrue(outbox._can_send_now(is_connected=True))
+
+    def test_disk_outbox(self):
+        'Keep queued messages across restarts'
+        with tempfile.NamedTemporaryFile(suffix='.sqlite') as temporary_file:
+            outbox = DiskOutbox(temporary_file.name)
+            outbox.put([u'452-["인",{}]', BinaryData(b'\xff'), b'2[]'])
+            outbox.close()
+            outbox = DiskOutbox(temporary_file.name)
+            self.assertEqual(outbox.depth, 1)
+            engineIO_packets_data = outbox._start_batch()[
+                0].engineIO_packets_data
+            self.assertEqual(engineIO_packets_data, [
+                u'452-["인",{}]', b'\xff', b'2[]'])
+            self.assertIsInstance(engineIO_packets_data[1], BinaryData)
+            # Store JSON that loads without running code
+            packets = outbox._connection.execute(
+                'SELECT packets FROM outbox').fetchone()[0]
+            self.assertEqual(json.loads(packets)[0], [
+                'text', u'452-["인",{}]'])
+            outbox.close()
+
+    def test_send_after_reconnect(self):
+        'Queue emits while disconnected and send them after reconnecting'
+        server = LocalServer().start()
+        outbox = Outbox()
+        responses = []
+        socketIO = SocketIO(
+            server.host, server.port, transports=[
+                'xhr-polling', 'websocket'], max_workers=1, outbox=outbox,
+            reconnect_policy=ReconnectPolicy(min_delay_in_seconds=0.2))
+        try:
+            server.drop_sessions()
+            for x in range(50):
+                time.sleep(0.01)
+                if not socketIO.connected:
+                    break
+            for x in range(5):
+                socketIO.emit('emit_with_callback', lambda x=x: (
+                    responses.append(x)))
+            self.assertEqual(outbox.depth, 5)
+            socketIO.wait_for_callbacks(seconds=5)
+        finally:
+            socketIO.disconnect()
+            server.stop()
+        self.assertEqual(responses, list(range(5)))
+        self.assertEqual(outbox.flushed_count, 5)
+
+    def test_send_without_lock(self):
+        'Send outside the outbox lock and count messages that it dropped'
+        server = LocalServer().start()
+        outbox = Outbox(max_size=1, overflow='drop-newest')
+        stats = MemoryStats()
+        socketIO = SocketIO(
+            server.host, server.port, transports=['xhr-polling'],
+            outbox=outbox, stats=stats)
+        lock_states = []
+
+        class CheckingTransport(object):
+
+            def send_packets(self, engineIO_packets):
+                thread = Thread(target=self.check_lock)
+                thread.start()
+                thread.join()
+
+            def check_lock(self):
+                is_free = outbox._condition.acquire(False)
+                if is_free:
+                    outbox._condition.release()
+                lock_states.append(is_free)
+
+        transport = socketIO._transport_instance
+        try:
+            socketIO._transport_instance = CheckingTransport()
+            socketIO.emit('emit')
+            self.assertEqual(lock_states, [True])
+            socketIO._opened = False
+            socketIO.emit('emit')
+            socketIO.emit('emit')
+            self.assertEqual(outbox.depth, 1)
+            self.assertEqual(stats.message_count_by_direction['dropped'], 1)
+        finally:
+            socketIO._transport_instance = transport
+            socketIO._opened = True
+            socketIO.disconnect()
+            server.stop()
+
+
+class Test_Parsers(TestCase):
+
+    def test_decode_binary_payload(self):
+        'Decode payload with binary length headers'
+        content = bytes(encode_engineIO_content([
+            (0, '{}'), (4, u'2["인삼"]'), (6, '')]))
+        self.assertEqual(list(decode_engineIO_content(content)), [
+            (0, b'{}'), (4, u'2["인삼"]'.encode('utf-8')), (6, b'')])
+        content += bytes(bytearray([1, 3, 255, 4, 238, 221]))
+        packets = list(decode_engineIO_packet_views(content))
+        self.assertEqual(packets[-1][0], 4)
+        self.assertEqual(bytes(packets[-1][1]), b'\xee\xdd')
+
+    def test_decode_text_payload(self):
+        'Decode payload with text length headers'
+        content = u'3:0{}7:42["인"]1:66:b4/wA='.encode('utf-8')
+        self.assertEqual(list(decode_engineIO_content(content)), [
+            (0, b'{}'), (4, u'2["인"]'.encode('utf-8')), (6, b''),
+            (4, b'\xff\x00')])
+        # Count characters outside the BMP twice, as JavaScript does
+        content = u'3:4\U0001f6002:4x'.encode('utf-8')
+        self.assertEqual(list(decode_engineIO_content(content)), [
+            (4, u'\U0001f600'.encode('utf-8')), (4, b'x')])
+
+    def test_encode_buffers(self):
+        'Pass pre-encoded packet data through without copying'
+        packet_data = b'2["x"]'
+        self.assertIs(encode_engineIO_packet_data(packet_data), packet_data)
+        self.assertEqual(encode_engineIO_packet_data(u'인'), u'인'.encode(
+            'utf-8'))
+
+    @skipIf(not tracemalloc, 'tracemalloc is not available')
+    def test_encode_without_copying(self):
+        'Allocate little more than the content when encoding bytes'
+        packet_data = b'2["x","' + b'x' * 1000000 + b'"]'
+        allocation = measure_encoder_allocation(
+            encode_engineIO_content, [(4, packet_data)] * 10)
+        self.assertLess(allocation, 1.2)
+
+    def test_encode_small_text_without_copying(self):
+        'Allocate little more than the content when encoding small text'
+        allocation = measure_encoder_allocation(
+            encode_engineIO_content, [(4, '2["x","xxxxxxxx"]')] * 10000)
+        self.assertLess(allocation, 1.2)
+        allocation = measure_encoder_allocation(
+            encode_engineIO_content, [(4, u'2["x","é"]')] * 10000)
+        self.assertLess(allocation, 1.2)
+
+    def test_encode_binary_packets(self):
+        'Frame binary packet data with a binary length header'
+        content = bytes(encode_engineIO_content([
+            (4, BinaryData(b'\x00\xff')), (4, '2')]))
+        self.assertEqual(content[:4], b'\x01\x03\xff\x04')
+        self.assertEqual(list(decode_engineIO_content(content)), [
+            (4, b'\x00\xff'), (4, b'2')])
+
+
+class Test_Codecs(TestCase):
+
+    packets = [
+        (0, '', None, None),
+        (0, '/chat', None, None),
+        (2, '', None, ['emit_with_payload', PAYLOAD]),
+        (2, '/chat', 7, ['emit_with_callback', UNICODE_PAYLOAD]),
+        (3, '', 7, [DATA, 1, None]),
+    ]
+
+    def test_json_codec(self):
+        'Match the output of the stdlib encoder'
+        codec = JSONCodec()
+        for packet_type, path, ack_id, args in self.packets:
+            self.assertEqual(
+                codec.encode_packet(packet_type, path, ack_id, args),
+                str(packet_type) + (path + ',' if path else '') + (
+                    '' if ack_id is None else str(ack_id)) + (
+                    json.dumps(args, ensure_ascii=False) if args else ''))
+            self.check_round_trip(
+                codec, codec, packet_type, path, ack_id, args)
+
+    def test_fast_json_codec(self):
+        'Read and write packets compatible with the stdlib encoder'
+        codec, fast_codec = JSONCodec(), FastJSONCodec()
+        for packet in self.packets:
+            self.check_round_trip(codec, fast_codec, *packet)
+            self.check_round_trip(fast_codec, codec, *packet)
+        # Fall back to json for arguments that orjson refuses
+        engineIO_packet_data = fast_codec.encode_packet(2, '', None, [
+            'x', {1: 2}])
+        if not isinstance(engineIO_packet_data, bytes):
+            engineIO_packet_data = engineIO_packet_data.encode('utf-8')
+        self.assertEqual(fast_codec.decode_packet(
+            engineIO_packet_data)[1].args, ['x', {'1': 2}])
+
+    @skipIf(not msgpack, 'msgpack is not installed')
+    def test_msgpack_codec(self):
+        'Write binary packets for socket.io-msgpack-parser'
+        codec = MsgPackCodec()
+        for packet in self.packets:
+            self.check_round_trip(codec, codec, *packet)
+        engineIO_packet_data = codec.encode_packet(
+            2, '', None, ['x', b'\xff'])
+        self.assertIsInstance(engineIO_packet_data, BinaryData)
+        self.assertEqual(msgpack.unpackb(engineIO_packet_data, raw=False), {
+            'type': 2, 'nsp': '/', 'data': ['x', b'\xff']})
+
+    def test_binary_args(self):
+        'Send bytes-like args as attachments without copying them'
+        args = ['emit_with_payload', BINARY_PAYLOAD, memoryview(b'\xcc')]
+        packet_args, attachments = deconstruct_binary_args(args)
+        self.assertIs(attachments[0].obj, BINARY_DATA)
+        self.assertEqual(packet_args[2], {'_placeholder': True, 'num': 3})
+        engineIO_packet_data = JSONCodec().encode_packet(
+            2 + 3, '/chat', 7, packet_args, len(attachments))
+        self.assertTrue(engineIO_packet_data.startswith('54-/chat,7['))
+        socketIO_packet_type, data_parsed = JSONCodec().decode_packet(
+            engineIO_packet_data.encode('utf-8'))
+        self.assertEqual(data_parsed.attachment_count, 4)
+        self.assertEqual(reconstruct_binary_args(data_parsed.args, [
+            bytes(x) for x in attachments]), args)
+        self.assertIs(deconstruct_binary_args(['x', PAYLOAD])[0][1], PAYLOAD)
+        # Refuse binary packets without a whole attachment count header
+        for engineIO_packet_data in b'512', b'5-["x"]', b'5x-["x"]':
+            with self.assertRaises(PacketError):
+                JSONCodec().decode_packet(engineIO_packet_data)
+
+    def check_round_trip(
+            self, encoder, decoder, packet_type, path, ack_id, args):
+        engineIO_packet_data = encoder.encode_packet(
+            packet_type, path, ack_id, args)
+        if not isinstance(engineIO_packet_data, bytes):
+            engineIO_packet_data = engineIO_packet_data.encode('utf-8')
+        self.assertEqual(decoder.decode_packet(engineIO_packet_data), (
+            packet_type, SocketIOData(path, ack_id, args or [])))
+
+
+class Test_Benchmarks(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_local_server(self):
+        'Serve binary acks from the local stand-in server'
+        socketIO = SocketIO(self.server.host, self.server.port, transports=[
+            'xhr-polling', 'websocket'])
+        socketIO._wait_for_upgrade()
+        self.assertEqual(socketIO.transport_name, 'websocket')
+        socketIO.emit(
+            'emit_with_callback_with_binary_payload', self.on_response)
+        socketIO.wait_for_callbacks(seconds=1)
+        socketIO.disconnect()
+        self.assertEqual(self.args, (BINARY_PAYLOAD,))
+
+    def test_ack_latency(self):
+        'Report ack latency percentiles'
+        result = run_ack_latency(self.server, 'xhr-polling', ack_count=10)
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertLessEqual(result['p99_ms'], result['max_ms'])
+
+    def test_reconnect_storm(self):
+        'Reconnect every client after the server drops all sessions'
+        result = run_reconnect_storm(self.server, client_count=5)
+        self.assertEqual(result['reconnected_count'], 5)
+
+    def test_dispatch(self):
+        'Compare event dispatch against the 0.7 lookup'
+        results = run_dispatch(event_count=100)
+        self.assertEqual([x['handler'] for x in results], [
+            'on', 'method', 'on_event'])
+        for result in results:
+            self.assertGreater(result['new_events_per_second'], 0)
+
+    @skipIf(not tracemalloc, 'tracemalloc is not available')
+    def test_memory(self):
+        'Keep queued packets and transports smaller and measure clients'
+        results = run_memory(
+            self.server, client_count=100, packet_count=100,
+            connected_client_count=2)
+        self.assertEqual([x['object'] for x in results], [
+            '_QueuedPacket', 'SocketIONamespace', 'WebsocketTransport',
+            'queued packet', 'connected client'])
+        result_by_object = dict((x['object'], x) for x in results)
+        # Namespaces keep a __dict__, so they save only a few bytes
+        for object_name in (
+                '_QueuedPacket', 'WebsocketTransport', 'queued packet'):
+            result = result_by_object[object_name]
+            self.assertLess(result['new_bytes'], result['old_bytes'])
+        self.assertIn('__dict__', result_by_object['SocketIONamespace'][
+            'note'])
+        # A connected client holds far more than its bare objects
+        self.assertGreater(result_by_object['connected client'][
+            'new_bytes'], result_by_object['queued packet']['new_bytes'])
+
+    def test_slots(self):
+        'Store attributes of built-in namespaces and transports in slots'
+        namespace = make_namespace()
+        self.assertFalse(hasattr(SocketIOData(), '__dict__'))
+        # Namespaces still take attributes and weak references
+        plain_namespace = SocketIONamespace(namespace._io, '')
+        plain_namespace.xxx = 'yyy'
+        self.assertEqual(plain_namespace.xxx, 'yyy')
+        self.assertIs(weakref.ref(plain_namespace)(), plain_namespace)
+        # Parsed packets still unpack like the 0.7 namedtuple
+        path, ack_id, args, attachment_count = SocketIOData('/chat', 1, [])
+        self.assertEqual((path, ack_id), ('/chat', 1))
+        self.assertEqual(SocketIOData(args=[1])._replace(
+            attachment_count=2), ('', None, [1], 2))
+
+    def test_dispatch_table(self):
+        'Prefer on() over methods and fall back after once() and off()'
+        namespace = make_namespace()
+        self.assertEqual(
+            namespace._find_packet_callback('aaa'), namespace.on_aaa)
+        namespace.once('aaa', self.on_response)
+        self.assertEqual(
+            namespace._find_packet_callback('aaa'), self.on_response)
+        self.assertEqual(
+            namespace._find_packet_callback('aaa'), namespace.on_aaa)
+        namespace.on('aaa', self.on_response)
+        namespace.off('aaa')
+        self.assertEqual(
+            namespace._find_packet_callback('aaa'), namespace.on_aaa)
+        # Fall back to on_event without remembering every unknown event
+        namespace._find_packet_callback('ccc')('xxx')
+        self.assertNotIn('ccc', namespace._dispatch_table)
+        # Reuse the fallback instead of making one for every packet
+        self.assertIs(
+            namespace._find_packet_callback('ccc'),
+            namespace._find_packet_callback('ccc'))
+
+    def test_override_delegate(self):
+        'Call packet delegates that subclasses override'
+        args = []
+
+        class OverridingSocketIO(BenchmarkSocketIO):
+
+            def _on_event(self, data_parsed, namespace):
+                args.append(data_parsed.args)
+
+        socketIO = OverridingSocketIO()
+        socketIO._namespace_by_path = {'': make_namespace()}
+        socketIO._codec = JSONCodec()
+        socketIO._binary_packet = socketIO._dispatcher = socketIO._stats = None
+        socketIO._log_name = 'benchmark'
+        socketIO._process_packet((4, b'2["aaa",1]'))
+        self.assertEqual(args, [['aaa', 1]])
+
+    def on_response(self, *args):
+        self.args = args
+
+
+class Test_Compression(TestCase):
+
+    payload = {'xxx': 'y' * 10000}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(compression_threshold=100).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_permessage_deflate(self):
+        'Compress large websocket messages in both directions'
+        socketIO = self.check_round_trip(['websocket'], PerMessageDeflate(
+            min_size=100))
+        self.assertTrue(socketIO._transport_instance._deflate)
+        self.assertGreaterEqual(socketIO.compression_stats.message_count, 2)
+        self.assertGreater(socketIO.compression_stats.ratio, 10)
+        self.assertGreater(socketIO.compression_stats.compression_seconds, 0)
+
+    def test_no_context_takeover(self):
+        'Reset the compression context after every message'
+        self.check_round_trip(['websocket'], PerMessageDeflate(
+            min_size=100, client_max_window_bits=9, server_max_window_bits=9,
+            client_no_context_takeover=True,
+            server_no_context_takeover=True))
+
+    def test_gzip(self):
+        'Count polling responses that the server compressed with gzip'
+        socketIO = self.check_round_trip(['xhr-polling'], None)
+        self.assertGreater(socketIO.compression_stats.ratio, 10)
+
+    def test_offer(self):
+        'Offer window bits and context takeover and accept what comes back'
+        compression = PerMessageDeflate(
+            client_max_window_bits=10, server_no_context_takeover=True)
+        self.assertEqual(compression.get_offer(), (
+            'permessage-deflate; server_no_context_takeover; '
+            'client_max_window_bits=10'))
+        self.assertIsNone(compression.accept('x-webkit-deflate-frame'))
+        context = compression.accept(
+            'permessage-deflate; client_max_window_bits=9')
+        self.assertEqual(context.decompress(context.compress(
+            b'4' + b'x' * 2000)), b'4' + b'x' * 2000)
+        with self.assertRaises(ConnectionError):
+            compression.accept('permessage-deflate; client_max_window_bits=8')
+        with self.assertRaises(ValueError):
+            PerMessageDeflate(client_max_window_bits=8)
+
+    def test_invalid_text(self):
+        'Disconnect if an inflated text message is not UTF-8'
+        context = PerMessageDeflate().accept('permessage-deflate')
+        data = context.compress(b'4\xff' * 200)
+        frame = bytearray([0xc1, 126]) + struct.pack('!H', len(data)) + data
+        frame_reader = _FrameReader(FakeConnection([bytes(frame)]), context)
+        with self.assertRaises(ConnectionError):
+            frame_reader.recv_message()
+
+    def check_round_trip(self, transports, compression):
+        socketIO = SocketIO(
+            self.server.host, self.server.port, transports=transports,
+            compression=compression)
+        payloads = []
+        socketIO.on('emit_with_payload_response', payloads.append)
+        for x in range(3):
+            socketIO.emit('emit_with_payload', self.payload)
+        end_time = time.time() + 5
+        while len(payloads) < 3 and time.time() < end_time:
+            socketIO.wait(0.1)
+        socketIO.disconnect()
+        self.assertEqual(payloads, [self.payload] * 3)
+        return socketIO
+
+
+class FakeSocket(object):
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv(self, size):
+        return self.chunks.pop(0) if self.chunks else b''
+
+
+class FakeConnection(object):
+
+    def __init__(self, chunks=(), sock=None):
+        self.sock = sock or FakeSocket(chunks)
+        self.pongs = []
+
+    def pong(self, data):
+        self.pongs.append(data)
+
+    def send_close(self):
+        pass
+
 
 class Namespace(LoggingNamespace):
 
@@ -346,3 +1501,325 @@ class Namespace(LoggingNamespace):
 
     def on_message(self, data):
         self.response = data
+
+
+class Test_Stats(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_polling(self):
+        'Count polling packets, messages and handler time'
+        self.check_round_trip(['xhr-polling'], 'xhr-polling')
+
+    def test_websocket(self):
+        'Count websocket packets, messages and handler time'
+        self.check_round_trip(['websocket'], 'websocket')
+
+    def test_reconnect(self):
+        'Count reconnects after the server drops the session'
+        stats = MemoryStats()
+        socketIO = SocketIO(
+            self.server.host, self.server.port, transports=['xhr-polling'],
+            max_workers=1, stats=stats, reconnect_policy=ReconnectPolicy(
+                min_delay_in_seconds=0.01))
+        self.server.drop_sessions()
+        end_time = time.time() + 5
+        while not stats.reconnect_count and time.time() < end_time:
+            time.sleep(0.1)
+        socketIO.disconnect()
+        self.assertEqual(stats.reconnect_count, 1)
+        self.assertGreaterEqual(stats.reconnect_attempt_count, 1)
+
+    def test_disabled(self):
+        'Skip hooks for stats that are not enabled'
+        socketIO = SocketIO(
+            self.server.host, self.server.port, transports=['websocket'],
+            stats=Stats())
+        self.assertIsNone(socketIO._stats)
+        self.assertIsNone(socketIO._transport_instance._stats)
+        socketIO.disconnect()
+
+    def test_prometheus_text(self):
+        'Format counters and summaries with escaped labels'
+        stats = PrometheusStats()
+        stats.count_packet('websocket', 'sent', 4, 10)
+        stats.count_packet('websocket', 'sent', 4, 5)
+        stats.time_handler('say "hi"', 0.5)
+        stats.set_heartbeat_rtt(0.25)
+        self.assertEqual(stats.format_text().splitlines(), [
+            '# HELP socketio_packets_total engine.io packets',
+            '# TYPE socketio_packets_total counter',
+            'socketio_packets_total{transport="websocket",direction="sent",'
+            'packet_type="4"} 2',
+            '# HELP socketio_packet_bytes_total engine.io packet bytes',
+            '# TYPE socketio_packet_bytes_total counter',
+            'socketio_packet_bytes_total{transport="websocket",'
+            'direction="sent",packet_type="4"} 15',
+            '# HELP socketio_handler_seconds seconds in event handlers',
+            '# TYPE socketio_handler_seconds summary',
+            'socketio_handler_seconds_count{event="say \\"hi\\""} 1',
+            'socketio_handler_seconds_sum{event="say \\"hi\\""} 0.5',
+            '# HELP socketio_reconnect_attempts_total reconnect attempts',
+            '# TYPE socketio_reconnect_attempts_total counter',
+            'socketio_reconnect_attempts_total 0',
+            '# HELP socketio_reconnects_total successful reconnects',
+            '# TYPE socketio_reconnects_total counter',
+            'socketio_reconnects_total 0',
+            '# HELP socketio_heartbeat_rtt_seconds latest ping round trip',
+            '# TYPE socketio_heartbeat_rtt_seconds gauge',
+            'socketio_heartbeat_rtt_seconds 0.25',
+        ])
+
+    def check_round_trip(self, transports, transport_name):
+        stats = PrometheusStats()
+        socketIO = SocketIO(
+            self.server.host, self.server.port, transports=transports,
+            stats=stats)
+        socketIO._wait_for_upgrade()
+        payloads = []
+        socketIO.on('emit_with_payload_response', payloads.append)
+        for x in range(3):
+            socketIO.emit('emit_with_payload', PAYLOAD)
+        end_time = time.time() + 5
+        while len(payloads) < 3 and time.time() < end_time:
+            socketIO.wait(0.1)
+        socketIO.disconnect()
+        self.assertEqual(payloads, [PAYLOAD] * 3)
+        self.assertGreaterEqual(
+            stats.packet_count_by_key[transport_name, 'sent', 4], 3)
+        self.assertGreaterEqual(
+            stats.packet_count_by_key[transport_name, 'received', 4], 3)
+        self.assertGreater(
+            stats.packet_byte_count_by_key[transport_name, 'sent', 4], 0)
+        self.assertGreater(stats.transport_timing_by_key[
+            transport_name, 'send_packet'].count, 0)
+        self.assertGreater(stats.transport_timing_by_key[
+            transport_name, 'recv_packet'].count, 0)
+        self.assertGreaterEqual(stats.message_count_by_direction['sent'], 3)
+        self.assertGreaterEqual(
+            stats.message_count_by_direction['received'], 3)
+        self.assertEqual(stats.handler_timing_by_event[
+            'emit_with_payload_response'].count, 3)
+        self.assertIn(
+            'socketio_handler_seconds_count{'
+            'event="emit_with_payload_response"} 3', stats.format_text())
+
+
+class Test_Logging(TestCase):
+
+    def setUp(self):
+        self.level = L.level
+        self.records = []
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        L.addHandler(self.handler)
+        self.namespace = LoggingNamespace(BenchmarkSocketIO(), '')
+
+    def tearDown(self):
+        L.removeHandler(self.handler)
+        L.setLevel(self.level)
+
+    def test_skip_disabled_levels(self):
+        'Format nothing for levels that are disabled'
+        L.setLevel(logging.WARNING)
+        value = FormattingCounter()
+        self.namespace.on_event('aaa', value)
+        self.namespace._debug('[socket.io packet sent] %s', value)
+        self.assertEqual(value.format_count, 0)
+        self.assertEqual(self.records, [])
+        L.setLevel(logging.DEBUG)
+        self.namespace.on_event('aaa', value)
+        self.assertEqual(self.records[0].getMessage(), (
+            'benchmark [socket.io event] aaa(value)'))
+        self.assertEqual(value.format_count, 1)
+
+    def test_truncate(self):
+        'Log at most log_body_size characters of each argument'
+        L.setLevel(logging.DEBUG)
+        self.namespace._debug('%s %s', 'x' * 2000, 2000)
+        self.assertEqual(self.records[0].getMessage(), (
+            'benchmark ' + 'x' * 1000 + '... (2000 characters) 2000'))
+        self.namespace._log_body_size = None
+        self.namespace._debug('%s', 'x' * 2000)
+        self.assertEqual(
+            self.records[1].getMessage(), 'benchmark ' + 'x' * 2000)
+
+    def test_benchmark(self):
+        'Compare disabled logging against the 0.7 logging'
+        results = run_logs(payload_sizes=(100,), call_count=10)
+        self.assertEqual(results[0]['payload_size'], 100)
+        self.assertGreater(results[0]['new_debug_ns'], 0)
+
+
+class FormattingCounter(object):
+
+    def __init__(self):
+        self.format_count = 0
+
+    def __repr__(self):
+        self.format_count += 1
+        return 'value'
+
+
+class Test_SendWindow(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(ping_timeout_in_seconds=1).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.drain_count = 0
+        self.window = SendWindow(
+            high_water_mark=1000, low_water_mark=100, on_drain=self.on_drain)
+        self.socketIO = SocketIO(
+            self.server.host, self.server.port, transports=['websocket'],
+            send_window=self.window)
+        self.payloads = []
+        self.socketIO.on('emit_with_payload_response', self.payloads.append)
+
+    def tearDown(self):
+        self.socketIO.disconnect()
+
+    def test_emit_nowait(self):
+        'Return False when full and call on_drain once it empties'
+        payload = {'xxx': 'x' * 600}
+        transport = self.socketIO._transport_instance
+        # Hold the writer so that packets stay queued
+        with transport._send_lock:
+            for x in range(2):
+                self.assertTrue(self.socketIO.emit_nowait(
+                    'emit_with_payload', payload))
+            self.assertTrue(self.window.is_full)
+            self.assertFalse(self.socketIO.emit_nowait(
+                'emit_with_payload', payload))
+            self.assertGreaterEqual(self.window.queued_byte_count, 1200)
+            self.assertEqual(self.drain_count, 0)
+        self.wait_for_payloads(2)
+        self.assertEqual(self.payloads, [payload] * 2)
+        self.assertEqual(self.window.queued_byte_count, 0)
+        self.assertEqual(self.drain_count, 1)
+
+    def test_emit_when_full(self):
+        'Wait up to the ping timeout for room and keep the connection'
+        payload = {'xxx': 'x' * 1000}
+        transport = self.socketIO._transport_instance
+        with transport._send_lock:
+            self.socketIO.emit('emit_with_payload', payload)
+            with self.assertRaises(SendWindowFullError):
+                self.socketIO.emit('emit_with_payload', payload)
+        self.wait_for_payloads(1)
+        self.assertEqual(self.payloads, [payload])
+        self.assertIs(self.socketIO._transport_instance, transport)
+        self.assertTrue(issubclass(SendWindowFullError, TimeoutError))
+
+    def test_order(self):
+        'Send queued packets in order'
+        for x in range(100):
+            self.socketIO.emit('emit_with_payload', x)
+        self.wait_for_payloads(100)
+        self.assertEqual(self.payloads, list(range(100)))
+
+    def test_without_window(self):
+        'Send before returning True when there is no send window'
+        socketIO = SocketIO(
+            self.server.host, self.server.port, transports=['xhr-polling'])
+        self.assertTrue(socketIO.emit_nowait('emit_with_payload', PAYLOAD))
+        socketIO.disconnect()
+
+    def test_water_marks(self):
+        'Reject a low water mark above the high water mark'
+        with self.assertRaises(ValueError):
+            SendWindow(high_water_mark=10, low_water_mark=20)
+
+    def wait_for_payloads(self, count):
+        end_time = time.time() + 5
+        while len(self.payloads) < count and time.time() < end_time:
+            self.socketIO.wait(0.1)
+
+    def on_drain(self):
+        self.drain_count += 1
+
+
+class Test_Streams(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.socketIO = SocketIO(self.server.host, self.server.port)
+        self.reader = self.socketIO.iter_stream('emit_stream_response')
+
+    def tearDown(self):
+        self.socketIO.disconnect()
+
+    def test_emit_stream(self):
+        'Send chunks in order and read them back'
+        chunks = [bytes(bytearray([x]) * 1000) for x in range(20)]
+        byte_count = self.socketIO.emit_stream('emit_stream', iter(chunks))
+        self.assertEqual(byte_count, 20000)
+        self.assertEqual(list(self.reader), chunks)
+        self.assertEqual(self.reader.byte_count, 20000)
+
+    def test_file(self):
+        'Read files chunk_size bytes at a time'
+        data = b'x' * 2500
+        self.socketIO.emit_stream(
+            'emit_stream', BytesIO(data), chunk_size=1000)
+        self.assertEqual([len(x) for x in self.reader], [1000, 1000, 500])
+
+    def test_window(self):
+        'Keep at most window_size chunks waiting for acks'
+        socketIO = SocketIO(
+            self.server.host, self.server.port, ack_registry=AckRegistry(
+                max_size=2, block_timeout_in_seconds=0))
+        socketIO.emit_stream(
+            'emit_stream', [b'x'] * 10, window_size=2)
+        socketIO.disconnect()
+
+    def test_abort(self):
+        'Tell the reader when the sender fails'
+        def yield_chunks():
+            yield b'x'
+            raise ValueError('disk failed')
+        with self.assertRaises(ValueError):
+            self.socketIO.emit_stream('emit_stream', yield_chunks())
+        self.assertEqual(next(self.reader), b'x')
+        with self.assertRaises(PacketError):
+            next(self.reader)
+
+    def test_ack_on_read(self):
+        'Acknowledge a chunk only when the loop takes it'
+        acks = []
+        self.reader.receive(
+            {'stream_id': 'a', 'index': 0}, b'x', lambda: acks.append(0))
+        self.assertEqual(acks, [])
+        self.assertEqual(next(self.reader), b'x')
+        self.assertEqual(acks, [0])
+
+    def test_out_of_order(self):
+        'Reject chunks that skip an index'
+        self.reader.receive({'stream_id': 'a', 'index': 1}, b'x')
+        with self.assertRaises(PacketError):
+            next(self.reader)
+
+    def test_timeout(self):
+        'Give up when no chunk arrives'
+        reader = self.socketIO.iter_stream(
+            'emit_stream_response', timeout_in_seconds=0.1)
+        with self.assertRaises(TimeoutError):
+            next(reader)
@@ -78,6 +78,17 @@ io.on('connection', function(socket) {
       socket.emit('server_received_callback', payload);
     });
   });
+  socket.on('emit_stream', function(header, chunk, fn) {
+    if (typeof chunk === 'function') {
+      fn = chunk;
+      socket.emit('emit_stream_response', header);
+    } else {
+      socket.emit('emit_stream_response', header, chunk);
+    }
+    if (fn) {
+      fn();
+    }
+  });
   socket.on('aaa', function() {
     socket.emit('aaa_response', PAYLOAD);
   });
@@ -1,15 +1,23 @@
 import requests
+import select
 import six
+import socket
 import ssl
+import struct
 import threading
 import time
+import weakref
+import zlib
+from collections import deque
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, HTTPAdapter
 from six.moves.urllib.parse import urlencode as format_query
 from six.moves.urllib.parse import urlparse as parse_url
 from socket import error as SocketError
+from timeit import default_timer
 try:
     from websocket import (
-        WebSocketConnectionClosedException, WebSocketTimeoutException,
-        create_connection)
+        ABNF, WebSocketConnectionClosedException,
+        WebSocketTimeoutException, create_connection)
 except ImportError:
     exit("""\
 An incompatible websocket library is conflicting with the one we need.
@@ -21,22 +29,36 @@ pip install -U websocket-client""")
 
 from .exceptions import ConnectionError, TimeoutError
 from .parsers import (
-    encode_engineIO_content, decode_engineIO_content,
-    format_packet_text, parse_packet_text)
-from .symmetries import SSLError, memoryview
+    encode_engineIO_content, encode_engineIO_packet_data,
+    decode_engineIO_content, format_packet_text, is_binary,
+    parse_packet_text)
+from .stats import get_stats
+from .symmetries import SSLError, get_byte, memoryview
 
 
 ENGINEIO_PROTOCOL = 3
 TRANSPORTS = 'xhr-polling', 'websocket'
+MAX_BATCH_PACKETS = 100
+MAX_BATCH_BYTES = 1000000
+RECV_SIZE = 65536
+# Match the engine.io default pingTimeout before a session sets its own
+CONNECT_TIMEOUT_IN_SECONDS = 5
 
 
 class AbstractTransport(object):
 
-    def __init__(self, http_session, is_secure, url, engineIO_session=None):
+    # Subclasses without __slots__ get a __dict__ for their own attributes
+    __slots__ = (
+        'http_session', 'is_secure', 'url', 'engineIO_session', '_stats')
+    name = None
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None, **kw):
         self.http_session = http_session
         self.is_secure = is_secure
         self.url = url
         self.engineIO_session = engineIO_session
+        self._stats = get_stats(kw)
 
     def recv_packet(self):
         pass
@@ -44,15 +66,50 @@ class AbstractTransport(object):
     def send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
         pass
 
+    def send_packets(self, engineIO_packets):
+        'Send packets in order without interleaving packets from other threads'
+        for engineIO_packet_type, engineIO_packet_data in engineIO_packets:
+            self.send_packet(engineIO_packet_type, engineIO_packet_data)
+
+    def send_packets_nowait(self, engineIO_packets):
+        'Queue packets or return False if the send window is full'
+        # Transports without a send window send before returning
+        self.send_packets(engineIO_packets)
+        return True
+
     def set_timeout(self, seconds=None):
         pass
 
+    def drain(self, seconds=None):
+        'Wait until queued packets go out and return False on timeout'
+        return True
+
+    def close(self):
+        'Make pending and future reads and writes raise ConnectionError'
+        pass
+
 
 class XHR_PollingTransport(AbstractTransport):
+    """Poll for packets with GET and send packets with POST.
 
-    def __init__(self, http_session, is_secure, url, engineIO_session=None):
+    Packets queued while a POST is in flight are coalesced into the next
+    POST, up to max_batch_packets packets or max_batch_bytes bytes.
+    Count requests that opened a new connection in fresh_connection_count
+    and requests that used a pooled keep-alive connection in
+    reused_connection_count."""
+
+    __slots__ = (
+        '_params', '_request_index', '_kw_get', '_kw_post', '_http_url',
+        '_request_index_lock', '_max_batch_packets', '_max_batch_bytes',
+        '_compression_stats', '_send_queue', '_send_condition',
+        '_is_sending', '_is_receiving', '_is_paused', '_next_transport',
+        'fresh_connection_count', 'reused_connection_count', '_is_closed')
+    name = 'xhr-polling'
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None, **kw):
         super(XHR_PollingTransport, self).__init__(
-            http_session, is_secure, url, engineIO_session)
+            http_session, is_secure, url, engineIO_session, **kw)
         self._params = {
             'EIO': ENGINEIO_PROTOCOL, 'transport': 'polling'}
         if engineIO_session:
@@ -70,33 +127,211 @@ class XHR_PollingTransport(AbstractTransport):
         http_scheme = 'https' if is_secure else 'http'
         self._http_url = '%s://%s/' % (http_scheme, url)
         self._request_index_lock = threading.Lock()
-        self._send_packet_lock = threading.Lock()
+        self._max_batch_packets = kw.get(
+            'max_batch_packets', MAX_BATCH_PACKETS)
+        self._max_batch_bytes = kw.get('max_batch_bytes', MAX_BATCH_BYTES)
+        self._compression_stats = kw.get('compression_stats')
+        self._send_queue = deque()
+        self._send_condition = threading.Condition()
+        self._is_sending = False
+        self._is_receiving = False
+        self._is_paused = False
+        self._next_transport = None
+        self.fresh_connection_count = 0
+        self.reused_connection_count = 0
+        self._is_closed = False
 
     def recv_packet(self):
-        params = dict(self._params)
-        params['t'] = self._get_timestamp()
-        response = get_response(
-            self.http_session.get,
-            self._http_url,
-            params=params,
-            **self._kw_get)
-        for engineIO_packet in decode_engineIO_content(response.content):
-            engineIO_packet_type, engineIO_packet_data = engineIO_packet
+        with self._send_condition:
+            while self._is_paused and not self._is_closed:
+                self._send_condition.wait()
+            if self._is_closed:
+                raise ConnectionError('transport closed')
+            next_transport = self._next_transport
+            if not next_transport:
+                self._is_receiving = True
+        if next_transport:
+            # The client upgraded while we waited
+            for engineIO_packet in next_transport.recv_packet():
+                yield engineIO_packet
+            return
+        stats = self._stats
+        start_time = default_timer()
+        try:
+            params = dict(self._params)
+            params['t'] = self._get_timestamp()
+            response = get_response(
+                self.http_session.get,
+                self._http_url,
+                params=params,
+                **self._kw_get)
+        finally:
+            with self._send_condition:
+                self._is_receiving = False
+                self._send_condition.notify_all()
+        if stats:
+            stats.time_transport(
+                self.name, 'recv_packet', default_timer() - start_time)
+        self._count_connection(response)
+        self._count_compression(response)
+        # Handlers keep and parse bytes, so slice a copy of each packet
+        for engineIO_packet_type, engineIO_packet_data in (
+                decode_engineIO_content(response.content)):
+            if stats:
+                stats.count_packet(
+                    self.name, 'received', engineIO_packet_type,
+                    len(engineIO_packet_data) + 1)
             yield engineIO_packet_type, engineIO_packet_data
 
     def send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
-        with self._send_packet_lock:
+        self.send_packets([(engineIO_packet_type, engineIO_packet_data)])
+
+    def send_packets(self, engineIO_packets):
+        if self._is_closed:
+            raise ConnectionError('transport closed')
+        engineIO_packets = list(engineIO_packets)
+        packets = [_QueuedPacket(
+            engineIO_packet_type,
+            encode_engineIO_packet_data(engineIO_packet_data),
+        ) for engineIO_packet_type, engineIO_packet_data in engineIO_packets]
+        # Wait for the last packet because batches go out in order
+        packet = packets[-1]
+        with self._send_condition:
+            next_transport = self._next_transport
+            if not next_transport:
+                self._send_queue.extend(packets)
+                while not packet.is_sent and (self._is_sending or (
+                        self._is_paused and not self._is_closed)):
+                    self._send_condition.wait()
+                if packet.is_sent:
+                    is_sender = False
+                else:
+                    is_sender = self._is_sending = True
+        if next_transport:
+            return next_transport.send_packets(engineIO_packets)
+        # Post batches until our packet is sent, then hand off to a waiter
+        try:
+            while not packet.is_sent:
+                self._send_batch()
+        finally:
+            if is_sender:
+                with self._send_condition:
+                    self._is_sending = False
+                    self._send_condition.notify_all()
+        for packet in packets:
+            if packet.error:
+                raise packet.error
+
+    def close(self):
+        with self._send_condition:
+            self._is_closed = True
+            self._send_condition.notify_all()
+
+    def pause(self, seconds=None):
+        'Hold new requests and return True once none are in flight'
+        end_time = None if seconds is None else time.time() + seconds
+        with self._send_condition:
+            self._is_paused = True
+            while self._is_sending or self._is_receiving:
+                if end_time is None:
+                    self._send_condition.wait()
+                    continue
+                remaining_time = end_time - time.time()
+                if remaining_time <= 0:
+                    return False
+                self._send_condition.wait(remaining_time)
+        return True
+
+    def resume(self):
+        with self._send_condition:
+            self._is_paused = False
+            self._send_condition.notify_all()
+
+    def hand_over(self, transport):
+        'Send held packets in order over transport and forward the rest'
+        with self._send_condition:
+            packets = list(self._send_queue)
+            self._send_queue.clear()
+            self._next_transport = transport
+            error = None
+            try:
+                if packets:
+                    transport.send_packets([(
+                        x.packet_type, x.packet_data) for x in packets])
+            except Exception as e:
+                error = e
+            for packet in packets:
+                packet.is_sent = True
+                packet.error = error
+            self._is_paused = False
+            self._send_condition.notify_all()
+
+    def _send_batch(self):
+        with self._send_condition:
+            batch = self._pop_batch()
+        error = None
+        start_time = default_timer()
+        try:
             params = dict(self._params)
             params['t'] = self._get_timestamp()
-            data = encode_engineIO_content([
-                (engineIO_packet_type, engineIO_packet_data),
-            ])
-            get_response(
+            data = encode_engineIO_content(
+                (x.packet_type, x.packet_data) for x in batch)
+            response = get_response(
                 self.http_session.post,
                 self._http_url,
                 params=params,
                 data=memoryview(data),
                 **self._kw_post)
+            self._count_connection(response)
+        except Exception as e:
+            error = e
+        else:
+            self._count_batch(batch, default_timer() - start_time)
+        with self._send_condition:
+            for packet in batch:
+                packet.is_sent = True
+                packet.error = error
+            self._send_condition.notify_all()
+
+    def _pop_batch(self):
+        batch = [self._send_queue.popleft()]
+        batch_size = len(batch[0].packet_data)
+        while self._send_queue and (
+                not self._max_batch_packets or
+                len(batch) < self._max_batch_packets):
+            packet_size = len(self._send_queue[0].packet_data)
+            if self._max_batch_bytes and (
+                    batch_size + packet_size > self._max_batch_bytes):
+                break
+            batch.append(self._send_queue.popleft())
+            batch_size += packet_size
+        return batch
+
+    def _count_batch(self, batch, seconds):
+        stats = self._stats
+        if not stats:
+            return
+        stats.time_transport(self.name, 'send_packet', seconds)
+        for packet in batch:
+            stats.count_packet(
+                self.name, 'sent', packet.packet_type,
+                len(packet.packet_data) + 1)
+
+    def _count_connection(self, response):
+        is_reused = getattr(response, 'is_connection_reused', None)
+        with self._request_index_lock:
+            if is_reused:
+                self.reused_connection_count += 1
+            elif is_reused is not None:
+                self.fresh_connection_count += 1
+
+    def _count_compression(self, response):
+        # Requests asks for gzip and deflate and decodes them transparently
+        stats = self._compression_stats
+        if not stats or response.headers.get(
+                'content-encoding') not in ('gzip', 'deflate'):
+            return
+        stats.add(len(response.content), response.raw.tell())
 
     def _get_timestamp(self):
         with self._request_index_lock:
@@ -108,16 +343,36 @@ class XHR_PollingTransport(AbstractTransport):
 
 class WebsocketTransport(AbstractTransport):
 
-    def __init__(self, http_session, is_secure, url, engineIO_session=None):
+    __slots__ = (
+        '_connection', '_deflate', '_frame_reader', '_timeout', '_send_lock',
+        '_send_window',
+        '_send_queue', '_send_condition', '_send_error', '_is_writing',
+        '_is_closed')
+    name = 'websocket'
+
+    def __init__(
+            self, http_session, is_secure, url, engineIO_session=None, **kw):
         super(WebsocketTransport, self).__init__(
-            http_session, is_secure, url, engineIO_session)
+            http_session, is_secure, url, engineIO_session, **kw)
         params = dict(http_session.params, **{
             'EIO': ENGINEIO_PROTOCOL, 'transport': 'websocket'})
         request = http_session.prepare_request(requests.Request('GET', url))
+        compression = kw.get('compression')
+        compression_stats = kw.get('compression_stats')
+        send_window = kw.get('send_window')
         kw = {'header': ['%s: %s' % x for x in request.headers.items()]}
+        if compression:
+            kw['header'].append(
+                'Sec-WebSocket-Extensions: ' + compression.get_offer())
+        self._deflate = None
         if engineIO_session:
             params['sid'] = engineIO_session.id
-            kw['timeout'] = self._timeout = engineIO_session.ping_timeout
+            self._timeout = engineIO_session.ping_timeout
+        else:
+            # Give up on a direct handshake that stalls so that we can fall
+            # back to polling
+            self._timeout = CONNECT_TIMEOUT_IN_SECONDS
+        kw['timeout'] = self._timeout
         ws_url = '%s://%s/?%s' % (
             'wss' if is_secure else 'ws', url, format_query(params))
         http_scheme = 'https' if is_secure else 'http'
@@ -140,40 +395,373 @@ class WebsocketTransport(AbstractTransport):
             self._connection = create_connection(ws_url, **kw)
         except Exception as e:
             raise ConnectionError(e)
+        if compression:
+            try:
+                self._deflate = compression.accept(
+                    self._connection.getheaders().get(
+                        'sec-websocket-extensions'), compression_stats)
+            except ConnectionError:
+                self._connection.abort()
+                raise
+        self._frame_reader = _FrameReader(self._connection, self._deflate)
+        self._send_lock = threading.Lock()
+        self._send_window = send_window
+        if send_window:
+            self._send_queue = deque()
+            self._send_condition = threading.Condition()
+            self._send_error = None
+            self._is_writing = False
+            self._is_closed = False
+            thread = threading.Thread(target=self._write_packets)
+            thread.daemon = True
+            thread.start()
 
-    def recv_packet(self):
-        try:
-            packet_text = self._connection.recv()
-        except WebSocketTimeoutException as e:
-            raise TimeoutError('recv timed out (%s)' % e)
-        except SSLError as e:
-            raise ConnectionError('recv disconnected by SSL (%s)' % e)
-        except WebSocketConnectionClosedException as e:
-            raise ConnectionError('recv disconnected (%s)' % e)
-        except SocketError as e:
-            raise ConnectionError('recv disconnected (%s)' % e)
-        if not isinstance(packet_text, six.binary_type):
-            packet_text = packet_text.encode('utf-8')
-        engineIO_packet_type, engineIO_packet_data = parse_packet_text(
-            packet_text)
+    def recv_packet(self, block=True):
+        'Raise TimeoutError without block if no whole message has arrived'
+        stats = self._stats
+        start_time = default_timer()
+        opcode, packet_text = self._frame_reader.recv_message(block)
+        if opcode == ABNF.OPCODE_BINARY:
+            engineIO_packet_type = get_byte(packet_text, 0)
+            engineIO_packet_data = packet_text[1:]
+        else:
+            if not isinstance(packet_text, six.binary_type):
+                packet_text = packet_text.encode('utf-8')
+            engineIO_packet_type, engineIO_packet_data = parse_packet_text(
+                packet_text)
+        if stats:
+            stats.time_transport(
+                self.name, 'recv_packet', default_timer() - start_time)
+            stats.count_packet(
+                self.name, 'received', engineIO_packet_type, len(packet_text))
         yield engineIO_packet_type, engineIO_packet_data
 
     def send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
+        if self._send_window:
+            self._queue_packets([(engineIO_packet_type, engineIO_packet_data)])
+            return
+        with self._send_lock:
+            self._send_packet(engineIO_packet_type, engineIO_packet_data)
+
+    def send_packets(self, engineIO_packets):
+        if self._send_window:
+            self._queue_packets(engineIO_packets)
+            return
+        with self._send_lock:
+            for engineIO_packet_type, engineIO_packet_data in engineIO_packets:
+                self._send_packet(engineIO_packet_type, engineIO_packet_data)
+
+    def send_packets_nowait(self, engineIO_packets):
+        if not self._send_window:
+            return super(WebsocketTransport, self).send_packets_nowait(
+                engineIO_packets)
+        return self._queue_packets(engineIO_packets, block=False)
+
+    def _queue_packets(self, engineIO_packets, block=True):
+        engineIO_packets = list(engineIO_packets)
+        byte_count = sum(len(
+            engineIO_packet_data) + 1 for _, engineIO_packet_data in (
+            engineIO_packets))
+        window = self._send_window
+        if any(x[0] == 4 for x in engineIO_packets):
+            if not window.reserve(byte_count, block, self._timeout):
+                return False
+        else:
+            # Let pings and pongs through so that heartbeats never wait
+            window.add(byte_count)
+        with self._send_condition:
+            error = self._send_error
+            if not error:
+                self._send_queue.append((engineIO_packets, byte_count))
+                self._send_condition.notify_all()
+        if error:
+            window.release(byte_count)
+            raise error
+        return True
+
+    def _write_packets(self):
+        'Send queued packets in order until the transport closes'
+        window = self._send_window
+        while True:
+            with self._send_condition:
+                while not self._send_queue and not self._is_closed:
+                    self._send_condition.wait()
+                if self._is_closed:
+                    return
+                engineIO_packets, byte_count = self._send_queue.popleft()
+                self._is_writing = True
+            try:
+                with self._send_lock:
+                    for engineIO_packet_type, engineIO_packet_data in (
+                            engineIO_packets):
+                        self._send_packet(
+                            engineIO_packet_type, engineIO_packet_data)
+            except (TimeoutError, ConnectionError) as e:
+                window.release(byte_count)
+                self._stop_writing(ConnectionError(
+                    'send window dropped (%s)' % e))
+                # Wake up the reader, which then reconnects
+                self._connection.abort()
+                return
+            window.release(byte_count)
+            with self._send_condition:
+                self._is_writing = False
+                self._send_condition.notify_all()
+
+    def drain(self, seconds=None):
+        if not self._send_window:
+            return True
+        end_time = None if seconds is None else time.time() + seconds
+        with self._send_condition:
+            while (self._send_queue or self._is_writing) and (
+                    not self._is_closed):
+                if end_time is None:
+                    self._send_condition.wait()
+                    continue
+                remaining_time = end_time - time.time()
+                if remaining_time <= 0:
+                    return False
+                self._send_condition.wait(remaining_time)
+        return True
+
+    def _stop_writing(self, error):
+        with self._send_condition:
+            self._send_error = error
+            self._is_writing = False
+            self._is_closed = True
+            byte_count = sum(x[1] for x in self._send_queue)
+            self._send_queue.clear()
+            self._send_condition.notify_all()
+        if byte_count:
+            self._send_window.release(byte_count)
+
+    def _send_packet(self, engineIO_packet_type, engineIO_packet_data=''):
         packet = format_packet_text(engineIO_packet_type, engineIO_packet_data)
+        opcode = ABNF.OPCODE_BINARY if is_binary(
+            engineIO_packet_data) else ABNF.OPCODE_TEXT
+        deflate = self._deflate
+        stats = self._stats
+        start_time = default_timer()
         try:
-            self._connection.send(packet)
+            if deflate and len(packet) >= deflate.min_size:
+                frame = ABNF.create_frame(deflate.compress(packet), opcode)
+                frame.rsv1 = 1
+                self._connection.send_frame(frame)
+            else:
+                self._connection.send(packet, opcode)
         except WebSocketTimeoutException as e:
             raise TimeoutError('send timed out (%s)' % e)
         except (SocketError, WebSocketConnectionClosedException) as e:
             raise ConnectionError('send disconnected (%s)' % e)
+        if stats:
+            stats.time_transport(
+                self.name, 'send_packet', default_timer() - start_time)
+            stats.count_packet(
+                self.name, 'sent', engineIO_packet_type, len(packet))
 
     def set_timeout(self, seconds=None):
         self._connection.settimeout(seconds or self._timeout)
 
+    def set_engineIO_session(self, engineIO_session):
+        'Adopt the session that the server opened on this websocket'
+        self.engineIO_session = engineIO_session
+        self._timeout = engineIO_session.ping_timeout
+        self._connection.settimeout(self._timeout)
+
+    def close(self):
+        if self._send_window:
+            self._stop_writing(ConnectionError('transport closed'))
+        # Shut down the socket to wake up threads blocked in recv
+        self._connection.abort()
+
+    def fileno(self):
+        return self._connection.fileno()
+
+
+class _FrameReader(object):
+    """Read the messages of a websocket that websocket-client opened.
+
+    - Inflate messages that the server compressed with permessage-deflate
+      and check that text messages are UTF-8 afterwards.
+    - Answer pings and raise ConnectionError when the server closes.
+    """
+
+    __slots__ = (
+        '_connection', '_deflate', '_buffer', '_opcode', '_fragments',
+        '_is_compressed')
+
+    def __init__(self, connection, deflate=None):
+        self._connection = connection
+        self._deflate = deflate
+        self._buffer = bytearray()
+        self._opcode = None
+        self._fragments = []
+        self._is_compressed = False
+
+    def recv_message(self, block=True):
+        """Return the opcode and data of the next text or binary message.
+
+        Without block, read only bytes that have already arrived and raise
+        TimeoutError instead of waiting for the rest of a message."""
+        while True:
+            frame = self._pop_frame()
+            if frame is None:
+                if not block and not self._is_readable():
+                    raise TimeoutError('recv has no whole message')
+                self._read()
+                continue
+            message = self._receive_frame(*frame)
+            if message:
+                return message
+
+    def _is_readable(self):
+        sock = self._connection.sock
+        # Count bytes that SSL decrypted but select() cannot see
+        pending = getattr(sock, 'pending', None)
+        if pending and pending():
+            return True
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (SocketError, ValueError, TypeError) as e:
+            raise ConnectionError('recv disconnected (%s)' % e)
+
+    def _read(self):
+        try:
+            data = self._connection.sock.recv(RECV_SIZE)
+        except socket.timeout as e:
+            raise TimeoutError('recv timed out (%s)' % e)
+        except SSLError as e:
+            if 'timed out' in str(e):
+                raise TimeoutError('recv timed out (%s)' % e)
+            raise ConnectionError('recv disconnected by SSL (%s)' % e)
+        except (SocketError, AttributeError) as e:
+            raise ConnectionError('recv disconnected (%s)' % e)
+        if not data:
+            raise ConnectionError('recv disconnected (connection closed)')
+        self._buffer.extend(data)
+
+    def _pop_frame(self):
+        'Return a whole frame from the buffer or None to read more'
+        buffer = self._buffer
+        if len(buffer) < 2:
+            return
+        first_byte, second_byte = buffer[0], buffer[1]
+        if first_byte & 0x30 or second_byte & 0x80:
+            raise ConnectionError('unexpected websocket frame header')
+        length, offset = second_byte & 0x7f, 2
+        if length == 126:
+            offset = 4
+            if len(buffer) < offset:
+                return
+            length = struct.unpack('!H', bytes(buffer[2:offset]))[0]
+        elif length == 127:
+            offset = 10
+            if len(buffer) < offset:
+                return
+            length = struct.unpack('!Q', bytes(buffer[2:offset]))[0]
+        end = offset + length
+        if len(buffer) < end:
+            return
+        data = bytes(buffer[offset:end])
+        del buffer[:end]
+        return bool(first_byte & 0x80), bool(first_byte & 0x40), (
+            first_byte & 0x0f), data
+
+    def _receive_frame(self, is_final, is_compressed, opcode, data):
+        if is_compressed and (not self._deflate or opcode in (
+                ABNF.OPCODE_CONT, ABNF.OPCODE_CLOSE, ABNF.OPCODE_PING,
+                ABNF.OPCODE_PONG)):
+            raise ConnectionError('unexpected compressed websocket frame')
+        if opcode == ABNF.OPCODE_CLOSE:
+            try:
+                self._connection.send_close()
+            except (SocketError, WebSocketConnectionClosedException):
+                pass
+            raise ConnectionError('recv disconnected (closed by server)')
+        if opcode == ABNF.OPCODE_PING:
+            try:
+                self._connection.pong(data)
+            except (SocketError, WebSocketConnectionClosedException) as e:
+                raise ConnectionError('send disconnected (%s)' % e)
+            return
+        if opcode == ABNF.OPCODE_PONG:
+            return
+        if opcode == ABNF.OPCODE_CONT:
+            if self._opcode is None:
+                raise ConnectionError('unexpected websocket continuation')
+            self._fragments.append(data)
+        else:
+            if self._opcode is not None:
+                raise ConnectionError('unfinished websocket message')
+            self._opcode = opcode
+            self._is_compressed = is_compressed
+            self._fragments = [data]
+        if not is_final:
+            return
+        opcode, data = self._opcode, b''.join(self._fragments)
+        self._opcode, self._fragments = None, []
+        if self._is_compressed:
+            try:
+                data = self._deflate.decompress(data)
+            except zlib.error as e:
+                raise ConnectionError('could not inflate message (%s)' % e)
+        if opcode == ABNF.OPCODE_TEXT:
+            try:
+                data.decode('utf-8')
+            except UnicodeDecodeError:
+                raise ConnectionError('invalid utf-8 in text message')
+        return opcode, data
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """Keep connections alive in a pool and mark reused connections.
+
+    Pass one adapter as http_adapter to several clients to share its pool.
+    Set response.is_connection_reused on each response."""
+
+    def __init__(
+            self, pool_connections=DEFAULT_POOLSIZE,
+            pool_maxsize=DEFAULT_POOLSIZE, pool_block=DEFAULT_POOLBLOCK,
+            **kw):
+        super(PooledHTTPAdapter, self).__init__(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            pool_block=pool_block, **kw)
+        self._sockets = weakref.WeakSet()
+        self._sockets_lock = threading.Lock()
+
+    def build_response(self, request, urllib3_response):
+        response = super(PooledHTTPAdapter, self).build_response(
+            request, urllib3_response)
+        connection = getattr(urllib3_response, '_connection', None)
+        socket = getattr(connection, 'sock', None)
+        if socket is not None:
+            # A socket we have seen before carried an earlier request
+            with self._sockets_lock:
+                response.is_connection_reused = socket in self._sockets
+                self._sockets.add(socket)
+        return response
+
+    def __setstate__(self, state):
+        super(PooledHTTPAdapter, self).__setstate__(state)
+        self._sockets = weakref.WeakSet()
+        self._sockets_lock = threading.Lock()
+
+
+class _QueuedPacket(object):
+
+    __slots__ = 'packet_type', 'packet_data', 'is_sent', 'error'
+
+    def __init__(self, packet_type, packet_data):
+        self.packet_type = packet_type
+        self.packet_data = packet_data
+        self.is_sent = False
+        self.error = None
+
 
 def get_response(request, *args, **kw):
     try:
-        response = request(*args, stream=True, **kw)
+        # Read the body right away so the connection goes back to the pool
+        response = request(*args, **kw)
     except requests.exceptions.Timeout as e:
         raise TimeoutError(e)
     except requests.exceptions.ConnectionError as e:
@@ -189,6 +777,12 @@ def get_response(request, *args, **kw):
 
 def prepare_http_session(kw):
     http_session = requests.Session()
+    http_adapter = kw.get('http_adapter') or PooledHTTPAdapter(
+        pool_connections=kw.get('pool_connections', DEFAULT_POOLSIZE),
+        pool_maxsize=kw.get('pool_maxsize', DEFAULT_POOLSIZE),
+        pool_block=kw.get('pool_block', DEFAULT_POOLBLOCK))
+    http_session.mount('http://', http_adapter)
+    http_session.mount('https://', http_adapter)
     http_session.headers.update(kw.get('headers', {}))
     http_session.auth = kw.get('auth')
     http_session.proxies.update(kw.get('proxies', {}))
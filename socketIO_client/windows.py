@@ -0,0 +1,87 @@
+import time
+from invisibleroads_macros.log import get_log
+from threading import Condition
+
+from .exceptions import SendWindowFullError
+
+
+L = get_log(__name__)
+
+
+class SendWindow(object):
+    """Bound the bytes that wait to go out on a websocket.
+
+    - A writer thread sends queued packets so that emit returns as soon
+      as its packet is queued. Errors in the writer drop the connection,
+      which then reconnects as usual.
+    - Once high_water_mark bytes are queued, emit waits for room up to
+      the ping timeout and then raises SendWindowFullError, a
+      TimeoutError that keeps the connection, while emit_nowait returns
+      False right away.
+    - After the window fills, on_drain gets called once the queue falls
+      to low_water_mark bytes, so that producers can resume.
+    - Read queued_byte_count to see how much is outstanding.
+
+    SocketIO('127.0.0.1', 8000, transports=['websocket'],
+        send_window=SendWindow(high_water_mark=1000000, on_drain=resume))
+    """
+
+    def __init__(
+            self, high_water_mark=1048576, low_water_mark=None,
+            on_drain=None):
+        if low_water_mark is None:
+            low_water_mark = high_water_mark // 4
+        if not 0 <= low_water_mark <= high_water_mark:
+            raise ValueError(
+                'low_water_mark must be between 0 and high_water_mark')
+        self.high_water_mark = high_water_mark
+        self.low_water_mark = low_water_mark
+        self.on_drain = on_drain
+        self.queued_byte_count = 0
+        self.is_full = False
+        self._condition = Condition()
+
+    def reserve(self, byte_count, block=True, timeout_in_seconds=None):
+        'Count bytes as queued, waiting for room, or return False if full'
+        end_time = None if timeout_in_seconds is None else (
+            time.time() + timeout_in_seconds)
+        with self._condition:
+            while self.queued_byte_count >= self.high_water_mark:
+                self.is_full = True
+                if not block:
+                    return False
+                if end_time is None:
+                    self._condition.wait()
+                    continue
+                remaining_time = end_time - time.time()
+                if remaining_time <= 0:
+                    raise SendWindowFullError('send window full (%s bytes)' % (
+                        self.queued_byte_count))
+                self._condition.wait(remaining_time)
+            self._add(byte_count)
+        return True
+
+    def add(self, byte_count):
+        'Count bytes as queued without waiting, as for pings and pongs'
+        with self._condition:
+            self._add(byte_count)
+
+    def release(self, byte_count):
+        'Count bytes as sent or dropped and call on_drain if they drained'
+        with self._condition:
+            self.queued_byte_count -= byte_count
+            is_drained = self.is_full and (
+                self.queued_byte_count <= self.low_water_mark)
+            if is_drained:
+                self.is_full = False
+            self._condition.notify_all()
+        if is_drained and self.on_drain:
+            try:
+                self.on_drain()
+            except Exception:
+                L.exception('[drain error]')
+
+    def _add(self, byte_count):
+        self.queued_byte_count += byte_count
+        if self.queued_byte_count >= self.high_water_mark:
+            self.is_full = True